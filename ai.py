@@ -6,6 +6,19 @@ import copy
 import time
 import random
 import urllib.request
+import json
+import mmap
+import struct
+import atexit
+from array import array
+import multiprocessing
+from multiprocessing import shared_memory
+from queue import Empty
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+try:
+    import numpy as np # 只有批量评估 evaluate_batch 用到，没装也不影响对弈
+except ImportError:
+    np = None
 # x深度此程序对y深度皮卡鱼26年1月版胜负情况：(默认深度少的先下)
 # x=3,y=1 和棋
 # x=4,y=2 pika 赢
@@ -25,12 +38,24 @@ import urllib.request
 
 # --- 1. 配置与显示颜色 ---
 USE_PIKAFISH=0  # 全局开关，是否使用皮卡鱼引擎进行评估
+USE_NNUE=0 # 启动时是否加载 NNUE_FILE 用小神经网络评估 (也可以用 nnue <文件>/off 命令在运行时切换)
+NNUE_FILE="nnue_weights.json" # train_nnue.py 训练出来的权重
 USE_DEPTH=0 # 是否使用固定深度搜索 (否则使用迭代加深) （测棋力对打要开）
 LONG_MAX_DEPTH=8  # 非固定深度时的最大搜索深度
 CLOUD_BOOK_ENABLED=1 # 是否启用云开局库查询
 QUERY_SCORE_THRESHOLD=20 # 云开局库查询时的分数筛选阈值 (单位：分)，只考虑分数在最高分QUERY_SCORE_THRESHOLD分以内的走法
 OPEN_NMP=1  # 是否启用空步裁剪 (Null Move Pruning)
+ASPIRATION=1 # 迭代加深是否用渴望窗口 (以上一层的分数为中心的窄窗口，失败了再放宽重搜)
+ASPIRATION_WINDOW=50 # 初始半宽 (分)
+ASPIRATION_WIDEN=2 # 每次失败后半宽乘的倍数
+ASPIRATION_MAX_WINDOW=800 # 半宽超过这个就直接改用全窗口
+ASPIRATION_MIN_DEPTH=3 # 从这一层开始用 (浅层分数还不稳)
 LONG_MAX_TIME=75.0 # 非固定深度时的3步后默认最大思考时间 (秒)，可以根据需要调整
+HASH_MB=16 # 置换表大小 (MB)，运行时可以用 setoption Hash <MB> 改
+TT_FILE="" # 非空时：引擎启动时从这个文件恢复置换表 (存在的话)，quit 时存回去 (长时间分析用)
+SMP_WORKERS=1 # Lazy SMP 并行搜索的进程数 (1 = 原来的单进程搜索；也可以用 setoption Threads N 切换)
+SMP_JOIN_TIMEOUT=10.0 # 关闭时等辅助进程自己退出的秒数，超时才强杀 (强杀的进程关不掉自己的皮卡鱼)
+ROOT_SPLIT_WORKERS=1 # 根节点并行 (进程池分根走法) 的进程数，1 = 不用 (setoption RootSplit N 切换)；实验性，多核加速比先用 bench root 实测
 
 RESET = "\033[0m"
 RED_TXT = "\033[31m"
@@ -45,9 +70,206 @@ COLS = 9
 PIECE_CHARS = {
     'R': '车', 'N': '马', 'B': '相', 'A': '仕', 'K': '帅', 'C': '炮', 'P': '兵',
     'r': '车', 'n': '马', 'b': '象', 'a': '士', 'k': '将', 'c': '炮', 'p': '卒',
-    '.': '．' 
+    '.': '．'
 }
-SCORE_INF = 30000 
+SCORE_INF = 30000
+
+# --- 一维带哨兵棋盘 (Mailbox) ---
+# 10x9 的棋盘四周各垫 2 圈哨兵，马、象最远跳 2 格也不会越界，
+# 所以走法生成里不再需要 in_board() 之类的边界判断。
+BOARD_W = COLS + 4   # 13
+BOARD_H = ROWS + 4   # 14
+BOARD_SIZE = BOARD_W * BOARD_H
+
+# 棋子编码：低 3 位是兵种，第 3/4 位是颜色。哨兵同时带红黑两个颜色位，
+# 这样 "p & own" 为真就表示 "己方棋子或出界"，一次与运算即可判断不能落子。
+EMPTY = 0
+KING, ADVISOR, BISHOP, KNIGHT, ROOK, CANNON, PAWN = 1, 2, 3, 4, 5, 6, 7
+TYPE_MASK = 7
+RED = 8
+BLACK = 16
+COLOR_MASK = RED | BLACK
+OFFBOARD = RED | BLACK
+SIDE_COLOR = (RED, BLACK)  # 下标 0 红 1 黑，与 king_pos / piece_list 一致
+
+TYPE_CHARS = '.kabnrcp'  # 兵种 -> 小写字符
+CHAR_TO_CODE = {'.': EMPTY}
+CODE_TO_CHAR = ['?'] * (OFFBOARD + 1)
+CODE_TO_CHAR[EMPTY] = '.'
+for _t in range(1, 8):
+    CHAR_TO_CODE[TYPE_CHARS[_t].upper()] = RED | _t
+    CHAR_TO_CODE[TYPE_CHARS[_t]] = BLACK | _t
+    CODE_TO_CHAR[RED | _t] = TYPE_CHARS[_t].upper()
+    CODE_TO_CHAR[BLACK | _t] = TYPE_CHARS[_t]
+
+# 坐标换算表
+RC_TO_SQ = [[(r + 2) * BOARD_W + c + 2 for c in range(COLS)] for r in range(ROWS)]
+SQ_ROW = [-1] * BOARD_SIZE
+SQ_COL = [-1] * BOARD_SIZE
+for _r in range(ROWS):
+    for _c in range(COLS):
+        SQ_ROW[RC_TO_SQ[_r][_c]] = _r
+        SQ_COL[RC_TO_SQ[_r][_c]] = _c
+BOARD_SQUARES = [RC_TO_SQ[r][c] for r in range(ROWS) for c in range(COLS)]
+
+# 方向 (UP 指向第 0 行，也就是红方前进方向)
+UP, DOWN, LEFT, RIGHT = -BOARD_W, BOARD_W, -1, 1
+LINE_DIRS = (RIGHT, LEFT, DOWN, UP)
+# 马：(落点偏移, 马腿偏移)
+KNIGHT_DELTAS = (
+    (2 * UP + LEFT, UP), (2 * UP + RIGHT, UP), (2 * DOWN + LEFT, DOWN), (2 * DOWN + RIGHT, DOWN),
+    (UP + 2 * LEFT, LEFT), (DOWN + 2 * LEFT, LEFT), (UP + 2 * RIGHT, RIGHT), (DOWN + 2 * RIGHT, RIGHT),
+)
+# 反向：对老将构成将军的马所在位置偏移，以及对应的马腿 (在老将斜角上)
+KNIGHT_CHECK_DELTAS = (
+    (2 * UP + LEFT, UP + LEFT), (2 * UP + RIGHT, UP + RIGHT),
+    (2 * DOWN + LEFT, DOWN + LEFT), (2 * DOWN + RIGHT, DOWN + RIGHT),
+    (UP + 2 * LEFT, UP + LEFT), (UP + 2 * RIGHT, UP + RIGHT),
+    (DOWN + 2 * LEFT, DOWN + LEFT), (DOWN + 2 * RIGHT, DOWN + RIGHT),
+)
+# 象：(落点偏移, 象眼偏移)
+BISHOP_DELTAS = (
+    (2 * (UP + LEFT), UP + LEFT), (2 * (UP + RIGHT), UP + RIGHT),
+    (2 * (DOWN + LEFT), DOWN + LEFT), (2 * (DOWN + RIGHT), DOWN + RIGHT),
+)
+ADVISOR_DELTAS = (UP + LEFT, UP + RIGHT, DOWN + LEFT, DOWN + RIGHT)
+PAWN_FORWARD = (UP, DOWN)  # 红兵向上，黑卒向下
+
+# 九宫 / 本方半场 (下标 0 红 1 黑)
+IN_PALACE = [[False] * BOARD_SIZE, [False] * BOARD_SIZE]
+HOME_HALF = [[False] * BOARD_SIZE, [False] * BOARD_SIZE]
+for _sq in BOARD_SQUARES:
+    _r, _c = SQ_ROW[_sq], SQ_COL[_sq]
+    IN_PALACE[0][_sq] = 7 <= _r <= 9 and 3 <= _c <= 5
+    IN_PALACE[1][_sq] = 0 <= _r <= 2 and 3 <= _c <= 5
+    HOME_HALF[0][_sq] = _r >= 5
+    HOME_HALF[1][_sq] = _r <= 4
+IS_ON_BOARD = [False] * BOARD_SIZE
+for _sq in BOARD_SQUARES:
+    IS_ON_BOARD[_sq] = True
+
+# --- 预计算走法表 (导入时生成一次) ---
+# 每个格子、每一方能到达的落点，连同会挡住它的 "马腿" / "象眼" 一起存好，
+# 九宫、河界这些判断都在这里做完，走法生成时只剩查表 + 看格子是否被占。
+KNIGHT_MOVES = [()] * BOARD_SIZE            # sq -> ((落点, 马腿), ...)
+KNIGHT_CHECKS = [()] * BOARD_SIZE           # sq -> ((能踩到 sq 的马的位置, 马腿), ...)
+BISHOP_MOVES = [[()] * BOARD_SIZE, [()] * BOARD_SIZE]   # side, sq -> ((落点, 象眼), ...)
+ADVISOR_MOVES = [[()] * BOARD_SIZE, [()] * BOARD_SIZE]  # side, sq -> (落点, ...)
+KING_MOVES = [[()] * BOARD_SIZE, [()] * BOARD_SIZE]     # side, sq -> (落点, ...) 不含飞将
+PAWN_MOVES = [[()] * BOARD_SIZE, [()] * BOARD_SIZE]     # side, sq -> (落点, ...)
+for _sq in BOARD_SQUARES:
+    KNIGHT_MOVES[_sq] = tuple((_sq + _d, _sq + _leg) for _d, _leg in KNIGHT_DELTAS
+                              if IS_ON_BOARD[_sq + _d])
+    KNIGHT_CHECKS[_sq] = tuple((_sq + _d, _sq + _leg) for _d, _leg in KNIGHT_CHECK_DELTAS
+                               if IS_ON_BOARD[_sq + _d])
+    for _side in (0, 1):
+        BISHOP_MOVES[_side][_sq] = tuple((_sq + _d, _sq + _eye) for _d, _eye in BISHOP_DELTAS
+                                         if IS_ON_BOARD[_sq + _d] and HOME_HALF[_side][_sq + _d])
+        ADVISOR_MOVES[_side][_sq] = tuple(_sq + _d for _d in ADVISOR_DELTAS
+                                          if IN_PALACE[_side][_sq + _d])
+        KING_MOVES[_side][_sq] = tuple(_sq + _d for _d in LINE_DIRS
+                                       if IN_PALACE[_side][_sq + _d])
+        _pawn = [_sq + PAWN_FORWARD[_side]]
+        if not HOME_HALF[_side][_sq]: # 过河后允许平移
+            _pawn += [_sq + LEFT, _sq + RIGHT]
+        PAWN_MOVES[_side][_sq] = tuple(_to for _to in _pawn if IS_ON_BOARD[_to])
+
+# --- 单步走法的形状表 (检查 TT / 杀手走法用) ---
+# 下标 = 落点 - 起点 + DELTA_OFFSET，两格之间的差不超过 ±125。
+# 马 / 象存 马腿 / 象眼 相对起点的偏移 (0 = 不是这种走法)，士 / 将存是否是一步斜 / 直走。
+DELTA_OFFSET = 128
+KNIGHT_LEG_OF_DELTA = [0] * (2 * DELTA_OFFSET)
+BISHOP_EYE_OF_DELTA = [0] * (2 * DELTA_OFFSET)
+IS_ADVISOR_DELTA = [False] * (2 * DELTA_OFFSET)
+IS_KING_DELTA = [False] * (2 * DELTA_OFFSET)
+for _d, _leg in KNIGHT_DELTAS: KNIGHT_LEG_OF_DELTA[_d + DELTA_OFFSET] = _leg
+for _d, _eye in BISHOP_DELTAS: BISHOP_EYE_OF_DELTA[_d + DELTA_OFFSET] = _eye
+for _d in ADVISOR_DELTAS: IS_ADVISOR_DELTA[_d + DELTA_OFFSET] = True
+for _d in LINE_DIRS: IS_KING_DELTA[_d + DELTA_OFFSET] = True
+
+# 吃子生成时被吃子的顺序 (价值从高到低，MVV)
+CAPTURE_VICTIM_ORDER = (ROOK, KNIGHT, CANNON, ADVISOR, BISHOP, PAWN)
+
+# --- 棋子列表 ---
+# 每方一个定长 16 格的列表存棋子所在格子，0 表示空槽 (0 号格是哨兵，不会有子)；
+# 另有 格子 -> 槽位 的下标表。开局按下面的兵种顺序分配槽位，之后棋子走动只改
+# 本槽，被吃掉只把槽清零 (悔棋时放回原槽)，所以遍历顺序永远固定：车炮在前。
+PIECE_LIST_SIZE = 16
+PIECE_LIST_ORDER = (ROOK, CANNON, KNIGHT, PAWN, ADVISOR, BISHOP, KING)
+
+# --- Zobrist 键 ---
+# 一维数组，下标 = 格子 * ZOBRIST_PIECES + 棋子编码；固定种子 (同 xiangqi_ai.cpp 的 init_zobrist)，
+# 每次启动生成的键都一样，Hash / 置换表 / 日志在不同进程之间可以对得上。
+ZOBRIST_SEED = 12345
+ZOBRIST_PIECES = COLOR_MASK # 棋子编码都小于 24
+_zobrist_rng = random.Random(ZOBRIST_SEED)
+ZOBRIST_KEYS = [_zobrist_rng.getrandbits(64) for _ in range(BOARD_SIZE * ZOBRIST_PIECES)]
+ZOBRIST_TURN = _zobrist_rng.getrandbits(64) # 轮到黑方走棋
+# 整套键的指纹：存盘的置换表记下它，键 (种子 / 生成方式 / 棋子编码) 变了就拒绝加载
+ZOBRIST_CHECK = ZOBRIST_TURN
+for _key in ZOBRIST_KEYS: ZOBRIST_CHECK = (ZOBRIST_CHECK * 0x100000001B3 ^ _key) & 0xFFFFFFFFFFFFFFFF
+del _zobrist_rng
+
+# --- 行/列占位掩码 + 车炮滑动表 ---
+# 每行一个 9 位掩码 (第 c 位 = 该行第 c 列有子)，每列一个 10 位掩码 (第 r 位 = 第 r 行有子)，
+# 在 make_move / undo_move 里增量维护。下面的表把 (在行/列中的位置, 掩码) 直接映射到
+# 相对当前格的偏移量，车炮不再逐格扫描：
+#   *_ROOK_MOVES   车/炮的不吃子落点 (到第一个子之前的空格)
+#   *_ROOK_CAPS    两个方向上碰到的第一个子 (车的吃子候选；也是飞将的目标)
+#   *_CANNON_CAPS  隔一个炮架后的第一个子 (炮的吃子候选)
+# 吃子候选还要看颜色，表里只管几何。掩码里自己那一位被忽略。
+def _build_slide_tables(length, step):
+    quiet, caps, cannon_caps = [], [], []
+    for pos in range(length):
+        q_row, c_row, cc_row = [], [], []
+        for mask in range(1 << length):
+            q, c, cc = [], [], []
+            for direction in (1, -1):
+                i = pos + direction
+                while 0 <= i < length and not (mask >> i) & 1:
+                    q.append((i - pos) * step)
+                    i += direction
+                if 0 <= i < length:
+                    c.append((i - pos) * step)
+                    i += direction
+                    while 0 <= i < length and not (mask >> i) & 1:
+                        i += direction
+                    if 0 <= i < length:
+                        cc.append((i - pos) * step)
+            q_row.append(tuple(q))
+            c_row.append(tuple(c))
+            cc_row.append(tuple(cc))
+        quiet.append(q_row)
+        caps.append(c_row)
+        cannon_caps.append(cc_row)
+    return quiet, caps, cannon_caps
+
+RANK_ROOK_MOVES, RANK_ROOK_CAPS, RANK_CANNON_CAPS = _build_slide_tables(COLS, RIGHT)  # [列][行掩码]
+FILE_ROOK_MOVES, FILE_ROOK_CAPS, FILE_CANNON_CAPS = _build_slide_tables(ROWS, DOWN)   # [行][列掩码]
+
+# --- 整数走法 ---
+# 一步棋压成一个 int：低 8 位起点格，高 8 位终点格 (BOARD_SIZE = 182 < 256)。
+# 走法本身就可以当历史表下标。
+MOVE_BITS = 8
+MOVE_MASK = (1 << MOVE_BITS) - 1
+MOVE_SPACE = 1 << (2 * MOVE_BITS)
+
+def pack_move(from_sq, to_sq):
+    """把起点、终点两个格子压缩成一个 int"""
+    return from_sq | (to_sq << MOVE_BITS)
+
+def unpack_move(move):
+    """解压 int 得到 (起点格, 终点格)"""
+    return move & MOVE_MASK, move >> MOVE_BITS
+
+def move_to_rc(move):
+    """协议边界用：整数走法 -> (r1, c1, r2, c2)"""
+    start, end = move & MOVE_MASK, move >> MOVE_BITS
+    return SQ_ROW[start], SQ_COL[start], SQ_ROW[end], SQ_COL[end]
+
+def rc_to_move(r1, c1, r2, c2):
+    """协议边界用：(r1, c1, r2, c2) -> 整数走法"""
+    return RC_TO_SQ[r1][c1] | (RC_TO_SQ[r2][c2] << MOVE_BITS)
 
 
 # --- 2. 核心参数 (基于成熟引擎标准) ---
@@ -75,6 +297,8 @@ PIECE_VALUES = {
     'p': 1, 
     'K': 10000, 'R': 4, 'N': 3, 'C': 3, 'A': 2, 'B': 2, 'P': 1,'.': 0
 }
+# 按棋子编码索引的子力价值，搜索里直接用 board[sq] 取值
+CODE_VALUES = [PIECE_VALUES.get(ch, 0) for ch in CODE_TO_CHAR]
 #看象眼，子力价值都是靠位置价值表（PST）来体现的。我就简单只给王加分为了保王
 # --- PST (Piece-Square Tables) 位置价值表 ---
 # 所有的表都是基于红方视角 (Row 0是底线, Row 9是敌方底线)
@@ -234,11 +458,266 @@ PST_MAP = {
     'a': pst_advisor,'A': pst_advisor,
     'b': pst_bishop, 'B': pst_bishop
 }
+# 子力 + PST 合成一张表：PIECE_SQUARE_SCORE[棋子编码][格子]，红正黑负，黑方已预先翻转 (9 - r)。
+# make_move / undo_move 维护 current_score 时每次只查一下这张表。
+PIECE_SQUARE_SCORE = [[0] * BOARD_SIZE for _ in range(COLOR_MASK)]
+for _p in range(1, COLOR_MASK):
+    _ch = CODE_TO_CHAR[_p]
+    if _ch not in PIECE_VALUES or _ch == '.': continue
+    for _sq in BOARD_SQUARES:
+        _r, _c = SQ_ROW[_sq], SQ_COL[_sq]
+        _pst = 0
+        if _ch in PST_MAP:
+            _pst = PST_MAP[_ch][_r][_c] if _p & RED else PST_MAP[_ch][9 - _r][_c]
+        _total = PIECE_VALUES[_ch] + _pst
+        PIECE_SQUARE_SCORE[_p][_sq] = _total if _p & RED else -_total
+
+
+# --- 渐进式 (中局 / 残局) 评估，移植自 aipst用复杂的象眼但是棋力下降.py 的 ElephantEye 版本 ---
+# 原版每步用 _get_piece_info / _apply_type_updates 现拼元组列表、走嵌套的 type_score，太慢；
+# 这里把所有分项放进一个定长整数数组 (下标见 TP_*)，每种棋子在每个格子对各分项的贡献预先算好，
+# 走子时只按表加减，不分配任何对象。USE_TAPERED 打开后用它代替 子力+PST。
+USE_TAPERED=0
+# 1. 开中局、有进攻机会的帅(将)和兵(卒)
+cucvlKingPawnMidgameAttacking = [
+    [ 9,  9,  9, 11, 13, 11,  9,  9,  9],
+    [39, 49, 69, 84, 89, 84, 69, 49, 39],
+    [39, 49, 64, 74, 74, 74, 64, 49, 39],
+    [39, 46, 54, 59, 61, 59, 54, 46, 39],
+    [29, 37, 41, 54, 59, 54, 41, 37, 29],
+    [ 7,  0, 13,  0, 16,  0, 13,  0,  7],
+    [ 7,  0,  7,  0, 15,  0,  7,  0,  7],
+    [ 0,  0,  0,  1,  1,  1,  0,  0,  0],
+    [ 0,  0,  0,  2,  2,  2,  0,  0,  0],
+    [ 0,  0,  0, 11, 15, 11,  0,  0,  0]
+]
+
+# 2. 开中局、没有进攻机会的帅(将)和兵(卒)
+cucvlKingPawnMidgameAttackless = [
+    [ 9,  9,  9, 11, 13, 11,  9,  9,  9],
+    [19, 24, 34, 42, 44, 42, 34, 24, 19],
+    [19, 24, 32, 37, 37, 37, 32, 24, 19],
+    [19, 23, 27, 29, 30, 29, 27, 23, 19],
+    [14, 18, 20, 27, 29, 27, 20, 18, 14],
+    [ 7,  0, 13,  0, 16,  0, 13,  0,  7],
+    [ 7,  0,  7,  0, 15,  0,  7,  0,  7],
+    [ 0,  0,  0,  1,  1,  1,  0,  0,  0],
+    [ 0,  0,  0,  2,  2,  2,  0,  0,  0],
+    [ 0,  0,  0, 11, 15, 11,  0,  0,  0]
+]
+
+# 3. 残局、有进攻机会的帅(将)和兵(卒)
+cucvlKingPawnEndgameAttacking = [
+    [10, 10, 10, 15, 15, 15, 10, 10, 10],
+    [50, 55, 60, 85,100, 85, 60, 55, 50],
+    [65, 70, 70, 75, 75, 75, 70, 70, 65],
+    [75, 80, 80, 80, 80, 80, 80, 80, 75],
+    [70, 70, 65, 70, 70, 70, 65, 70, 70],
+    [45,  0, 40, 45, 45, 45, 40,  0, 45],
+    [40,  0, 35, 40, 40, 40, 35,  0, 40],
+    [ 0,  0,  5,  5, 15,  5,  5,  0,  0],
+    [ 0,  0,  3,  3, 13,  3,  3,  0,  0],
+    [ 0,  0,  1,  1, 11,  1,  1,  0,  0]
+]
+
+# 4. 残局、没有进攻机会的帅(将)和兵(卒)
+cucvlKingPawnEndgameAttackless = [
+    [10, 10, 10, 15, 15, 15, 10, 10, 10],
+    [10, 15, 20, 45, 60, 45, 20, 15, 10],
+    [25, 30, 30, 35, 35, 35, 30, 30, 25],
+    [35, 40, 40, 45, 45, 45, 40, 40, 35],
+    [25, 30, 30, 35, 35, 35, 30, 30, 25],
+    [25,  0, 25, 25, 25, 25, 25,  0, 25],
+    [20,  0, 20, 20, 20, 20, 20,  0, 20],
+    [ 0,  0,  5,  5, 13,  5,  5,  0,  0],
+    [ 0,  0,  3,  3, 12,  3,  3,  0,  0],
+    [ 0,  0,  1,  1, 11,  1,  1,  0,  0]
+]
+
+# 5. 没受威胁的仕(士)和相(象)
+cucvlAdvisorBishopThreatless = [
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [ 0,  0, 20,  0,  0,  0, 20,  0,  0],
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [18,  0,  0, 20, 23, 20,  0,  0, 18],
+    [ 0,  0,  0,  0, 23,  0,  0,  0,  0],
+    [ 0,  0, 20, 20,  0, 20, 20,  0,  0]
+]
 
 
+# 6. 受到威胁的仕(士)和相(象)
+cucvlAdvisorBishopThreatened = [
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [ 0,  0, 40,  0,  0,  0, 40,  0,  0],
+    [ 0,  0,  0,  0,  0,  0,  0,  0,  0],
+    [38,  0,  0, 40, 43, 40,  0,  0, 38],
+    [ 0,  0,  0,  0, 43,  0,  0,  0,  0],
+    [ 0,  0, 40, 40,  0, 40, 40,  0,  0]
+]
+
+# 7. 开中局的马
+cucvlKnightMidgame = [
+    [90, 90, 90, 96, 90, 96, 90, 90, 90],
+    [90, 96,103, 97, 94, 97,103, 96, 90],
+    [92, 98, 99,103, 99,103, 99, 98, 92],
+    [93,108,100,107,100,107,100,108, 93],
+    [90,100, 99,103,104,103, 99,100, 90],
+    [90, 98,101,102,103,102,101, 98, 90],
+    [92, 94, 98, 95, 98, 95, 98, 94, 92],
+    [93, 92, 94, 95, 92, 95, 94, 92, 93],
+    [85, 90, 92, 93, 78, 93, 92, 90, 85],
+    [88, 85, 90, 88, 90, 88, 90, 85, 88]
+]
+
+# 8. 残局的马
+cucvlKnightEndgame = [
+    [92, 94, 96, 96, 96, 96, 96, 94, 92],
+    [94, 96, 98, 98, 98, 98, 98, 96, 94],
+    [96, 98,100,100,100,100,100, 98, 96],
+    [96, 98,100,100,100,100,100, 98, 96],
+    [96, 98,100,100,100,100,100, 98, 96],
+    [94, 96, 98, 98, 98, 98, 98, 96, 94],
+    [94, 96, 98, 98, 98, 98, 98, 96, 94],
+    [92, 94, 96, 96, 96, 96, 96, 94, 92],
+    [90, 92, 94, 92, 92, 92, 94, 92, 90],
+    [88, 90, 92, 90, 90, 90, 92, 90, 88]
+]
+
+# 9. 开中局的车
+cucvlRookMidgame = [
+    [206,208,207,213,214,213,207,208,206],
+    [206,212,209,216,233,216,209,212,206],
+    [206,208,207,214,216,214,207,208,206],
+    [206,213,213,216,216,216,213,213,206],
+    [208,211,211,214,215,214,211,211,208],
+    [208,212,212,214,215,214,212,212,208],
+    [204,209,204,212,214,212,204,209,204],
+    [198,208,204,212,212,212,204,208,198],
+    [200,208,206,212,200,212,206,208,200],
+    [194,206,204,212,200,212,204,206,194]
+]
+
+# 10. 残局的车
+cucvlRookEndgame = [
+    [182,182,182,184,186,184,182,182,182],
+    [184,184,184,186,190,186,184,184,184],
+    [182,182,182,184,186,184,182,182,182],
+    [180,180,180,182,184,182,180,180,180],
+    [180,180,180,182,184,182,180,180,180],
+    [180,180,180,182,184,182,180,180,180],
+    [180,180,180,182,184,182,180,180,180],
+    [180,180,180,182,184,182,180,180,180],
+    [180,180,180,182,184,182,180,180,180],
+    [180,180,180,182,184,182,180,180,180]
+]
+
+# 11. 开中局的炮
+cucvlCannonMidgame = [
+    [100,100, 96, 91, 90, 91, 96,100,100],
+    [ 98, 98, 96, 92, 89, 92, 96, 98, 98],
+    [ 97, 97, 96, 91, 92, 91, 96, 97, 97],
+    [ 96, 99, 99, 98,100, 98, 99, 99, 96],
+    [ 96, 96, 96, 96,100, 96, 96, 96, 96],
+    [ 95, 96, 99, 96,100, 96, 99, 96, 95],
+    [ 96, 96, 96, 96, 96, 96, 96, 96, 96],
+    [ 97, 96,100, 99,101, 99,100, 96, 97],
+    [ 96, 97, 98, 98, 98, 98, 98, 97, 96],
+    [ 96, 96, 97, 99, 99, 99, 97, 96, 96]
+]
+
+# 12. 残局的炮
+cucvlCannonEndgame = [
+    [100,100,100,100,100,100,100,100,100],
+    [100,100,100,100,100,100,100,100,100],
+    [100,100,100,100,100,100,100,100,100],
+    [100,100,100,102,104,102,100,100,100],
+    [100,100,100,102,104,102,100,100,100],
+    [100,100,100,102,104,102,100,100,100],
+    [100,100,100,102,104,102,100,100,100],
+    [100,100,100,102,104,102,100,100,100],
+    [100,100,100,104,106,104,100,100,100],
+    [100,100,100,104,106,104,100,100,100]
+]
+
+TAPER_TOTAL_ATTACK = 8
+TAPER_ROOK_MIDGAME = 6
+TAPER_KNIGHT_CANNON_MIDGAME = 3
+TAPER_OTHER_MIDGAME = 1 # 除了帅
+TAPER_TOTAL_MIDGAME = TAPER_ROOK_MIDGAME * 4 + TAPER_KNIGHT_CANNON_MIDGAME * 8 + TAPER_OTHER_MIDGAME * 18
+TAPER_ADVISOR_BISHOP_ATTACKLESS = 80
+
+# 分项下标
+TP_KP = 0           # 帅兵: TP_KP + side*4 + phase*2 + 无攻(1)/有攻(0)
+TP_AB = 8           # 士象: TP_AB + side*2 + 受威胁(1)/无威胁(0)
+TP_RNC_MID = 12     # 车马炮中局分 (红减黑)
+TP_RNC_END = 13     # 车马炮残局分 (红减黑)
+TP_CROSS = 14       # 过河子力分: TP_CROSS + side (车马 2，炮兵 1)
+TP_PHASE = 16       # 中局材力总分 (车 6，马炮 3，其它 1，帅 0)
+TP_SIMPLE = 17      # 轻子净分 红减黑 (车 2，马炮 1)
+TP_MATERIAL = 18    # 基础子力净分 (PIECE_VALUES，红减黑)
+TAPER_TERMS = 19
+
+# TAPER_PLACE_TERMS[棋子编码] = ((分项下标, 按格子的贡献表), ...)：走子时 += 表[终点] - 表[起点]
+# TAPER_CAPTURE_TERMS[棋子编码] = ((分项下标, 贡献), ...)：和位置无关，只在吃子 / 悔棋时增减
+def _taper_table(grid, side, sign):
+    """10x9 的表展开成按格子下标的一维表：红方直接查 grid[r][c]，黑方翻转行，乘上符号"""
+    table = [0] * BOARD_SIZE
+    for sq in BOARD_SQUARES:
+        r = SQ_ROW[sq] if side == 0 else 9 - SQ_ROW[sq]
+        table[sq] = sign * grid[r][SQ_COL[sq]]
+    return table
+
+TAPER_PLACE_TERMS = [()] * COLOR_MASK
+TAPER_CAPTURE_TERMS = [()] * COLOR_MASK
+for _side, _color in enumerate(SIDE_COLOR):
+    _sign = 1 if _side == 0 else -1
+    for _pt in (KING, ADVISOR, BISHOP, KNIGHT, ROOK, CANNON, PAWN):
+        _p = _color | _pt
+        _terms = []
+        if _pt == KING or _pt == PAWN:
+            _grids = (cucvlKingPawnMidgameAttacking, cucvlKingPawnMidgameAttackless,
+                      cucvlKingPawnEndgameAttacking, cucvlKingPawnEndgameAttackless)
+            for _i, _grid in enumerate(_grids):
+                _terms.append((TP_KP + _side * 4 + _i, _taper_table(_grid, _side, 1)))
+        elif _pt == ADVISOR or _pt == BISHOP:
+            _terms.append((TP_AB + _side * 2, _taper_table(cucvlAdvisorBishopThreatless, _side, 1)))
+            _terms.append((TP_AB + _side * 2 + 1, _taper_table(cucvlAdvisorBishopThreatened, _side, 1)))
+        else:
+            _mid, _end = {ROOK: (cucvlRookMidgame, cucvlRookEndgame),
+                          KNIGHT: (cucvlKnightMidgame, cucvlKnightEndgame),
+                          CANNON: (cucvlCannonMidgame, cucvlCannonEndgame)}[_pt]
+            _terms.append((TP_RNC_MID, _taper_table(_mid, _side, _sign)))
+            _terms.append((TP_RNC_END, _taper_table(_end, _side, _sign)))
+        _cross_val = 2 if _pt in (ROOK, KNIGHT) else 1 if _pt in (CANNON, PAWN) else 0
+        if _cross_val:
+            _terms.append((TP_CROSS + _side, [_cross_val if IS_ON_BOARD[_sq] and not HOME_HALF[_side][_sq] else 0
+                                              for _sq in range(BOARD_SIZE)]))
+        TAPER_PLACE_TERMS[_p] = tuple(_terms)
+        _phase = (TAPER_ROOK_MIDGAME if _pt == ROOK else TAPER_KNIGHT_CANNON_MIDGAME if _pt in (KNIGHT, CANNON)
+                  else 0 if _pt == KING else TAPER_OTHER_MIDGAME)
+        _simple = 2 if _pt == ROOK else 1 if _pt in (KNIGHT, CANNON) else 0
+        TAPER_CAPTURE_TERMS[_p] = tuple((_idx, _v) for _idx, _v in
+                                        ((TP_PHASE, _phase), (TP_SIMPLE, _sign * _simple),
+                                         (TP_MATERIAL, _sign * CODE_VALUES[_p])) if _v)
+
 # --- 评估权重配置 (基于 Eleeye 简化) ---
 USE_RELATION=0  # 是否启用关系与阵型评估
 #可能不用才是好的，因为慢，且有hack二阶更加不准，并且pst有一阶的棋形功能了
+# 懒惰评估：子力+PST 已经在 (alpha, beta) 窗口外超过 LAZY_EVAL_MARGIN 时，不再算关系分。
+# 实测 (各局面 3 层搜索、约 1.5 万次静止评估) 关系分绝对值最大 422，99.9% 在 252 以内；
+# 但走懒惰评估的多是一边倒的局面，关系分也偏大：边界取 250 时约 1% 判错。边界取到实测最大值以上才不会判错，
+# 取 450；判错次数见 bench eval (它总是核对)。
+LAZY_EVAL=1
+LAZY_EVAL_MARGIN = 450
+LAZY_EVAL_VERIFY=0 # 搜索时也核对：走懒惰评估时仍算一遍完整分，统计判断错了多少次 (bench eval 总是核对)
 # 棋形分
 EV_HOLLOW_CANNON = 200    # 空头炮 (非常危险)
 EV_CENTRAL_CANNON = 50    # 中炮 (镇中)
@@ -259,6 +738,39 @@ EV_MOBILITY = {
 TT_EXACT = 0   # 精确值
 TT_ALPHA = 1   # 上界 (最多这么多分，也就是 Fail Low)
 TT_BETA  = 2   # 下界 (至少这么多分，也就是 Fail High)
+# 置换表条目：两个 64 位字 [Hash ^ 数据, 数据]
+# 数据 = 走法(16 位) | 标记 << 16 (2 位) | 深度 << 18 (8 位) | 代数 << 26 (6 位) | (分数 + 偏移) << 32；数据为 0 表示空槽
+TT_BUCKET_SIZE = 4 # 每个桶的条目数，按 Hash 低位找桶
+TT_BUCKET_WORDS = 2 * TT_BUCKET_SIZE
+TT_ENTRY_BYTES = 16
+TT_AGE_MASK = 63
+TT_SCORE_OFFSET = 1 << 31
+# 置换表存盘格式：文件头 (魔数, 版本, Zobrist 种子, Zobrist 指纹, 条目数, 每桶条目数, 代数) + 全部 64 位字，都是小端
+# (大端机器存取时逐字翻转，文件在不同字节序的机器间通用)
+TT_FILE_MAGIC = b"XQTT"
+TT_FILE_VERSION = 1
+TT_FILE_HEADER = struct.Struct("<4sIqQQII") # 40 字节，后面的字按 8 字节对齐
+SMP_BENCH_WORKERS = (1, 2, 4, 8, 16) # bench smp 依次测的进程数
+ROOT_BENCH_WORKERS = (2, 4, 8, 16) # bench root 依次测的进程数
+ROOT_SPLIT_MIN_DEPTH = 4 # 根节点并行从这个深度开始分任务，更浅的直接 minimax (任务太小，不值得发给进程池)
+ROOT_SCRATCH_ENTRIES = 1 << 18 # 根节点并行时每个根走法自己的置换表条目数 (见 RootScratchTT)
+ROOT_SPLIT_MERGE_PLIES = 4 # 根走法搜完只把子树最上面这么多层的条目带回主置换表 (其余的留在子进程里丢掉)
+
+# --- perft 基准局面 (走法生成校验 + 吞吐测试) ---
+# 每项: (FEN, [深度1, 深度2, ...] 的合法走法叶子数)。
+# 数值与 chessprogramming wiki 的象棋 perft 结果一致，并用原来的 "伪合法 + 走后查将" 生成器交叉验证过。
+PERFT_SUITE = [
+    ("rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w", [44, 1920, 79666, 3290240, 133312995]),
+    ("r1ba1a3/4kn3/2n1b4/pNp1p1p1p/4c4/6P2/P1P2R2P/1CcC5/9/2BAKAB2 w", [38, 1128, 43929, 1339047, 53112976]),
+    ("1cbak4/9/n2a5/2p1p3p/5cp2/2n2N3/6PCP/3AB4/2C6/3A1K1N1 w", [7, 281, 8620, 326201, 10369923]),
+    ("5a3/3k5/3aR4/9/5r3/5n3/9/3A1A3/5K3/2BC2B2 w", [25, 424, 9850, 202884, 4739553]),
+    ("CRN1k1b2/3ca4/4ba3/9/2nr5/9/9/4B4/4A4/4KA3 w", [28, 516, 14808, 395483, 11842230]),
+    ("R1N1k1b2/9/3aba3/9/2nr5/2B6/9/4B4/4A4/4KA3 w", [21, 364, 7626, 162837, 3500505]),
+]
+PERFT_TT_SIZE = 1 << 20 # 带置换表的 perft 用的槽位数 (2 的幂)
+# 评估缓存：按 current_hash 低位直接映射的定长表，总是用新局面覆盖旧局面
+EVAL_CACHE_SIZE = 1 << 18 # 2 的幂
+EVAL_CACHE_MASK = EVAL_CACHE_SIZE - 1
 
 class PikafishEvaluator:
     def __init__(self, engine_path="pikafish.exe"):
@@ -360,10 +872,272 @@ class PikafishEvaluator:
     def close(self):
         self.process.terminate()
 
+# --- 小型 NNUE 评估 ---
+# 特征：14 种棋子 x 90 格 = 1260 个稀疏的 棋子-格子 特征 (红方视角，红正黑负)，
+# 第一层的输出就是累加器 (各特征对应行之和)，走子时只加减 2~3 行；后面接两层很小的全连接。
+# 权重由 train_nnue.py 用 numpy 训练并量化成整数存成 json，推理是纯 Python 整数运算，不需要 GPU / numpy。
+NNUE_FEATURES = 14 * ROWS * COLS
+NNUE_FEATURE = [[-1] * BOARD_SIZE for _ in range(COLOR_MASK)] # [棋子编码][格子] -> 特征下标
+for _p in range(1, COLOR_MASK):
+    if _p & TYPE_MASK and _p & COLOR_MASK in SIDE_COLOR:
+        _pidx = (_p & TYPE_MASK) - 1 + (7 if _p & BLACK else 0)
+        for _sq in BOARD_SQUARES:
+            NNUE_FEATURE[_p][_sq] = _pidx * ROWS * COLS + SQ_ROW[_sq] * COLS + SQ_COL[_sq]
+
+class NNUEEvaluator:
+    """
+    读 train_nnue.py 导出的量化权重：
+    acc = b1 + sum(w1[特征])          (QA 倍)
+    h1  = clamp(acc, 0, QA)
+    h2  = clamp((h1 . w2 + b2) // QB, 0, QA)
+    out = (h2 . w3 + b3) * scale // (QA * QB)   (单位：分，红正黑负)
+    """
+    def __init__(self, path=NNUE_FILE):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.qa, self.qb, self.scale = data["qa"], data["qb"], data["scale"]
+        w1 = data["w1"] # NNUE_FEATURES 行，每行 hidden1 个
+        if len(w1) != NNUE_FEATURES: raise ValueError(f"{path}: w1 应有 {NNUE_FEATURES} 行")
+        # 按 [棋子编码][格子] 直接取第一层的行，走子时不用再算特征下标
+        zero = tuple([0] * len(data["b1"]))
+        self.rows = [[zero] * BOARD_SIZE for _ in range(COLOR_MASK)]
+        for p in range(COLOR_MASK):
+            for sq in BOARD_SQUARES:
+                if NNUE_FEATURE[p][sq] >= 0: self.rows[p][sq] = tuple(w1[NNUE_FEATURE[p][sq]])
+        self.b1 = list(data["b1"])
+        self.w2 = [tuple(col) for col in data["w2"]] # hidden2 行，每行 hidden1 个
+        self.b2 = list(data["b2"])
+        self.w3 = tuple(data["w3"])
+        self.b3 = data["b3"]
+
+    def refresh(self, board):
+        """从棋盘重新累加第一层"""
+        acc = list(self.b1)
+        rows = self.rows
+        for sq in BOARD_SQUARES:
+            p = board[sq]
+            if p != EMPTY:
+                acc = [a + w for a, w in zip(acc, rows[p][sq])]
+        return acc
+
+    def evaluate(self, acc):
+        qa, qb = self.qa, self.qb
+        h1 = [qa if a > qa else a if a > 0 else 0 for a in acc]
+        h2 = []
+        for w, b in zip(self.w2, self.b2):
+            v = (sum(map(int.__mul__, h1, w)) + b) // qb
+            h2.append(qa if v > qa else v if v > 0 else 0)
+        out = sum(map(int.__mul__, h2, self.w3)) + self.b3
+        return out * self.scale // (qa * qb)
+
+def tt_entries_for_mb(mb):
+    """mb 兆字节能放下的条目数 (桶数取 2 的幂，至少一个桶)"""
+    buckets = 1
+    while buckets * 2 * TT_BUCKET_SIZE * TT_ENTRY_BYTES <= mb * (1 << 20):
+        buckets *= 2
+    return buckets * TT_BUCKET_SIZE
+
+class TranspositionTable:
+    """
+    定长置换表：array('Q') 里每个条目两个 64 位字，TT_BUCKET_SIZE 个条目一桶，桶数是 2 的幂。
+    第一个字存 Hash ^ 数据，读的时候再异或回来校验 (共享内存时也不用加锁，见 SharedTT)。
+    每次搜索开始调用 new_search 把代数加一：同一局面深的优先；换别的局面时，
+    优先挤掉空槽、旧搜索留下的条目和浅的条目，以前几步棋的深条目不会一直占着位置。
+    """
+    def __init__(self, entries):
+        self.size = entries
+        self.mask = entries // TT_BUCKET_SIZE - 1
+        self.age = 0
+        self.words = self._alloc(entries * 2)
+
+    def _alloc(self, n):
+        return array('Q', bytes(8 * n))
+
+    def __len__(self):
+        return self.size
+
+    def new_search(self):
+        self.age = (self.age + 1) & TT_AGE_MASK
+
+    def probe(self, key):
+        """命中返回 (Hash, 深度, 标记, 分数, 走法)，否则 None"""
+        words = self.words
+        base = (key & self.mask) * TT_BUCKET_WORDS
+        for i in range(base, base + TT_BUCKET_WORDS, 2):
+            data = words[i + 1]
+            if data and words[i] ^ data == key:
+                return (key, (data >> 18) & 0xFF, (data >> 16) & 3,
+                        (data >> 32) - TT_SCORE_OFFSET, (data & 0xFFFF) or None)
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        words = self.words
+        age = self.age
+        base = (key & self.mask) * TT_BUCKET_WORDS
+        victim = base
+        worst = 1 << 30
+        for i in range(base, base + TT_BUCKET_WORDS, 2):
+            data = words[i + 1]
+            if data == 0:
+                if worst > -1000: victim, worst = i, -1000
+                continue
+            old_age = (data >> 26) & TT_AGE_MASK
+            if words[i] ^ data == key:
+                # 同一局面：和原来一样只让更深的覆盖，但上一次搜索留下的总是可以覆盖
+                if depth < (data >> 18) & 0xFF and old_age == age: return
+                victim = i
+                break
+            value = ((data >> 18) & 0xFF) - 4 * ((age - old_age) & TT_AGE_MASK) # 越浅、越旧越先被换掉
+            if value < worst: victim, worst = i, value
+        data = (move or 0) | flag << 16 | depth << 18 | age << 26 | (int(score) + TT_SCORE_OFFSET) << 32
+        words[victim] = key ^ data
+        words[victim + 1] = data
+        return victim
+
+    def merge(self, packed):
+        """按顺序存入 RootScratchTT.export 导出的条目 (用本表的代数)"""
+        words = array('Q')
+        words.frombytes(packed)
+        for i in range(0, len(words), 2):
+            data = words[i + 1]
+            self.store(words[i] ^ data, (data >> 18) & 0xFF, (data >> 16) & 3,
+                       (data >> 32) - TT_SCORE_OFFSET, (data & 0xFFFF) or None)
+
+    def hashfull(self):
+        """前 1000 个条目里本次搜索写入的千分比 (和 UCI 的 hashfull 一样抽样)"""
+        words = self.words
+        n = min(1000, self.size)
+        used = sum(1 for i in range(1, 2 * n, 2) if words[i] and (words[i] >> 26) & TT_AGE_MASK == self.age)
+        return used * 1000 // n
+
+    def clear(self):
+        self.words[:] = self._alloc(self.size * 2)
+
+    def save(self, path):
+        """文件头 + 全部条目写盘 (小端；大端机器先翻转一份拷贝再写)"""
+        with open(path, "wb") as f:
+            f.write(TT_FILE_HEADER.pack(TT_FILE_MAGIC, TT_FILE_VERSION, ZOBRIST_SEED, ZOBRIST_CHECK,
+                                        self.size, TT_BUCKET_SIZE, self.age))
+            if sys.byteorder == "big":
+                words = array('Q', self.words)
+                words.byteswap()
+                f.write(words)
+            else:
+                f.write(self.words)
+
+    def load(self, mapped):
+        """从 read_tt_file 映射好的文件拷入 (条目数必须相同)，小端机器直接从映射拷，不先整个读进内存"""
+        view = memoryview(mapped)[TT_FILE_HEADER.size:].cast('Q')
+        dst = memoryview(self.words)
+        try:
+            if sys.byteorder == "big":
+                words = array('Q', view)
+                words.byteswap()
+                dst[:] = words
+            else:
+                dst[:] = view
+        finally:
+            dst.release()
+            view.release()
+        self.age = TT_FILE_HEADER.unpack_from(mapped)[6]
+
+def read_tt_file(path):
+    """
+    打开并校验存盘的置换表，返回 (mmap, 条目数)；格式、版本、Zobrist 种子 / 指纹或大小不对时抛 ValueError。
+    调用方用完要 close 这个 mmap。
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if len(mapped) < TT_FILE_HEADER.size: raise ValueError("文件太短")
+        magic, version, seed, check, entries, bucket, _ = TT_FILE_HEADER.unpack_from(mapped)
+        if magic != TT_FILE_MAGIC or version != TT_FILE_VERSION: raise ValueError("不是这个版本的置换表文件")
+        if seed != ZOBRIST_SEED or check != ZOBRIST_CHECK: raise ValueError("Zobrist 键和当前引擎不一致")
+        if bucket != TT_BUCKET_SIZE or entries & (entries - 1) or entries < bucket:
+            raise ValueError("桶结构不一致")
+        if len(mapped) != TT_FILE_HEADER.size + entries * TT_ENTRY_BYTES: raise ValueError("文件大小和条目数对不上")
+    except Exception:
+        mapped.close()
+        raise
+    return mapped, entries
+
+class SharedTT(TranspositionTable):
+    """
+    放在 multiprocessing.shared_memory 里的置换表，给 Lazy SMP / 根节点并行的各进程共用，布局和 TranspositionTable 一样。
+    不加锁：两个字不是同一次写入的 (被别的进程写了一半) 时异或还原出来的 Hash 就对不上，当作没命中。
+    代数由主进程随任务一起发给子进程。
+    """
+    def __init__(self, entries, name=None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=entries * TT_ENTRY_BYTES)
+            self.shm.buf[:] = bytes(entries * TT_ENTRY_BYTES)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        super().__init__(entries)
+
+    def _alloc(self, n):
+        return self.shm.buf.cast('Q')
+
+    def clear(self):
+        self.shm.buf[:] = bytes(self.size * TT_ENTRY_BYTES)
+
+    def close(self, unlink=False):
+        self.words.release()
+        self.shm.close()
+        if unlink: self.shm.unlink()
+
+class RootScratchTT(TranspositionTable):
+    """
+    根节点并行时一个根走法用的置换表：先查自己写过的，再查冻结的主表 base，新条目只写在这里。
+    记下写过的槽，搜完清掉；这样一个根走法看到的置换表只取决于根节点时的主表，
+    不受同一层其它根走法 (别的进程里同时在搜) 的影响。深度不小于 keep_depth 的条目 (子树最上面几层)
+    另外记一份，搜完按写入顺序导出给主进程合并，更浅的不带回去。
+    """
+    def __init__(self, entries):
+        super().__init__(entries)
+        self.base = None
+        self.keep_depth = 1
+        self.touched = []
+        self.kept = []
+
+    def probe(self, key):
+        entry = TranspositionTable.probe(self, key)
+        return entry if entry is not None else self.base.probe(key)
+
+    def store(self, key, depth, flag, score, move):
+        slot = TranspositionTable.store(self, key, depth, flag, score, move)
+        if slot is not None:
+            self.touched.append(slot)
+            if depth >= self.keep_depth: self.kept.append(slot)
+
+    def reset(self, base, keep_depth):
+        """清掉上一个根走法写的条目，换成在 base 上搜，只导出深度不小于 keep_depth 的条目"""
+        words = self.words
+        for i in self.touched:
+            words[i] = words[i + 1] = 0
+        self.touched = []
+        self.kept = []
+        self.base = base
+        self.age = base.age
+        self.keep_depth = keep_depth
+
+    def export(self):
+        """记下的深条目按第一次写入的顺序打包成 bytes (给 merge 用)；槽被更浅的条目占了的就不要了"""
+        words = self.words
+        out = array('Q')
+        for i in dict.fromkeys(self.kept):
+            data = words[i + 1]
+            if (data >> 18) & 0xFF >= self.keep_depth:
+                out.append(words[i])
+                out.append(data)
+        return out.tobytes()
+
 class XiangqiCLI:
 
-    def __init__(self):
-        self.board = [
+    def __init__(self, tt=None, start_pikafish=True):
+        # tt: 直接用给定的置换表 (并行搜索的子进程传 SharedTT，不再白分配一张)
+        # start_pikafish: 子进程只在 USE_PIKAFISH 时才需要皮卡鱼
+        start_rows = [
             ['r', 'n', 'b', 'a', 'k', 'a', 'b', 'n', 'r'],
             ['.', '.', '.', '.', '.', '.', '.', '.', '.'],
             ['.', 'c', '.', '.', '.', '.', '.', 'c', '.'],
@@ -375,56 +1149,117 @@ class XiangqiCLI:
             ['.', '.', '.', '.', '.', '.', '.', '.', '.'],
             ['R', 'N', 'B', 'A', 'K', 'A', 'B', 'N', 'R']
         ]
+        # 一维带哨兵棋盘，存整数棋子编码 (见 BOARD_W / CHAR_TO_CODE)
+        self.board = [OFFBOARD] * BOARD_SIZE
+        for r in range(ROWS):
+            for c in range(COLS):
+                self.board[RC_TO_SQ[r][c]] = CHAR_TO_CODE[start_rows[r][c]]
         self.turn = 'red'
         self.player_side = None
         self.game_over = False
         self.current_score = 0
-        self.king_pos = [None,None] # [red_king_pos, black_king_pos]
-        self.piece_places=[set(),set()] # 红位置、黑位置
+        self.king_pos = [None,None] # [red_king_sq, black_king_sq]
+        self.piece_list = [[0] * PIECE_LIST_SIZE, [0] * PIECE_LIST_SIZE] # 红、黑棋子所在格子 (0 = 空槽)
+        self.piece_index = [0] * BOARD_SIZE # 格子 -> 所在槽位
+        self.captured_slots = [] # 被吃棋子原来的槽位，悔棋时按栈弹出
+        self.slot_ranges = [[(0, 0)] * (TYPE_MASK + 1), [(0, 0)] * (TYPE_MASK + 1)] # 每方每个兵种占的槽位段 [lo, hi)
+        self.piece_count = [0] * COLOR_MASK # 按棋子编码计数，吃子 / 悔棋时增减
+        self.use_tapered = USE_TAPERED # 可在运行时切换 (基准测试用)，切换后要调用 init_taper_scores
+        self.taper = [0] * TAPER_TERMS # 渐进式评估的各分项 (下标见 TP_*)
+        self.nnue = None # NNUEEvaluator，用 set_nnue 加载
+        self.nnue_file = None # 加载的权重文件 (Lazy SMP 辅助进程照着加载)
+        self.use_nnue = False
+        self.nnue_acc = [] # 当前局面的第一层累加器
+        self.nnue_stack = [] # 走子前的累加器，悔棋时直接弹回来
+        self.rank_occ = [0] * ROWS # 每行 9 位占位掩码
+        self.file_occ = [0] * COLS # 每列 10 位占位掩码
         
 
         # --- 在类的 __init__ 中修改 ---
-        self.tt_size = 1000003  # 一个足够大的素数
-        # 每个条目存储: [zobrist_hash, depth, flag, score, best_move]
-        # 初始化为 None 或固定长度列表以节省分配开销
-        self.tt = [None] * self.tt_size
+        self.tt_size = len(tt) if tt is not None else tt_entries_for_mb(HASH_MB) # 条目数 (2 的幂)
+        # 每个条目存储: [zobrist_hash, depth, flag, score, best_move]，打包在两个 64 位整数里
+        self.tt = tt if tt is not None else TranspositionTable(self.tt_size)
         # --- Zobrist 与 置换表 初始化 ---
-        self.zobrist_table = {} # 存储每个棋子在每个位置的随机数
-        self.zobrist_turn = random.getrandbits(64) # 轮到黑方走棋的随机数
+        self.zobrist_table = ZOBRIST_KEYS # 每个棋子在每个位置的随机数 (见 ZOBRIST_KEYS)
+        self.zobrist_turn = ZOBRIST_TURN # 轮到黑方走棋的随机数
         self.current_hash = 0
         # --- 新增：历史局面 Hash 表 ---
         self.hash_count = {}
 
-        self.init_zobrist() # 生成随机数表
         self.init_score_and_hash() # 计算初始分数和初始Hash
-
+        if USE_NNUE: self.set_nnue(NNUE_FILE)
         self.start_time = 0
         self.time_limit = float('inf') # 默认无限制，实际使用时会设置为具体秒数
         self.stop_search = False  # 中断标志
         self.nodes = 0           # 统计搜索量
 
-        self.history_table = [[[[0]*9 for _ in range(10)] for _ in range(9)] for _ in range(10)]
+        self.history_table = [0] * MOVE_SPACE # 直接用整数走法做下标
         self.killer_moves = [[None, None] for _ in range(64)]
 
 
                 
         # 1. 启动皮卡鱼 (确保 exe 在同级目录)
-        try:
-            self.pikafish = PikafishEvaluator("pikafish.exe")
-            # print("成功连接皮卡鱼引擎用于评估！")
-        except Exception as e:
-            print(f"无法启动皮卡鱼: {e}")
-            self.pikafish = None
+        self.pikafish = None
+        if start_pikafish:
+            try:
+                self.pikafish = PikafishEvaluator("pikafish.exe")
+                # print("成功连接皮卡鱼引擎用于评估！")
+            except Exception as e:
+                print(f"无法启动皮卡鱼: {e}", file=sys.stderr, flush=True) # stdout 只留给引擎协议
 
         # 2. 添加一个评估缓存 (非常重要！否则太慢)
-        self.eval_cache = {} 
-    def evaluate(self,use_pikafish=USE_PIKAFISH):
+        # 两张平行的定长表，按 Hash 低位找槽，存完整 Hash 做校验 (-1 = 空槽)
+        self.eval_cache_keys = [-1] * EVAL_CACHE_SIZE
+        self.eval_cache_vals = [0] * EVAL_CACHE_SIZE
+        self.eval_cache_probes = 0 # 每次搜索前清零，用来算命中率
+        self.eval_cache_hits = 0
+        self.lazy_eval_hits = 0 # 懒惰评估直接返回的次数
+        self.lazy_eval_wrong = 0 # 其中完整分其实落在窗口另一侧的次数 (只在 lazy_eval_verify 时统计)
+        self.lazy_eval_verify = LAZY_EVAL_VERIFY
+        self.perft_tt = None # perft tt 模式才分配
+        self.aspiration_researches = [] # search_main 每层渴望窗口的 (深度, 失败低次数, 失败高次数)
+        self.smp = None # LazySMP，进程数 > 1 时才有
+        self.smp_stop = None # Lazy SMP 共用的停止事件，is_time_up 顺带检查
+        self.root_pool = None # 根节点并行的进程池 (ProcessPoolExecutor)
+        self.root_workers = 1
+        self.root_abort = None # 通知池里正在搜的任务提前结束
+        self.root_scratch = None # RootScratchTT，第一次搜根走法时分配
+        self.root_history = None # 根节点并行时放历史表快照的共享内存 (MOVE_SPACE 个 int64)
+        self.root_history_id = 0 # 快照编号，子进程看到新编号才重新读
+        if multiprocessing.parent_process() is None: # 并行搜索的子进程自己不再开进程
+            if SMP_WORKERS > 1: self.set_threads(SMP_WORKERS)
+            elif ROOT_SPLIT_WORKERS > 1: self.set_root_split(ROOT_SPLIT_WORKERS)
+    def evaluate(self,use_pikafish=USE_PIKAFISH, alpha=None, beta=None):
         """
         使用皮卡鱼进行静态评估
+        皮卡鱼和关系分两条慢路径都先查评估缓存 (按 current_hash)；
+        只有子力+PST 时评估就是读一个数，查缓存反而更慢，不走缓存。
+        传入 alpha / beta 时可以走懒惰评估 (见 LAZY_EVAL)。
         """
+        if alpha is not None and LAZY_EVAL and USE_RELATION and not use_pikafish and not self.use_tapered and not self.use_nnue:
+            lazy = self.current_score
+            if lazy - LAZY_EVAL_MARGIN >= beta or lazy + LAZY_EVAL_MARGIN <= alpha:
+                self.lazy_eval_hits += 1
+                if self.lazy_eval_verify:
+                    full = lazy + self.get_relation_score()
+                    if (full < beta) if lazy >= beta else (full > alpha):
+                        self.lazy_eval_wrong += 1
+                return lazy
+        cached = use_pikafish or USE_RELATION or self.use_tapered or self.use_nnue
+        if cached:
+            key = self.current_hash
+            idx = key & EVAL_CACHE_MASK
+            self.eval_cache_probes += 1
+            if self.eval_cache_keys[idx] == key:
+                self.eval_cache_hits += 1
+                return self.eval_cache_vals[idx]
+
+        # NNUE：累加器已增量维护好，只剩两层小网络 (不再叠加手写的关系分)
+        if self.use_nnue and not use_pikafish:
+            final_score = self.nnue.evaluate(self.nnue_acc)
         # 如果皮卡鱼没启动，回退到原来的逻辑（或者直接返回0）
-        if not use_pikafish:
-            base = self.current_score
+        elif not use_pikafish:
+            base = self.get_tapered_score() if self.use_tapered else self.current_score
             total = base
             # 2. 关系与阵型分 (实时计算)
             # 注意：这里如果太慢，可以考虑只在 depth > X 时调用，或者简化
@@ -439,51 +1274,99 @@ class XiangqiCLI:
             # 如果你的 current_score 已经是 "红优则正，黑优则负"，
             # 那么这里直接返回 total 即可。minimax 内部会根据 maximizing_player 处理。
             # 这里假设 total 是相对于红方的净胜分。
-            
-            return total
-        
-        # 1. 生成 FEN
-        # 为了提高缓存命中率，只取 FEN 的前两部分 (棋盘布局 + 轮谁走)
-        # 忽略回合数等无关信息
-        full_fen = self.to_fen()
-        fen_key = " ".join(full_fen.split()[:2])
-        
-        # 2. 查缓存
-        if fen_key in self.eval_cache:
-            return self.eval_cache[fen_key]
-
-        # 3. 调用皮卡鱼 (最耗时的一步)
-        # 注意：皮卡鱼的评估是相对于“当前行动方”的
-        # 也就是：如果是红方走，正分代表红优；如果是黑方走，正分代表黑优。
-        # 你的 minimax 逻辑看起来是基于 "红方为正，黑方为负" 的绝对分数体系。
-        # 我们需要转换一下。
-        
-        score = self.pikafish.get_evaluation(full_fen)
-        
-        # 皮卡鱼返回的分数通常是 "当前视角分"
-        # 如果当前轮到黑方 (self.turn == 'black')，且皮卡鱼说 +100 (黑优)，
-        # 那么在你的绝对分数体系里，这应该是 -100 (红劣)。
-        if self.turn == 'black':
-            final_score = -score
+            final_score = total
         else:
-            final_score = score
+            # 1. 生成 FEN
+            # 缓存已经按 Hash 查过了 (Hash 只含棋盘布局 + 轮谁走，和原来取 FEN 前两段一样)
+            full_fen = self.to_fen()
+
+            # 3. 调用皮卡鱼 (最耗时的一步)
+            # 注意：皮卡鱼的评估是相对于“当前行动方”的
+            # 也就是：如果是红方走，正分代表红优；如果是黑方走，正分代表黑优。
+            # 你的 minimax 逻辑看起来是基于 "红方为正，黑方为负" 的绝对分数体系。
+            # 我们需要转换一下。
+
+            score = self.pikafish.get_evaluation(full_fen)
+
+            # 皮卡鱼返回的分数通常是 "当前视角分"
+            # 如果当前轮到黑方 (self.turn == 'black')，且皮卡鱼说 +100 (黑优)，
+            # 那么在你的绝对分数体系里，这应该是 -100 (红劣)。
+            if self.turn == 'black':
+                final_score = -score
+            else:
+                final_score = score
 
-        # 4. 存缓存
-        # 限制缓存大小，防止内存爆炸
-        if len(self.eval_cache) > 100000:
-            self.eval_cache.clear()
-        self.eval_cache[fen_key] = final_score
+        # 4. 存缓存 (定长表，直接覆盖同槽的旧局面，不会无限长大)
+        if cached:
+            self.eval_cache_keys[idx] = key
+            self.eval_cache_vals[idx] = final_score
         
         return final_score
+
+    def get_tapered_score(self):
+        """
+        渐进式评估 (红正黑负)：子力 + 按中残局、进攻 / 受威胁程度插值的位置分。
+        公式与 aipst用复杂的象眼但是棋力下降.py 的 evaluate 相同，所需分项都已在 self.taper 里增量维护好。
+        """
+        taper = self.taper
+        # 1. 中局 / 残局 权重：二次函数，子力很少时才认为接近残局
+        mid_val = taper[TP_PHASE]
+        ratio_mid = (2 * TAPER_TOTAL_MIDGAME - mid_val) * mid_val / (TAPER_TOTAL_MIDGAME * TAPER_TOTAL_MIDGAME)
+        ratio_end = 1.0 - ratio_mid
+
+        # 2. 进攻系数：过河子力分 + 轻子多出来的部分 (每多一个轻子加 2)，上限 TAPER_TOTAL_ATTACK
+        simple = taper[TP_SIMPLE]
+        r_att = taper[TP_CROSS] + (simple * 2 if simple > 0 else 0)
+        b_att = taper[TP_CROSS + 1] + (-simple * 2 if simple < 0 else 0)
+        if r_att > TAPER_TOTAL_ATTACK: r_att = TAPER_TOTAL_ATTACK
+        if b_att > TAPER_TOTAL_ATTACK: b_att = TAPER_TOTAL_ATTACK
+        red_att_ratio = r_att / TAPER_TOTAL_ATTACK
+        black_att_ratio = b_att / TAPER_TOTAL_ATTACK
+
+        # 3. 帅兵：先按进攻状态插值，再按中残局插值
+        r_kp = ((taper[TP_KP] * red_att_ratio + taper[TP_KP + 1] * (1.0 - red_att_ratio)) * ratio_mid +
+                (taper[TP_KP + 2] * red_att_ratio + taper[TP_KP + 3] * (1.0 - red_att_ratio)) * ratio_end)
+        b_kp = ((taper[TP_KP + 4] * black_att_ratio + taper[TP_KP + 5] * (1.0 - black_att_ratio)) * ratio_mid +
+                (taper[TP_KP + 6] * black_att_ratio + taper[TP_KP + 7] * (1.0 - black_att_ratio)) * ratio_end)
+        # 士象：取决于【对方】的进攻系数
+        r_ab = taper[TP_AB + 1] * black_att_ratio + taper[TP_AB] * (1.0 - black_att_ratio)
+        b_ab = taper[TP_AB + 3] * red_att_ratio + taper[TP_AB + 2] * (1.0 - red_att_ratio)
+        # 车马炮 (已是红减黑)
+        rnc = taper[TP_RNC_MID] * ratio_mid + taper[TP_RNC_END] * ratio_end
+
+        total = taper[TP_MATERIAL] + (r_kp - b_kp) + (r_ab - b_ab) + rnc
+        # 调整不受威胁方少掉的仕(士)相(象)分值
+        # (红方加 (8 - 黑攻) / 8 份，黑方加 (8 - 红攻) / 8 份，相减)
+        total += TAPER_ADVISOR_BISHOP_ATTACKLESS * (r_att - b_att) / TAPER_TOTAL_ATTACK
+        return int(total)
+
+    def reset_search_stats(self):
+        """每次搜索开始前调用：清零评估缓存 / 懒惰评估的统计"""
+        self.eval_cache_probes = 0
+        self.eval_cache_hits = 0
+        self.lazy_eval_hits = 0
+        self.lazy_eval_wrong = 0
+
+    def eval_cache_hit_rate(self):
+        """本次搜索评估缓存的命中率 (0~1)，没查过缓存时为 0"""
+        return self.eval_cache_hits / self.eval_cache_probes if self.eval_cache_probes else 0.0
     
     # 记得在程序退出时关闭进程，比如加个析构函数或者在 quit 时调用
     def close(self):
         if self.pikafish:
             self.pikafish.close()
+        if self.smp:
+            self.smp.close()
+            self.smp = None
+        if self.root_pool:
+            self.root_pool.shutdown(wait=True, cancel_futures=True)
+            self.root_pool = None
+            self.tt.close(unlink=True)
+            self.root_history.close()
+            self.root_history.unlink()
     # 2. 辅助函数：获取移动的历史得分
     def get_history_score(self, move):
-        start, end = move
-        return self.history_table[start[0]][start[1]][end[0]][end[1]]
+        return self.history_table[move]
 
     def is_time_up(self):
         """检查是否超时"""
@@ -491,417 +1374,732 @@ class XiangqiCLI:
         if self.nodes & 1023 == 0:
             if time.time() - self.start_time > self.time_limit:
                 self.stop_search = True
+            elif self.smp_stop is not None and self.smp_stop.is_set(): # 并行搜索里别的进程已经结束
+                self.stop_search = True
         return self.stop_search
     
-    def init_zobrist(self):
-        """为每个格子上的每种棋子生成一个唯一的 64位 随机整数"""
-        pieces = PIECE_CHARS.keys()
-        for r in range(ROWS):
-            for c in range(COLS):
-                for p in pieces:
-                    if p != '.':
-                        self.zobrist_table[(r, c, p)] = random.getrandbits(64)
-
-
-    def get_piece_value(self, piece, r, c):
-        """辅助函数：获取单个棋子在特定位置的分数（包含子力+PST）"""
-        if piece == '.': return 0
-        
-        val = PIECE_VALUES.get(piece, 0)
-        pst_val = 0
-        if piece in PST_MAP:
-            table = PST_MAP[piece]
-            pst_val = table[r][c] if self.is_red(piece) else table[9 - r][c]
-        
-        total = val + pst_val
-        return total if self.is_red(piece) else -total
+    def get_piece_value(self, piece, sq):
+        """辅助函数：获取单个棋子在特定位置的分数（包含子力+PST，红正黑负，见 PIECE_SQUARE_SCORE）"""
+        return PIECE_SQUARE_SCORE[piece][sq]
 
     def init_score_and_hash(self):
         """初始化计算 分数 和 Hash"""
         self.current_score = 0
         self.current_hash = 0
-        for r in range(ROWS):
-            for c in range(COLS):
-                p = self.board[r][c]
-                if p != '.':
-                    self.current_score += self.get_piece_value(p, r, c)
-                    self.current_hash ^= self.zobrist_table[(r, c, p)]
-                    self.piece_places_add(p,r,c)
-                if p == 'K':
-                    self.king_pos[0] = (r, c)
-                elif p == 'k':
-                    self.king_pos[1] = (r, c)
+        self.rank_occ = [0] * ROWS
+        self.file_occ = [0] * COLS
+        self.init_piece_lists()
+        for sq in BOARD_SQUARES:
+            p = self.board[sq]
+            if p != EMPTY:
+                self.current_score += PIECE_SQUARE_SCORE[p][sq]
+                self.current_hash ^= ZOBRIST_KEYS[sq * ZOBRIST_PIECES + p]
+                self.rank_occ[SQ_ROW[sq]] |= 1 << SQ_COL[sq]
+                self.file_occ[SQ_COL[sq]] |= 1 << SQ_ROW[sq]
+            if p == RED | KING:
+                self.king_pos[0] = sq
+            elif p == BLACK | KING:
+                self.king_pos[1] = sq
                     
         
         # 如果初始是黑方走，需要异或 turn 的随机数（通常开局是红方，不做处理）
         if self.turn == 'black':
             self.current_hash ^= self.zobrist_turn
         self.hash_count = {self.current_hash: 1}
-    def piece_places_remove(self,p,r,c):
-        self.piece_places[int(not self.is_red(p))].remove((r,c))
-    def piece_places_add(self,p,r,c):
-        self.piece_places[int(not self.is_red(p))].add((r,c))
+        self.init_taper_scores()
+        if self.use_nnue:
+            self.nnue_acc = self.nnue.refresh(self.board)
+            self.nnue_stack = []
+
+    def set_nnue(self, path):
+        """运行时切换 NNUE 评估：path 为权重文件，None / 'off' 关闭。成功返回 True"""
+        if path is None or path == "off":
+            self.use_nnue = False
+        else:
+            try:
+                self.nnue = NNUEEvaluator(path)
+            except Exception as e:
+                print(f"无法加载 NNUE 权重: {e}", file=sys.stderr, flush=True)
+                return False
+            self.use_nnue = True
+            self.nnue_file = path
+            self.nnue_acc = self.nnue.refresh(self.board)
+            self.nnue_stack = []
+        self.eval_cache_keys = [-1] * EVAL_CACHE_SIZE # 评估函数变了，旧的缓存作废
+        return True
+
+    def sync_eval_options(self, use_tapered, nnue_file):
+        """并行搜索的子进程照主进程的评估设置切换 (渐进式评估 / NNUE 权重)，之后要 load_fen 重算分项"""
+        if nnue_file != (self.nnue_file if self.use_nnue else None):
+            self.set_nnue(nnue_file)
+        if use_tapered != self.use_tapered:
+            self.use_tapered = use_tapered
+            self.eval_cache_keys = [-1] * EVAL_CACHE_SIZE
+
+    def init_taper_scores(self):
+        """从棋盘重新累加渐进式评估的各分项"""
+        taper = [0] * TAPER_TERMS
+        for side in (0, 1):
+            for sq in self.piece_list[side]:
+                if not sq: continue
+                p = self.board[sq]
+                for idx, table in TAPER_PLACE_TERMS[p]: taper[idx] += table[sq]
+                for idx, v in TAPER_CAPTURE_TERMS[p]: taper[idx] += v
+        self.taper = taper
+    def init_piece_lists(self):
+        """
+        按 PIECE_LIST_ORDER 的兵种顺序给双方棋子分配槽位。
+        象棋没有升变，兵种占的槽位段 slot_ranges 之后就不会再变了。
+        """
+        self.piece_list = [[0] * PIECE_LIST_SIZE, [0] * PIECE_LIST_SIZE]
+        self.piece_index = [0] * BOARD_SIZE
+        self.captured_slots = []
+        self.slot_ranges = [[(0, 0)] * (TYPE_MASK + 1), [(0, 0)] * (TYPE_MASK + 1)]
+        self.piece_count = [0] * COLOR_MASK
+        board = self.board
+        for side in (0, 1):
+            plist = self.piece_list[side]
+            n = 0
+            for pt in PIECE_LIST_ORDER:
+                p = SIDE_COLOR[side] | pt
+                lo = n
+                for sq in BOARD_SQUARES:
+                    if board[sq] == p:
+                        plist[n] = sq
+                        self.piece_index[sq] = n
+                        n += 1
+                self.slot_ranges[side][pt] = (lo, n)
+                self.piece_count[p] = n - lo
         
     
-    def make_move(self, start, end):
-        r1, c1 = start
-        r2, c2 = end
-        moving_piece = self.board[r1][c1]
-        captured_piece = self.board[r2][c2]
+    def make_move(self, move):
+        start, end = move & MOVE_MASK, move >> MOVE_BITS
+        board = self.board
+        moving_piece = board[start]
+        captured_piece = board[end]
         # --- 新增：更新 king_pos ---
-        if moving_piece == 'K':
-            self.king_pos[0] = (r2, c2)
-        elif moving_piece == 'k':
-            self.king_pos[1] = (r2, c2)
-        if captured_piece == 'K':
-            self.king_pos[0] = None
-        elif captured_piece == 'k':
-            self.king_pos[1] = None
+        if moving_piece & TYPE_MASK == KING:
+            self.king_pos[0 if moving_piece & RED else 1] = end
+        if captured_piece & TYPE_MASK == KING:
+            self.king_pos[0 if captured_piece & RED else 1] = None
         # --- 新增结束 ---
         
         # 1. 更新分数 (增量)
-        self.current_score -= self.get_piece_value(moving_piece, r1, c1)
-        self.piece_places_remove(moving_piece,r1,c1)
-        if captured_piece != '.':
-            self.current_score -= self.get_piece_value(captured_piece, r2, c2)
-            self.piece_places_remove(captured_piece,r2,c2)
-        self.current_score += self.get_piece_value(moving_piece, r2, c2)
-        self.piece_places_add(moving_piece, r2, c2)
+        table = PIECE_SQUARE_SCORE[moving_piece]
+        self.current_score += table[end] - table[start]
+        piece_index = self.piece_index
+        if captured_piece != EMPTY:
+            self.current_score -= PIECE_SQUARE_SCORE[captured_piece][end]
+            slot = piece_index[end]
+            self.piece_list[0 if captured_piece & RED else 1][slot] = 0
+            self.captured_slots.append(slot)
+            self.piece_count[captured_piece] -= 1
+        slot = piece_index[start]
+        self.piece_list[0 if moving_piece & RED else 1][slot] = end
+        piece_index[end] = slot
+        if self.use_tapered:
+            taper = self.taper
+            for idx, table in TAPER_PLACE_TERMS[moving_piece]: taper[idx] += table[end] - table[start]
+            if captured_piece != EMPTY:
+                for idx, table in TAPER_PLACE_TERMS[captured_piece]: taper[idx] -= table[end]
+                for idx, v in TAPER_CAPTURE_TERMS[captured_piece]: taper[idx] -= v
+        if self.use_nnue:
+            rows = self.nnue.rows
+            acc = self.nnue_acc
+            self.nnue_stack.append(acc)
+            if captured_piece != EMPTY:
+                self.nnue_acc = [a + x - y - z for a, x, y, z in
+                                 zip(acc, rows[moving_piece][end], rows[moving_piece][start], rows[captured_piece][end])]
+            else:
+                self.nnue_acc = [a + x - y for a, x, y in zip(acc, rows[moving_piece][end], rows[moving_piece][start])]
         # 2. 更新 Hash (核心优化: XOR 是可逆的)
-        # 移出起点棋子
-        self.current_hash ^= self.zobrist_table[(r1, c1, moving_piece)]
+        # 移出起点棋子、移入终点棋子、切换行动方
+        h = self.current_hash ^ ZOBRIST_KEYS[start * ZOBRIST_PIECES + moving_piece] ^ ZOBRIST_KEYS[end * ZOBRIST_PIECES + moving_piece] ^ ZOBRIST_TURN
         # 如果终点有子，移出被吃棋子
-        if captured_piece != '.':
-            self.current_hash ^= self.zobrist_table[(r2, c2, captured_piece)]
-        # 移入终点棋子
-        self.current_hash ^= self.zobrist_table[(r2, c2, moving_piece)]
-        # 切换行动方 Hash
-        self.current_hash ^= self.zobrist_turn
-
-        # 3. 执行移动
-        self.board[r2][c2] = moving_piece
-        self.board[r1][c1] = '.'
+        if captured_piece != EMPTY:
+            h ^= ZOBRIST_KEYS[end * ZOBRIST_PIECES + captured_piece]
+        self.current_hash = h
+
+        # 3. 执行移动 (同时更新行列占位掩码，吃子时终点本来就有子)
+        board[end] = moving_piece
+        board[start] = EMPTY
+        r1, c1 = SQ_ROW[start], SQ_COL[start]
+        self.rank_occ[r1] ^= 1 << c1
+        self.file_occ[c1] ^= 1 << r1
+        if captured_piece == EMPTY:
+            r2, c2 = SQ_ROW[end], SQ_COL[end]
+            self.rank_occ[r2] |= 1 << c2
+            self.file_occ[c2] |= 1 << r2
         self.turn = 'black' if self.turn == 'red' else 'red'
         self.hash_count[self.current_hash] = self.hash_count.get(self.current_hash, 0) + 1
 
         return captured_piece
 
-    def undo_move(self, start, end, captured):
-        self.hash_count[self.current_hash] -= 1
-        r1, c1 = start
-        r2, c2 = end
-        moved_piece = self.board[r2][c2]
+    def undo_move(self, move, captured):
+        # 计数归零就删掉，否则深搜 / perft 时这个表会无限长大
+        cnt = self.hash_count[self.current_hash] - 1
+        if cnt: self.hash_count[self.current_hash] = cnt
+        else: del self.hash_count[self.current_hash]
+        start, end = move & MOVE_MASK, move >> MOVE_BITS
+        board = self.board
+        moved_piece = board[end]
 
         # --- 新增：恢复 king_pos ---
-        if moved_piece == 'K':
-            self.king_pos[0] = (r1, c1)
-        elif moved_piece == 'k':
-            self.king_pos[1] = (r1, c1)
-
-        if captured == 'K':
-            self.king_pos[0] = (r2, c2)
-        elif captured == 'k':
-            self.king_pos[1] = (r2, c2)
+        if moved_piece & TYPE_MASK == KING:
+            self.king_pos[0 if moved_piece & RED else 1] = start
+        if captured & TYPE_MASK == KING:
+            self.king_pos[0 if captured & RED else 1] = end
         # --- 新增结束 ---
         # 1. 还原分数
-        self.current_score -= self.get_piece_value(moved_piece, r2, c2)
-        self.piece_places_remove(moved_piece, r2, c2)
-        self.current_score += self.get_piece_value(moved_piece, r1, c1)
-        self.piece_places_add(moved_piece, r1, c1)
-        if captured != '.':
-            self.current_score += self.get_piece_value(captured, r2, c2)
-            self.piece_places_add(captured, r2, c2)
+        table = PIECE_SQUARE_SCORE[moved_piece]
+        self.current_score += table[start] - table[end]
+        piece_index = self.piece_index
+        slot = piece_index[end]
+        self.piece_list[0 if moved_piece & RED else 1][slot] = start
+        piece_index[start] = slot
+        if captured != EMPTY:
+            self.current_score += PIECE_SQUARE_SCORE[captured][end]
+            slot = self.captured_slots.pop()
+            self.piece_list[0 if captured & RED else 1][slot] = end
+            piece_index[end] = slot
+            self.piece_count[captured] += 1
+        if self.use_tapered:
+            taper = self.taper
+            for idx, table in TAPER_PLACE_TERMS[moved_piece]: taper[idx] += table[start] - table[end]
+            if captured != EMPTY:
+                for idx, table in TAPER_PLACE_TERMS[captured]: taper[idx] += table[end]
+                for idx, v in TAPER_CAPTURE_TERMS[captured]: taper[idx] += v
+        if self.use_nnue:
+            self.nnue_acc = self.nnue_stack.pop()
 
         # 2. 还原 Hash (操作完全对称)
-        self.current_hash ^= self.zobrist_turn # 换回原来的行动方
-        self.current_hash ^= self.zobrist_table[(r2, c2, moved_piece)] # 移出终点
-        if captured != '.':
-            self.current_hash ^= self.zobrist_table[(r2, c2, captured)] # 加回被吃子
-        self.current_hash ^= self.zobrist_table[(r1, c1, moved_piece)] # 加回起点
+        # 换回原来的行动方、移出终点、加回起点
+        h = self.current_hash ^ ZOBRIST_TURN ^ ZOBRIST_KEYS[end * ZOBRIST_PIECES + moved_piece] ^ ZOBRIST_KEYS[start * ZOBRIST_PIECES + moved_piece]
+        if captured != EMPTY:
+            h ^= ZOBRIST_KEYS[end * ZOBRIST_PIECES + captured] # 加回被吃子
+        self.current_hash = h
 
         # 3. 还原棋盘
-        self.board[r1][c1] = moved_piece
-        self.board[r2][c2] = captured
+        board[start] = moved_piece
+        board[end] = captured
+        r1, c1 = SQ_ROW[start], SQ_COL[start]
+        self.rank_occ[r1] |= 1 << c1
+        self.file_occ[c1] |= 1 << r1
+        if captured == EMPTY:
+            r2, c2 = SQ_ROW[end], SQ_COL[end]
+            self.rank_occ[r2] ^= 1 << c2
+            self.file_occ[c2] ^= 1 << r2
         self.turn = 'black' if self.turn == 'red' else 'red'
+    def get_structure_score(self):
+        """连兵 + 士象全 (红正黑负)：连兵只看兵的位置，士象全只看子数"""
+        score = 0
+        board = self.board
+        plists, slot_ranges = self.piece_list, self.slot_ranges
+        # --- A. 连兵判断 (过河兵) ---
+        # 检查左右是否有友军只检查一侧即可
+        red_pawn, black_pawn = RED | PAWN, BLACK | PAWN
+        lo, hi = slot_ranges[0][PAWN]
+        for sq in plists[0][lo:hi]:
+            if sq and SQ_ROW[sq] <= 4 and board[sq + LEFT] == red_pawn: score += EV_LINKED_PAWNS
+        lo, hi = slot_ranges[1][PAWN]
+        for sq in plists[1][lo:hi]:
+            if sq and SQ_ROW[sq] >= 5 and board[sq + LEFT] == black_pawn: score -= EV_LINKED_PAWNS
+
+        # --- D. 士象全 (Full Guards) ---
+        piece_count = self.piece_count
+        if piece_count[RED | ADVISOR] == 2 and piece_count[RED | BISHOP] == 2: score += EV_FULL_GUARDS
+        if piece_count[BLACK | ADVISOR] == 2 and piece_count[BLACK | BISHOP] == 2: score -= EV_FULL_GUARDS
+        return score
+
     def get_relation_score(self):
         """
         核心重构：计算棋形、关系、威胁和防守
+        不再扫描整个棋盘：按兵种直接取棋子列表里的那一段 (slot_ranges)，
+        炮与老将之间的子数用列占位掩码数。
         """
-        score = 0
+        board = self.board
+        plists, slot_ranges = self.piece_list, self.slot_ranges
         
         # 1. 寻找双方老将位置
         red_king = self.find_king(True)
         black_king = self.find_king(False)
-        
-        # 临时统计：[红方计数, 黑方计数]
-        # 士/象的数量
-        guards = {'a': 0, 'b': 0, 'A': 0, 'B': 0}
-        # 攻击老将的大子数量
-        attack_units = [0, 0] # red_attackers, black_attackers
-
-        # 2. 全局扫描 (为了性能，尽量在一个循环内完成)
-        # 我们按列扫描，这样容易判断“空头炮”和“兵及其阻挡”
-        
-        # 用于记录每一列是否有红/黑的炮、兵
-        cols_summary = [ {'R_cannon':0, 'B_cannon':0, 'pieces':[]} for _ in range(COLS) ]
-
-        for c in range(COLS):
-            col_pieces = []
-            for r in range(ROWS):
-                p = self.board[r][c]
-                if p != '.':
-                    col_pieces.append((r, p))
-                    # 统计士象数量
-                    if p in guards: guards[p] += 1
-            
-            cols_summary[c]['pieces'] = col_pieces
-            
-            # 分析每一列的特殊棋形
-            for idx, (r, p) in enumerate(col_pieces):
-                # --- A. 连兵判断 (过河兵) ---
-                if p == 'P' and r <= 4: # 红兵过河
-                    # 检查左右是否有友军只检查一侧即可
-                    if c > 0 and self.board[r][c-1] == 'P': score += EV_LINKED_PAWNS
-                elif p == 'p' and r >= 5: # 黑卒过河
-                    if c > 0 and self.board[r][c-1] == 'p': score -= EV_LINKED_PAWNS
-
-                # --- B. 记录炮的位置，用于后续空头炮判断 ---
-                if p == 'C': cols_summary[c]['R_cannon'] += 1
-                if p == 'c': cols_summary[c]['B_cannon'] += 1
-
-        # 3. 详细阵型判断
-        
-        # --- C. 空头炮与中炮 (Central & Hollow Cannon) ---
-        # 检查中路 (Col 4)
-        mid_info = cols_summary[4]
-        mid_pieces = mid_info['pieces']
-        
-        # 红方中炮/空头炮
-        if mid_info['R_cannon'] > 0:
-            # 找到红炮位置
-            c_idx = -1
-            for i, (r, p) in enumerate(mid_pieces):
-                if p == 'C': c_idx = i; break
-            
-            if c_idx != -1:
-                # 检查红炮前方是否有阻碍 (黑将之前的阻碍)
-                # 简单近似：如果黑将也在中路
-                if black_king and black_king[1] == 4:
-                    blockers = 0
-                    # 统计炮和黑将之间的子
-                    low, high = min(mid_pieces[c_idx][0], black_king[0]), max(mid_pieces[c_idx][0], black_king[0])
-                    for check_r in range(low + 1, high):
-                        if self.board[check_r][4] != '.': blockers += 1
-                    
-                    if blockers == 0: score += EV_HOLLOW_CANNON  # 空头炮！致命
-                    elif blockers <=2: score += EV_CENTRAL_CANNON # 中炮
-        
-        # 黑方中炮/空头炮
-        if mid_info['B_cannon'] > 0:
-            c_idx = -1
-            for i, (r, p) in enumerate(mid_pieces):
-                if p == 'c': c_idx = i; break
-            
-            if c_idx != -1:
-                if red_king and red_king[1] == 4:
-                    blockers = 0
-                    # 统计炮和黑将之间的子
-                    low, high = min(mid_pieces[c_idx][0], red_king[0]), max(mid_pieces[c_idx][0], red_king[0])
-                    for check_r in range(low + 1, high):
-                        if self.board[check_r][4] != '.': blockers += 1
-                    
-                    if blockers == 0: score -= EV_HOLLOW_CANNON
-                    elif blockers <=2: score -= EV_CENTRAL_CANNON
 
-        # --- D. 士象全 (Full Guards) ---
-        if guards['A'] == 2 and guards['B'] == 2: score += EV_FULL_GUARDS
-        if guards['a'] == 2 and guards['b'] == 2: score -= EV_FULL_GUARDS
+        # --- A/D. 结构分：连兵 + 士象全 ---
+        score = self.get_structure_score()
+
+        # --- B/C. 空头炮与中炮 (Central & Hollow Cannon) ---
+        # 中路 (Col 4) 最靠上的己方炮，与中路上的敌方老将之间有几个子
+        file_mid = self.file_occ[4]
+        for side, enemy_king, bonus in ((0, black_king, 1), (1, red_king, -1)):
+            if enemy_king is None or SQ_COL[enemy_king] != 4: continue
+            mid_cannon = 0
+            lo, hi = slot_ranges[side][CANNON]
+            for sq in plists[side][lo:hi]:
+                if sq and SQ_COL[sq] == 4 and (not mid_cannon or sq < mid_cannon): mid_cannon = sq
+            if not mid_cannon: continue
+            r1, r2 = SQ_ROW[mid_cannon], SQ_ROW[enemy_king]
+            if r1 > r2: r1, r2 = r2, r1
+            blockers = (file_mid & ((1 << r2) - (2 << r1))).bit_count()
+            if blockers == 0: score += EV_HOLLOW_CANNON * bonus  # 空头炮！致命
+            elif blockers <= 2: score += EV_CENTRAL_CANNON * bonus # 中炮
 
         # 4. 机动性 (Mobility) 与 局部威胁
         # 这一步比较耗时，我们简化计算：只计算车马炮
         # 并且只计算"有多少个合法的落子点"
+        rank_occ, file_occ = self.rank_occ, self.file_occ
+        mob_rook, mob_knight, mob_cannon = EV_MOBILITY['r'], EV_MOBILITY['n'], EV_MOBILITY['c']
         
-        # 遍历棋盘大子
-        for r in range(ROWS):
-            for c in range(COLS):
-                p = self.board[r][c]
-                if p == '.': continue
-                
-                low_p = p.lower()
-                if low_p not in ['r', 'n', 'c']: continue
-                
-                is_red_p = self.is_red(p)
-                factor = 1 if is_red_p else -1
+        # 遍历双方大子 (车炮马在棋子列表里连成一段)
+        for side in (0, 1):
+            own = SIDE_COLOR[side]
+            factor = 1 if side == 0 else -1
+            enemy_king = black_king if side == 0 else red_king
+            ranges = slot_ranges[side]
+            plist = plists[side]
+            side_score = 0
+            major = []
                 
-                # 4.1 简单的机动性计算
+            # 车：沿直线扫描 (第一个碰到的子不论敌我都算一个控制点)
+            lo, hi = ranges[ROOK]
+            for sq in plist[lo:hi]:
+                if not sq: continue
+                major.append(sq)
+                r, c = SQ_ROW[sq], SQ_COL[sq]
+                rank_mask, file_mask = rank_occ[r], file_occ[c]
+                moves_cnt = (len(RANK_ROOK_MOVES[c][rank_mask]) + len(RANK_ROOK_CAPS[c][rank_mask]) +
+                             len(FILE_ROOK_MOVES[r][file_mask]) + len(FILE_ROOK_CAPS[r][file_mask]))
+                # 惩罚：如果车被困在角落且不动 (例如没得动)
+                if moves_cnt < 2: side_score += EV_ROOK_TRAPPED
+                side_score += moves_cnt * mob_rook
+
+            # 炮：炮的机动性稍微低一点权重，更多看位置，吃子另算
+            lo, hi = ranges[CANNON]
+            for sq in plist[lo:hi]:
+                if not sq: continue
+                major.append(sq)
+                r, c = SQ_ROW[sq], SQ_COL[sq]
+                side_score += (len(RANK_ROOK_MOVES[c][rank_occ[r]]) + len(FILE_ROOK_MOVES[r][file_occ[c]])) * mob_cannon
+
+            # 马：由 get_valid_moves 逻辑简化
+            lo, hi = ranges[KNIGHT]
+            for sq in plist[lo:hi]:
+                if not sq: continue
+                major.append(sq)
                 moves_cnt = 0
+                for to, leg in KNIGHT_MOVES[sq]:
+                    if board[leg] == EMPTY and not (board[to] & own):
+                        moves_cnt += 1
+                side_score += moves_cnt * mob_knight
                 
-                # 车：沿直线扫描
-                if low_p == 'r':
-                    for dr, dc in [(0,1), (0,-1), (1,0), (-1,0)]:
-                        tr, tc = r+dr, c+dc
-                        while 0 <= tr < ROWS and 0 <= tc < COLS:
-                            moves_cnt += 1
-                            if self.board[tr][tc] != '.': break
-                            tr, tc = tr+dr, tc+dc
-                    
-                    # 惩罚：如果车被困在角落且不动 (例如没得动)
-                    if moves_cnt < 2: score += (EV_ROOK_TRAPPED * factor)
-
-                # 马：由 get_valid_moves 逻辑简化
-                elif low_p == 'n':
-                    for dr, dc, lr, lc in [(-2,-1,-1,0), (-2,1,-1,0), (2,-1,1,0), (2,1,1,0),
-                                           (-1,-2,0,-1), (1,-2,0,-1), (-1,2,0,1), (1,2,0,1)]:
-                        nr, nc, leg_r, leg_c = r+dr, c+dc, r+lr, c+lc
-                        if 0<=nr<ROWS and 0<=nc<COLS and self.board[leg_r][leg_c] == '.':
-                            # 如果落点是友军，虽不能走，但算作保护，机动性算一半
-                            target = self.board[nr][nc]
-                            if target == '.' or self.is_red(target) != is_red_p:
-                                moves_cnt += 1
-                
-                # 炮：
-                elif low_p == 'c':
-                    # 炮的机动性稍微低一点权重，更多看位置
-                    for dr, dc in [(0,1), (0,-1), (1,0), (-1,0)]:
-                        tr, tc = r+dr, c+dc
-                        while 0 <= tr < ROWS and 0 <= tc < COLS:
-                            if self.board[tr][tc] == '.': moves_cnt += 1
-                            else: break # 炮主要看移动，吃子另算
-                            tr, tc = tr+dr, tc+dc
-
-                score += moves_cnt * EV_MOBILITY[low_p] * factor
-                
-                # 4.2 将帅安全 (King Safety)
-                # 如果这个大子在敌方老将附近的“九宫扩展区”内，加分
-                if is_red_p and black_king:
-                    kr, kc = black_king
-                    if abs(r - kr) + abs(c - kc) <= 3: # 曼哈顿距离小于3
-                        score += EV_ATTACK_KING
-                elif not is_red_p and red_king:
-                    kr, kc = red_king
-                    if abs(r - kr) + abs(c - kc) <= 3:
-                        score -= EV_ATTACK_KING
+            # 4.2 将帅安全 (King Safety)
+            # 如果这个大子在敌方老将附近的“九宫扩展区”内，加分
+            if enemy_king is not None:
+                kr, kc = SQ_ROW[enemy_king], SQ_COL[enemy_king]
+                for sq in major:
+                    if abs(SQ_ROW[sq] - kr) + abs(SQ_COL[sq] - kc) <= 3: # 曼哈顿距离小于3
+                        side_score += EV_ATTACK_KING
+
+            score += side_score * factor
 
         return score
 
     def is_red(self, piece):
-        return piece.isupper()
+        return bool(piece & RED)
 
     def in_board(self, r, c):
         return 0 <= r < ROWS and 0 <= c < COLS
 
     # --- 走法生成 (标准逻辑) ---
-    def get_valid_moves(self, r, c):
-        piece = self.board[r][c]
+    def get_valid_moves(self, sq):
+        board = self.board
+        piece = board[sq]
         moves = []
-        if piece == '.': return moves
-        is_red_piece = self.is_red(piece)
-        
-        def is_teammate(nr, nc):
-            p = self.board[nr][nc]
-            return p != '.' and self.is_red(p) == is_red_piece
-
-        # 车
-        if piece.lower() == 'r':
-            for dr, dc in [(0,1),(0,-1),(1,0),(-1,0)]:
-                nr, nc = r+dr, c+dc
-                while self.in_board(nr, nc):
-                    if self.board[nr][nc] == '.': moves.append((nr, nc))
-                    else:
-                        if not is_teammate(nr, nc): moves.append((nr, nc))
-                        break
-                    nr, nc = nr+dr, nc+dc
+        if piece == EMPTY: return moves
+        side = 0 if piece & RED else 1
+        own = SIDE_COLOR[side]
+        opp = own ^ COLOR_MASK
+        pt = piece & TYPE_MASK
+        # 注：board[to] & own 为真 = 己方棋子或出界
+
+        # 车 / 炮：查滑动表
+        if pt == ROOK or pt == CANNON:
+            r, c = SQ_ROW[sq], SQ_COL[sq]
+            rank_mask, file_mask = self.rank_occ[r], self.file_occ[c]
+            for d in RANK_ROOK_MOVES[c][rank_mask]: moves.append(sq + d)
+            for d in FILE_ROOK_MOVES[r][file_mask]: moves.append(sq + d)
+            if pt == ROOK:
+                rank_caps, file_caps = RANK_ROOK_CAPS[c][rank_mask], FILE_ROOK_CAPS[r][file_mask]
+            else: # 炮：隔一个炮架吃子
+                rank_caps, file_caps = RANK_CANNON_CAPS[c][rank_mask], FILE_CANNON_CAPS[r][file_mask]
+            for d in rank_caps:
+                if board[sq + d] & COLOR_MASK == opp: moves.append(sq + d)
+            for d in file_caps:
+                if board[sq + d] & COLOR_MASK == opp: moves.append(sq + d)
         # 马 (带撇脚)
-        elif piece.lower() == 'n':
-            for dr, dc, lr, lc in [(-2,-1,-1,0), (-2,1,-1,0), (2,-1,1,0), (2,1,1,0),
-                                   (-1,-2,0,-1), (1,-2,0,-1), (-1,2,0,1), (1,2,0,1)]:
-                nr, nc, lr, lc = r+dr, c+dc, r+lr, c+lc
-                if self.in_board(nr, nc) and self.board[lr][lc] == '.' and not is_teammate(nr, nc):
-                    moves.append((nr, nc))
-        # 炮
-        elif piece.lower() == 'c':
-            for dr, dc in [(0,1),(0,-1),(1,0),(-1,0)]:
-                nr, nc = r+dr, c+dc
-                platform = False
-                while self.in_board(nr, nc):
-                    if self.board[nr][nc] == '.':
-                        if not platform: moves.append((nr, nc))
-                    else:
-                        if not platform: platform = True
-                        else:
-                            if not is_teammate(nr, nc): moves.append((nr, nc))
-                            break
-                    nr, nc = nr+dr, nc+dc
-        # 相/象
-        elif piece.lower() == 'b':
-            for dr, dc, er, ec in [(-2,-2,-1,-1), (-2,2,-1,1), (2,-2,1,-1), (2,2,1,1)]:
-                nr, nc, er, ec = r+dr, c+dc, r+er, c+ec
-                if self.in_board(nr, nc) and self.board[er][ec] == '.' and not is_teammate(nr, nc):
-                    if (is_red_piece and nr>=5) or (not is_red_piece and nr<=4):
-                        moves.append((nr, nc))
-        # 士/仕
-        elif piece.lower() == 'a':
-            for dr, dc in [(-1,-1),(-1,1),(1,-1),(1,1)]:
-                nr, nc = r+dr, c+dc
-                if self.in_board(nr, nc) and 3<=nc<=5 and not is_teammate(nr, nc):
-                    if (is_red_piece and 7<=nr<=9) or (not is_red_piece and 0<=nr<=2):
-                        moves.append((nr, nc))
+        elif pt == KNIGHT:
+            for to, leg in KNIGHT_MOVES[sq]:
+                if board[leg] == EMPTY and not (board[to] & own):
+                    moves.append(to)
+        # 相/象 (表里已排除过河)
+        elif pt == BISHOP:
+            for to, eye in BISHOP_MOVES[side][sq]:
+                if board[eye] == EMPTY and not (board[to] & own):
+                    moves.append(to)
+        # 士/仕 (表里已限制在九宫)
+        elif pt == ADVISOR:
+            for to in ADVISOR_MOVES[side][sq]:
+                if not (board[to] & own):
+                    moves.append(to)
         # 帅/将
-        elif piece.lower() == 'k':
-            for dr, dc in [(0,1),(0,-1),(1,0),(-1,0)]:
-                nr, nc = r+dr, c+dc
-                if self.in_board(nr, nc) and 3<=nc<=5 and not is_teammate(nr, nc):
-                    if (is_red_piece and 7<=nr<=9) or (not is_red_piece and 0<=nr<=2):
-                        moves.append((nr, nc))
+        elif pt == KING:
+            for to in KING_MOVES[side][sq]:
+                if not (board[to] & own):
+                    moves.append(to)
             # 2. 飞将逻辑 (King Facing King)
-            # 红方向上找(-1)，黑方向下找(+1)
-            direction = -1 if is_red_piece else 1
-            check_r = r + direction
-            
-            while 0 <= check_r < ROWS:
-                target_piece = self.board[check_r][c]
-                if target_piece == '.':
-                    # 如果是空地，继续往前看
-                    check_r += direction
-                else:
-                    # 碰到棋子了
-                    # 如果碰到的是敌方的将/帅，说明可以飞将！
-                    enemy_king = 'k' if is_red_piece else 'K'
-                    if target_piece == enemy_king:
-                        moves.append((check_r, c))
-                    # 无论碰到什么子（不管是敌是友，还是敌方老将），
-                    # 只要中间有阻隔或已经找到了老将，搜索就结束
-                    break
-        # 兵/卒
-        elif piece.lower() == 'p':
-            dr = -1 if is_red_piece else 1
-            if self.in_board(r+dr, c) and not is_teammate(r+dr, c): moves.append((r+dr, c))
-            if (is_red_piece and r<=4) or (not is_red_piece and r>=5): # 过河后允许平移
-                for dc in [-1, 1]:
-                    if self.in_board(r, c+dc) and not is_teammate(r, c+dc): moves.append((r, c+dc))
+            # 同列上碰到的第一个子是敌方老将，就可以飞将
+            for d in FILE_ROOK_CAPS[SQ_ROW[sq]][self.file_occ[SQ_COL[sq]]]:
+                if board[sq + d] == opp | KING:
+                    moves.append(sq + d)
+        # 兵/卒 (表里已处理过河平移)
+        elif pt == PAWN:
+            for to in PAWN_MOVES[side][sq]:
+                if not (board[to] & own):
+                    moves.append(to)
         return moves
 
     def get_all_moves(self, is_red_turn,only_captures=False):
         moves = []
-        for place in self.piece_places[int(not is_red_turn)]:
-            r,c=place
-            p = self.board[r][c]
-            ms = self.get_valid_moves(r, c)
-            for m in ms: 
-                if (not only_captures) or (self.board[m[0]][m[1]] != '.'):
-                    moves.append(((r,c), m))
+        board = self.board
+        for sq in self.piece_list[0 if is_red_turn else 1]:
+            if not sq: continue
+            for to in self.get_valid_moves(sq):
+                if (not only_captures) or board[to] != EMPTY:
+                    moves.append(sq | (to << MOVE_BITS))
         return moves
 
+    def get_capture_moves(self, is_red_turn):
+        """
+        只生成吃子走法，并且生成出来就是 MVV-LVA 顺序，不用再排序：
+        己方棋子按 兵、士、象、马、炮、车、帅 (LVA) 的顺序只找吃子落点，
+        落点按被吃子兵种分桶，最后按 车 > 马 > 炮 > 士 > 象 > 兵 (MVV) 的顺序拼起来。
+        不生成吃将的走法 (合法局面里轮到己方走时不可能出现)。
+        """
+        board = self.board
+        side = 0 if is_red_turn else 1
+        opp = SIDE_COLOR[side] ^ COLOR_MASK
+        rank_occ, file_occ = self.rank_occ, self.file_occ
+
+        # 己方棋子按兵种分组
+        attackers = [[] for _ in range(TYPE_MASK + 1)]
+        for sq in self.piece_list[side]:
+            if sq: attackers[board[sq] & TYPE_MASK].append(sq)
+        buckets = [[] for _ in range(TYPE_MASK + 1)] # 按被吃子兵种分桶
+
+        for sq in attackers[PAWN]:
+            for to in PAWN_MOVES[side][sq]:
+                if board[to] & COLOR_MASK == opp: buckets[board[to] & TYPE_MASK].append(sq | (to << MOVE_BITS))
+        for sq in attackers[ADVISOR]:
+            for to in ADVISOR_MOVES[side][sq]:
+                if board[to] & COLOR_MASK == opp: buckets[board[to] & TYPE_MASK].append(sq | (to << MOVE_BITS))
+        for sq in attackers[BISHOP]:
+            for to, eye in BISHOP_MOVES[side][sq]:
+                if board[to] & COLOR_MASK == opp and board[eye] == EMPTY:
+                    buckets[board[to] & TYPE_MASK].append(sq | (to << MOVE_BITS))
+        for sq in attackers[KNIGHT]:
+            for to, leg in KNIGHT_MOVES[sq]:
+                if board[to] & COLOR_MASK == opp and board[leg] == EMPTY:
+                    buckets[board[to] & TYPE_MASK].append(sq | (to << MOVE_BITS))
+        for pt in (CANNON, ROOK):
+            rank_caps, file_caps = (RANK_CANNON_CAPS, FILE_CANNON_CAPS) if pt == CANNON else (RANK_ROOK_CAPS, FILE_ROOK_CAPS)
+            for sq in attackers[pt]:
+                r, c = SQ_ROW[sq], SQ_COL[sq]
+                for d in rank_caps[c][rank_occ[r]]:
+                    if board[sq + d] & COLOR_MASK == opp: buckets[board[sq + d] & TYPE_MASK].append(sq | ((sq + d) << MOVE_BITS))
+                for d in file_caps[r][file_occ[c]]:
+                    if board[sq + d] & COLOR_MASK == opp: buckets[board[sq + d] & TYPE_MASK].append(sq | ((sq + d) << MOVE_BITS))
+        for sq in attackers[KING]:
+            for to in KING_MOVES[side][sq]:
+                if board[to] & COLOR_MASK == opp: buckets[board[to] & TYPE_MASK].append(sq | (to << MOVE_BITS))
+
+        moves = []
+        for victim_type in CAPTURE_VICTIM_ORDER:
+            moves += buckets[victim_type]
+        return moves
+
+    def get_quiet_moves(self, is_red_turn):
+        """只生成不吃子的走法 (分阶段出步的最后一段用)"""
+        moves = []
+        board = self.board
+        side = 0 if is_red_turn else 1
+        rank_occ, file_occ = self.rank_occ, self.file_occ
+        for sq in self.piece_list[side]:
+            if not sq: continue
+            pt = board[sq] & TYPE_MASK
+            if pt == ROOK or pt == CANNON:
+                r, c = SQ_ROW[sq], SQ_COL[sq]
+                for d in RANK_ROOK_MOVES[c][rank_occ[r]]: moves.append(sq | ((sq + d) << MOVE_BITS))
+                for d in FILE_ROOK_MOVES[r][file_occ[c]]: moves.append(sq | ((sq + d) << MOVE_BITS))
+            elif pt == KNIGHT:
+                for to, leg in KNIGHT_MOVES[sq]:
+                    if board[to] == EMPTY and board[leg] == EMPTY: moves.append(sq | (to << MOVE_BITS))
+            elif pt == BISHOP:
+                for to, eye in BISHOP_MOVES[side][sq]:
+                    if board[to] == EMPTY and board[eye] == EMPTY: moves.append(sq | (to << MOVE_BITS))
+            else:
+                if pt == PAWN: targets = PAWN_MOVES[side][sq]
+                elif pt == ADVISOR: targets = ADVISOR_MOVES[side][sq]
+                else: targets = KING_MOVES[side][sq]
+                for to in targets:
+                    if board[to] == EMPTY: moves.append(sq | (to << MOVE_BITS))
+        return moves
+
+    def is_pseudo_legal(self, move, is_red_turn):
+        """
+        TT / 杀手走法是从别的局面存下来的 (或者 Hash 撞车)，不生成走法，直接按兵种核对这一步在当前局面能不能走：
+        起点是己方棋子、落点不是己方棋子，再查 马腿 / 象眼 / 九宫 / 河界 / 车炮路径上的子数。
+        不管走完是否送将 (那是 legal 的事)。
+        """
+        start, end = move & MOVE_MASK, move >> MOVE_BITS
+        board = self.board
+        piece = board[start]
+        side = 0 if is_red_turn else 1
+        own = SIDE_COLOR[side]
+        if piece & COLOR_MASK != own or board[end] & own: # 也挡掉了空格 / 出界
+            return False
+        pt = piece & TYPE_MASK
+        d = end - start + DELTA_OFFSET
+        if pt == ROOK or pt == CANNON:
+            r1, c1, r2, c2 = SQ_ROW[start], SQ_COL[start], SQ_ROW[end], SQ_COL[end]
+            if r1 == r2:
+                lo, hi = (c1, c2) if c1 < c2 else (c2, c1)
+                between = self.rank_occ[r1] & ((1 << hi) - (2 << lo))
+            elif c1 == c2:
+                lo, hi = (r1, r2) if r1 < r2 else (r2, r1)
+                between = self.file_occ[c1] & ((1 << hi) - (2 << lo))
+            else:
+                return False
+            if pt == ROOK or board[end] == EMPTY:
+                return between == 0
+            return between != 0 and between & (between - 1) == 0 # 炮吃子：中间恰好一个炮架
+        if pt == KNIGHT:
+            leg = KNIGHT_LEG_OF_DELTA[d]
+            return leg != 0 and board[start + leg] == EMPTY
+        if pt == BISHOP:
+            eye = BISHOP_EYE_OF_DELTA[d]
+            return eye != 0 and HOME_HALF[side][end] and board[start + eye] == EMPTY
+        if pt == ADVISOR:
+            return IS_ADVISOR_DELTA[d] and IN_PALACE[side][end]
+        if pt == KING:
+            if IS_KING_DELTA[d] and IN_PALACE[side][end]: return True
+            # 飞将：同列且中间没有子，落点是敌方老将
+            c = SQ_COL[start]
+            if c != SQ_COL[end] or board[end] != own ^ COLOR_MASK | KING: return False
+            lo, hi = (SQ_ROW[start], SQ_ROW[end]) if start < end else (SQ_ROW[end], SQ_ROW[start])
+            return self.file_occ[c] & ((1 << hi) - (2 << lo)) == 0
+        if pt == PAWN:
+            return end in PAWN_MOVES[side][start]
+        return False
+
+    # --- 合法走法 (牵制 / 将军感知) ---
+    def get_pin_info(self, is_red_turn):
+        """
+        每个节点算一次的走子安全信息 (行动方视角)，返回 (king_sq, pinned, screens, checkers)：
+        pinned   —— 走开后可能暴露老将的己方棋子所在格：车/对面将帅线上唯一的阻挡 (含飞将线)、
+                    敌炮与老将之间两个炮架中的己方子、敌马的马腿
+        screens  —— 老将与敌炮之间完全空着的格子，己方子落上去就成了炮架
+        checkers —— 正在将军的敌子所在格
+        """
+        side = 0 if is_red_turn else 1
+        king_sq = self.king_pos[side]
+        pinned, screens, checkers = set(), set(), []
+        if king_sq is None: return king_sq, pinned, screens, checkers
+        board = self.board
+        own = SIDE_COLOR[side]
+        opp = own ^ COLOR_MASK
+        opp_rook, opp_king, opp_cannon = opp | ROOK, opp | KING, opp | CANNON
+
+        for d in LINE_DIRS:
+            # 沿线找出前三个子
+            s1 = king_sq + d
+            while board[s1] == EMPTY: s1 += d
+            p1 = board[s1]
+            if p1 == OFFBOARD: continue
+            if p1 == opp_rook or p1 == opp_king:
+                checkers.append(s1)
+                continue
+            if p1 == opp_cannon: # 老将和炮之间全空：这些格子都不能垫子
+                for sq in range(king_sq + d, s1, d): screens.add(sq)
+            s2 = s1 + d
+            while board[s2] == EMPTY: s2 += d
+            p2 = board[s2]
+            if p2 == OFFBOARD: continue
+            if p2 == opp_cannon:
+                checkers.append(s2)
+            elif (p2 == opp_rook or p2 == opp_king) and p1 & own:
+                pinned.add(s1)
+            s3 = s2 + d
+            while board[s3] == EMPTY: s3 += d
+            if board[s3] == opp_cannon: # 两个炮架，走开任何一个都会被将
+                if p1 & own: pinned.add(s1)
+                if p2 & own: pinned.add(s2)
+
+        opp_knight = opp | KNIGHT
+        for knight_sq, leg in KNIGHT_CHECKS[king_sq]:
+            if board[knight_sq] == opp_knight:
+                if board[leg] == EMPTY: checkers.append(knight_sq)
+                elif board[leg] & own: pinned.add(leg)
+
+        opp_pawn = opp | PAWN
+        for sq in (king_sq - PAWN_FORWARD[side ^ 1], king_sq + LEFT, king_sq + RIGHT):
+            if board[sq] == opp_pawn: checkers.append(sq)
+        return king_sq, pinned, screens, checkers
+
+    def is_move_safe(self, move, is_red_turn):
+        """精确判断走完这步后己方老将是否安全：只临时改棋盘和掩码，不动分数 / Hash / 子列表"""
+        board = self.board
+        start, end = move & MOVE_MASK, move >> MOVE_BITS
+        piece, captured = board[start], board[end]
+        side = 0 if is_red_turn else 1
+        rank_occ, file_occ = self.rank_occ, self.file_occ
+        r1, c1, r2, c2 = SQ_ROW[start], SQ_COL[start], SQ_ROW[end], SQ_COL[end]
+        board[end] = piece
+        board[start] = EMPTY
+        rank_occ[r1] ^= 1 << c1
+        file_occ[c1] ^= 1 << r1
+        if captured == EMPTY:
+            rank_occ[r2] ^= 1 << c2
+            file_occ[c2] ^= 1 << r2
+        king_sq = self.king_pos[side]
+        if piece & TYPE_MASK == KING: self.king_pos[side] = end
+
+        safe = not self.is_in_check(is_red_turn)
+
+        self.king_pos[side] = king_sq
+        board[start] = piece
+        board[end] = captured
+        rank_occ[r1] ^= 1 << c1
+        file_occ[c1] ^= 1 << r1
+        if captured == EMPTY:
+            rank_occ[r2] ^= 1 << c2
+            file_occ[c2] ^= 1 << r2
+        return safe
+
+    def is_legal(self, move, is_red_turn, pin_info):
+        """不被将军时的合法性判断：只有老将和被牵制的子需要精确验证"""
+        king_sq, pinned, screens, _ = pin_info
+        start = move & MOVE_MASK
+        if start == king_sq or start in pinned:
+            return self.is_move_safe(move, is_red_turn)
+        return (move >> MOVE_BITS) not in screens
+
+    def get_evasions(self, is_red_turn, pin_info):
+        """
+        被将军时的专用应将生成：只有老将自己走、吃掉将军的子、垫在将军线上 (含垫炮架 / 塞马腿)、
+        或者把炮架挪开这几类走法有可能解将，先按这个筛一遍，剩下的再精确验证。
+        """
+        king_sq, _, _, checkers = pin_info
+        board = self.board
+        targets = set()     # 落到这些格子上可能解将
+        screen_from = set() # 从这些格子走开可能解将 (炮架)
+        for chk in checkers:
+            targets.add(chk)
+            pt = board[chk] & TYPE_MASK
+            if pt == KNIGHT:
+                for knight_sq, leg in KNIGHT_CHECKS[king_sq]:
+                    if knight_sq == chk: targets.add(leg)
+            elif pt != PAWN: # 车 / 炮 / 对面将：线上的格子都能垫
+                if SQ_ROW[chk] == SQ_ROW[king_sq]: d = RIGHT if chk > king_sq else LEFT
+                else: d = DOWN if chk > king_sq else UP
+                for sq in range(king_sq + d, chk, d):
+                    if board[sq] == EMPTY: targets.add(sq)
+                    else: screen_from.add(sq)
+        moves = []
+        # 先吃子 (已是 MVV-LVA 顺序) 后不吃子，静态搜索里直接用这个顺序
+        for move in self.get_capture_moves(is_red_turn) + self.get_quiet_moves(is_red_turn):
+            start = move & MOVE_MASK
+            if start == king_sq or start in screen_from or (move >> MOVE_BITS) in targets:
+                if self.is_move_safe(move, is_red_turn):
+                    moves.append(move)
+        return moves
+
+    def get_legal_moves(self, is_red_turn):
+        """完整的合法走法列表 (perft、界面校验等用)"""
+        pin_info = self.get_pin_info(is_red_turn)
+        if pin_info[3]:
+            return self.get_evasions(is_red_turn, pin_info)
+        return [m for m in self.get_all_moves(is_red_turn) if self.is_legal(m, is_red_turn, pin_info)]
+
+    def move_picker(self, is_red_turn, tt_move, killers):
+        """
+        分阶段惰性出步 (生成器)，顺序与原来的整表排序一致：
+        1. TT 走法 (不生成任何其它走法)
+        2. 吃子，按 MVV-LVA
+        3. 两个杀手走法
+        4. 其余不吃子走法，按历史分
+        前面的阶段已经剪枝时，后面的阶段根本不会生成和排序。
+        只产出合法走法：牵制 / 将军信息每个节点算一次，被将军时走专用的应将生成。
+        """
+        board = self.board
+        killer1, killer2 = killers[0], killers[1]  # 先拷一份，子节点可能会改写同一深度的杀手表
+        if killer2 == killer1: killer2 = None
+        pin_info = self.get_pin_info(is_red_turn)
+        king_sq, pinned, screens, checkers = pin_info
+
+        if checkers:
+            # 应将：走法很少，一次全部生成再按同样的优先级排序
+            history = self.history_table
+            def evasion_order(m):
+                if m == tt_move: return 300000000
+                victim = board[m >> MOVE_BITS]
+                if victim != EMPTY:
+                    return 10000000 + CODE_VALUES[victim] * 10 - CODE_VALUES[board[m & MOVE_MASK]]
+                if m == killer1: return 9000000
+                if m == killer2: return 8000000
+                return history[m]
+            evasions = self.get_evasions(is_red_turn, pin_info)
+            evasions.sort(key=evasion_order, reverse=True)
+            yield from evasions
+            return
+
+        def legal(m):
+            start = m & MOVE_MASK
+            if start == king_sq or start in pinned:
+                return self.is_move_safe(m, is_red_turn)
+            return (m >> MOVE_BITS) not in screens
+
+        # 1. TT 走法
+        if tt_move is not None and self.is_pseudo_legal(tt_move, is_red_turn) and legal(tt_move):
+            yield tt_move
+
+        # 2. 吃子
+        for move in self.get_capture_moves(is_red_turn):
+            if move != tt_move and legal(move):
+                yield move
+
+        # 3. 杀手 (只认不吃子的)
+        for move in (killer1, killer2):
+            if (move is not None and move != tt_move and board[move >> MOVE_BITS] == EMPTY
+                    and self.is_pseudo_legal(move, is_red_turn) and legal(move)):
+                yield move
+
+        # 4. 其余不吃子走法
+        quiets = self.get_quiet_moves(is_red_turn)
+        quiets.sort(key=self.history_table.__getitem__, reverse=True)
+        for move in quiets:
+            if move != tt_move and move != killer1 and move != killer2 and legal(move):
+                yield move
+
 
 # --- 5. 静态搜索 (Quiescence Search) ---
-    def quiescence_search(self, alpha, beta, maximizing_player, qs_depth=0):
-        # 1. 检查是否被将军 (这是 QS 中最昂贵但也最必要的操作，部分引擎会从外部传入状态以优化)
-        in_check = self.is_in_check(maximizing_player)
+    def quiescence_search(self, alpha, beta, maximizing_player, qs_depth=0, in_check=None):
+        # 1. 检查是否被将军 (父节点走子前已用 move_gives_check 算好并传进来，根节点才需要扫描)
+        if in_check is None:
+            in_check = self.is_in_check(maximizing_player)
 
         # 2. Stand Pat (静止评估)
         # 只有在【不被将军】的情况下，才有资格选择“不走棋”
         if not in_check:
-            score = self.evaluate() # 建议统一用 evaluate，保证分数标准统一
+            score = self.evaluate(alpha=alpha, beta=beta) # 建议统一用 evaluate，保证分数标准统一
             
             if maximizing_player:
                 if score >= beta: return beta
@@ -916,36 +2114,27 @@ class XiangqiCLI:
         if qs_depth > 6:
             return self.evaluate()
 
-        # 4. 生成着法
+        # 4. 生成着法 (只生成合法走法，走完不用再查自己是否被将)
+        # 吃子生成器产出时就是 MVV-LVA 顺序，应将也是先吃子后垫将，不需要再排序
+        pin_info = self.get_pin_info(maximizing_player)
         if in_check:
-            moves = self.get_all_moves(maximizing_player)
+            moves = self.get_evasions(maximizing_player, pin_info)
         else:
-            moves = self.get_all_moves(maximizing_player, only_captures=True)
-        board = self.board
-        values = PIECE_VALUES
-        # MVV-LVA 排序
-        moves.sort(key=lambda m: values[board[m[1][0]][m[1][1]]], reverse=True)
+            moves = [m for m in self.get_capture_moves(maximizing_player)
+                     if self.is_legal(m, maximizing_player, pin_info)]
 
         # 5. 遍历着法
         has_legal_move = False
         
-        for start, end in moves:
+        for move in moves:
             # 模拟走棋
-            captured = self.make_move(start, end)
-            
-            # 【重要】走完之后检查自己是否还在被将军（处理非法的逃生步）
-            # 如果你的 get_all_moves 已经是伪合法的（可能包含送将），需要这一步
-            # 如果你的 get_all_moves 严格保证合法，这步可省略，但在 QS 中通常是伪合法生成
-            # 确实，比如闪将
-            if self.is_in_check(maximizing_player):
-                self.undo_move(start, end, captured)
-                continue
-            
+            gives_check = self.move_gives_check(move, maximizing_player)
+            captured = self.make_move(move)
             has_legal_move = True
             
-            score = self.quiescence_search(alpha, beta, not maximizing_player, qs_depth + 1)
+            score = self.quiescence_search(alpha, beta, not maximizing_player, qs_depth + 1, gives_check)
             
-            self.undo_move(start, end, captured)
+            self.undo_move(move, captured)
             
             if maximizing_player:
                 if score >= beta: return beta
@@ -972,63 +2161,42 @@ class XiangqiCLI:
     def is_in_check(self, is_red_turn):
         """判断当前行动方是否被将军（简化版检测，用于NMP安全检查）"""
         # 找到己方老将
-        king_pos = self.find_king(is_red_turn)
-        if not king_pos: return True # 如果老将被吃，视为最差情况
-        kr, kc = king_pos
+        side = 0 if is_red_turn else 1
+        king_sq = self.king_pos[side]
+        if king_sq is None: return True # 如果老将被吃，视为最差情况
+        board = self.board
+        opp = SIDE_COLOR[side] ^ COLOR_MASK
         
         # 简单扫描：检查车、炮、马、兵是否攻击老将
         # 这是一个耗时操作，但在NMP中是必要的，否则会导致严重的漏杀
         
-        # 1. 检查同行同列的车/炮/帅
-        for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            nr, nc = kr + dr, kc + dc
-            first_piece = None
-            while self.in_board(nr, nc):
-                p = self.board[nr][nc]
-                if p != '.':
-                    if first_piece is None:
-                        first_piece = p
-                        # 车或老将直接照面
-                        if self.is_red(p) != is_red_turn:
-                            if p.lower() in ['r', 'k']: return True
-                    else:
-                        # 翻山炮
-                        if self.is_red(p) != is_red_turn:
-                            if p.lower() == 'c': return True
-                        break # 隔两个子以上无效
-                nr, nc = nr + dr, nc + dc
+        # 1. 检查同行同列的车/炮/帅 (查滑动表)
+        opp_rook, opp_king, opp_cannon = opp | ROOK, opp | KING, opp | CANNON
+        r, c = SQ_ROW[king_sq], SQ_COL[king_sq]
+        rank_mask, file_mask = self.rank_occ[r], self.file_occ[c]
+        # 车或老将直接照面
+        for d in RANK_ROOK_CAPS[c][rank_mask]:
+            if board[king_sq + d] == opp_rook: return True
+        for d in FILE_ROOK_CAPS[r][file_mask]:
+            p = board[king_sq + d]
+            if p == opp_rook or p == opp_king: return True
+        # 翻山炮 (隔两个子以上无效)
+        for d in RANK_CANNON_CAPS[c][rank_mask]:
+            if board[king_sq + d] == opp_cannon: return True
+        for d in FILE_CANNON_CAPS[r][file_mask]:
+            if board[king_sq + d] == opp_cannon: return True
         
-        # 2. 检查马
-        knight_checks = [
-            (-2, -1), (-2, 1),   # 上方纵向
-            (2, -1),  (2, 1),    # 下方纵向
-            (-1, -2), (-1, 2),   # 上方横向
-            (1, -2),  (1, 2)     # 下方横向
-        ]
-        # 修正后的马脚：所有点都应该是对角线位置 (±1, ±1)，是对帅来说的。
-        knight_legs = [
-            (-1, -1), (-1, 1),   # 对应 (-2, -1), (-2, 1)
-            (1, -1),  (1, 1),    # 对应 (2, -1),  (2, 1)
-            (-1, -1), (-1, 1),   # 对应 (-1, -2), (-1, 2)
-            (1, -1),  (1, 1)     # 对应 (1, -2),  (1, 2)
-        ]
-        for (dr, dc), (lr, lc) in zip(knight_checks, knight_legs):
-            nr, nc = kr + dr, kc + dc
-            legr, legc = kr + lr, kc + lc
-            if self.in_board(nr, nc) and self.in_board(legr, legc):
-                p = self.board[nr][nc]
-                if p != '.' and self.is_red(p) != is_red_turn and p.lower() == 'n':
-                    if self.board[legr][legc] == '.': # 必须无蹩脚
-                        return True
+        # 2. 检查马：马在老将的 "日" 字位置，且马腿 (老将斜角) 为空
+        opp_knight = opp | KNIGHT
+        for knight_sq, leg in KNIGHT_CHECKS[king_sq]:
+            if board[knight_sq] == opp_knight and board[leg] == EMPTY:
+                return True
                         
         # 3. 检查兵/卒 (老将只在九宫，只看周围一步即可)
-        pawn_char = 'p' if is_red_turn else 'P' # 敌方兵的字符
-        pawn_dir = 1 if is_red_turn else -1     # 敌兵进攻方向（相对于敌方是前进，相对于己方是后退）
-        # 也就是检查 kr - pawn_dir 行是否有敌兵
-        check_r = kr - pawn_dir
-        if self.in_board(check_r, kc) and self.board[check_r][kc] == pawn_char: return True # 迎面冲来
-        for dc in [-1, 1]: # 左右兵
-            if self.in_board(kr, kc+dc) and self.board[kr][kc+dc] == pawn_char: return True
+        # 敌兵从老将 "前方" 迎面冲来，或在左右两侧
+        opp_pawn = opp | PAWN
+        if board[king_sq - PAWN_FORWARD[side ^ 1]] == opp_pawn: return True
+        if board[king_sq + LEFT] == opp_pawn or board[king_sq + RIGHT] == opp_pawn: return True
 
         return False
 
@@ -1040,27 +2208,64 @@ class XiangqiCLI:
 
     def undo_null_move(self):
         """撤销空步：操作完全一样"""
-        self.hash_count[self.current_hash] -= 1
+        cnt = self.hash_count[self.current_hash] - 1
+        if cnt: self.hash_count[self.current_hash] = cnt
+        else: del self.hash_count[self.current_hash]
         self.turn = 'black' if self.turn == 'red' else 'red'
         self.current_hash ^= self.zobrist_turn
 
 
-    def move_gives_check(self, start, end, maximizing_player):
+    def move_gives_check(self, move, maximizing_player):
         """
-        判断 start->end 这一步是否对对方造成将军
+        判断 move 这一步是否对对方造成将军 (不走子，直接看这步棋和敌方老将的关系)：
+        只把起点当成空、终点当成走过去的子，重新看敌将所在行列的掩码和马腿、兵位，
+        这样直接攻击、闪击 (让开车线 / 马腿 / 第二个炮架) 和新垫炮架都能一次判断出来。
         """
-        # 执行走子
-        captured = self.make_move(start, end)
-
-        # 走完后，轮到对方，对方是否被将军
-        gives_check = self.is_in_check(not maximizing_player)
-
-        # 撤销走子
-        self.undo_move(start, end, captured)
-
-        return gives_check
+        side = 0 if maximizing_player else 1
+        king_sq = self.king_pos[side ^ 1]
+        if king_sq is None: return False
+        board = self.board
+        start, end = move & MOVE_MASK, move >> MOVE_BITS
+        piece = board[start]
+        own = SIDE_COLOR[side]
+
+        # 敌将所在行、列走完后的占位
+        kr, kc = SQ_ROW[king_sq], SQ_COL[king_sq]
+        rank_mask, file_mask = self.rank_occ[kr], self.file_occ[kc]
+        if SQ_ROW[start] == kr: rank_mask &= ~(1 << SQ_COL[start])
+        if SQ_COL[start] == kc: file_mask &= ~(1 << SQ_ROW[start])
+        if SQ_ROW[end] == kr: rank_mask |= 1 << SQ_COL[end]
+        if SQ_COL[end] == kc: file_mask |= 1 << SQ_ROW[end]
+
+        # 1. 车 / 帅 直线
+        own_rook, own_king, own_cannon = own | ROOK, own | KING, own | CANNON
+        for d in RANK_ROOK_CAPS[kc][rank_mask]:
+            sq = king_sq + d
+            if (piece if sq == end else board[sq]) == own_rook: return True
+        for d in FILE_ROOK_CAPS[kr][file_mask]:
+            sq = king_sq + d
+            p = piece if sq == end else board[sq]
+            if p == own_rook or p == own_king: return True
+        # 2. 炮 (隔一个炮架)
+        for d in RANK_CANNON_CAPS[kc][rank_mask]:
+            sq = king_sq + d
+            if (piece if sq == end else board[sq]) == own_cannon: return True
+        for d in FILE_CANNON_CAPS[kr][file_mask]:
+            sq = king_sq + d
+            if (piece if sq == end else board[sq]) == own_cannon: return True
+        # 3. 马 (包括让开马腿的闪击)
+        own_knight = own | KNIGHT
+        for knight_sq, leg in KNIGHT_CHECKS[king_sq]:
+            if knight_sq == start: continue
+            if (piece if knight_sq == end else board[knight_sq]) != own_knight: continue
+            if leg == start or (leg != end and board[leg] == EMPTY): return True
+        # 4. 兵 (只可能是走过去的那个兵直接将)
+        if piece == own | PAWN:
+            if end == king_sq - PAWN_FORWARD[side] or end == king_sq + LEFT or end == king_sq + RIGHT:
+                return True
+        return False
 
-    def minimax(self, depth, alpha, beta, maximizing_player, allow_null=True,check_ext_left=1):
+    def minimax(self, depth, alpha, beta, maximizing_player, allow_null=True,check_ext_left=1, in_check=None):
         self.nodes += 1
         # --- 新增：检测重复局面 ---
         # 如果当前 Hash 在历史列表中出现的次数大于1（包含刚才 make_move 加入的那次），说明重复了
@@ -1075,20 +2280,21 @@ class XiangqiCLI:
         if self.is_time_up():
             return 0, None
 
-        in_check = self.is_in_check(maximizing_player)
+        # 父节点走子前已经用 move_gives_check 算好了，这里就不用再扫一遍
+        if in_check is None:
+            in_check = self.is_in_check(maximizing_player)
         ext = 0
         if check_ext_left > 0 and in_check:
             ext = 1
         # 2. 基础结束条件
         # 如果深度耗尽，进入静态搜索 (QS)
         if depth+ ext <= 0:
-            val = self.quiescence_search(alpha, beta, maximizing_player)
+            val = self.quiescence_search(alpha, beta, maximizing_player, in_check=in_check)
             return val, None
 
         # 1. 查表 (TT Lookup)
         original_alpha = alpha
-        idx = self.current_hash % self.tt_size
-        tt_entry = self.tt[idx]
+        tt_entry = self.tt.probe(self.current_hash)
         tt_move = None
         
         if tt_entry is not None and tt_entry[0] == self.current_hash:
@@ -1125,7 +2331,7 @@ class XiangqiCLI:
             if maximizing_player:
                 # 当前是红方：希望证明 即使空步，局势依然 >= beta
                 # 交给黑方搜，使用 (beta-1, beta) 窗口
-                val, _ = self.minimax(next_depth, beta - 1, beta, False, allow_null=False, check_ext_left=0)
+                val, _ = self.minimax(next_depth, beta - 1, beta, False, allow_null=False, check_ext_left=0, in_check=False)
                 self.undo_null_move() # 记得恢复
                 
                 if self.stop_search: return 0, None
@@ -1134,7 +2340,7 @@ class XiangqiCLI:
             else:
                 # 当前是黑方：希望证明 即使空步，局势依然 <= alpha
                 # 交给红方搜，使用 (alpha, alpha+1) 窗口
-                val, _ = self.minimax(next_depth, alpha, alpha + 1, True, allow_null=False,check_ext_left=0)
+                val, _ = self.minimax(next_depth, alpha, alpha + 1, True, allow_null=False,check_ext_left=0, in_check=False)
                 self.undo_null_move() # 记得恢复
 
                 if self.stop_search: return 0, None
@@ -1142,55 +2348,31 @@ class XiangqiCLI:
                     return alpha, None
             # --- 逻辑修正结束 ---
 
-        # 4. 生成着法
-        moves = self.get_all_moves(maximizing_player)
-        if not moves:
-            # 无棋可走：如果是被将军，就是输了；如果没被将军，是困毙(算和棋或输，这里简化为输)
-            return (-SCORE_INF if maximizing_player else SCORE_INF), None
-
-        # 排序
+        # 4. 分阶段生成着法 (TT -> 吃子 -> 杀手 -> 历史)，剪枝后后面的阶段不再生成
         killers = self.killer_moves[depth] if depth < 64 else [None, None]
-        def move_sorter(m):
-            start, end = m
-            if tt_move and (start, end) == tt_move: return 300000000 # TT Move
-            victim = self.board[end[0]][end[1]]
-            if victim != '.': # MVV-LVA
-                val = PIECE_VALUES.get(victim, 0)
-                attacker = self.board[start[0]][start[1]]
-                attacker_val = PIECE_VALUES.get(attacker, 0)
-                return 10000000 + val * 10 - attacker_val
-            
-            if m == killers[0]: return 9000000
-            if m == killers[1]: return 8000000
-            return self.history_table[start[0]][start[1]][end[0]][end[1]]
 
-        moves.sort(key=move_sorter, reverse=True)
-
-        best_move = moves[0]
+        best_move = None
         best_score = -float(SCORE_INF) if maximizing_player else float(SCORE_INF)
         moves_count = 0
         # 5. 遍历
-        for start, end in moves:
+        for move in self.move_picker(maximizing_player, tt_move, killers):
 
             moves_count += 1
-            captured = self.make_move(start, end)
-
-            if self.is_in_check(maximizing_player):
-                self.undo_move(start, end, captured)
-                continue
+            gives_check = self.move_gives_check(move, maximizing_player)
+            captured = self.make_move(move)
             
             score = 0
-            is_killer = ((start, end) == killers[0] or (start, end) == killers[1])
+            is_killer = (move == killers[0] or move == killers[1])
             
             # --- PVS & LMR ---
             # 只有当不是被将军状态时，才敢大胆进行 LMR 裁剪
             do_lmr = (depth >= 3 and moves_count > 4 and 
-                      captured == '.' and not in_check and 
+                      captured == EMPTY and not in_check and 
                       not is_killer)
             
             if maximizing_player:
                 if moves_count == 1:
-                    score, _ = self.minimax(depth - 1+ ext, alpha, beta, False,check_ext_left=check_ext_left - ext)
+                    score, _ = self.minimax(depth - 1+ ext, alpha, beta, False,check_ext_left=check_ext_left - ext, in_check=gives_check)
                 else:
                     reduction = 1 if do_lmr else 0
                     if moves_count > 10 and do_lmr: 
@@ -1203,17 +2385,17 @@ class XiangqiCLI:
                     if search_depth < 0: search_depth = 0
 
                     # 1. 尝试零窗口搜索
-                    score, _ = self.minimax(search_depth+ ext, alpha, alpha + 1, False,check_ext_left=check_ext_left - ext)
+                    score, _ = self.minimax(search_depth+ ext, alpha, alpha + 1, False,check_ext_left=check_ext_left - ext, in_check=gives_check)
                     
                     # 2. 如果 Fail High (在这个深度居然比 alpha 好)，说明可能过度剪枝了
                     if score > alpha:
                         if do_lmr: # 恢复深度重搜
-                            score, _ = self.minimax(depth - 1+ ext, alpha, alpha + 1, False,check_ext_left=check_ext_left - ext)
+                            score, _ = self.minimax(depth - 1+ ext, alpha, alpha + 1, False,check_ext_left=check_ext_left - ext, in_check=gives_check)
                         if score > alpha and score < beta: # 全窗口重搜
-                            score, _ = self.minimax(depth - 1+ ext, alpha, beta, False,check_ext_left=check_ext_left - ext)
+                            score, _ = self.minimax(depth - 1+ ext, alpha, beta, False,check_ext_left=check_ext_left - ext, in_check=gives_check)
             else:
                 if moves_count == 1:
-                    score, _ = self.minimax(depth - 1+ ext, alpha, beta, True,check_ext_left=check_ext_left - ext)
+                    score, _ = self.minimax(depth - 1+ ext, alpha, beta, True,check_ext_left=check_ext_left - ext, in_check=gives_check)
                 else:
                     reduction = 1 if do_lmr else 0
                     if moves_count > 10 and do_lmr: 
@@ -1223,15 +2405,15 @@ class XiangqiCLI:
                     
                     search_depth = depth - 1 - reduction
                     if search_depth < 0: search_depth = 0
-                    score, _ = self.minimax(search_depth+ ext, beta - 1, beta, True,check_ext_left=check_ext_left - ext)
+                    score, _ = self.minimax(search_depth+ ext, beta - 1, beta, True,check_ext_left=check_ext_left - ext, in_check=gives_check)
                     # tt
                     if score < beta:
                         if do_lmr:
-                            score, _ = self.minimax(depth - 1+ ext, beta - 1, beta, True,check_ext_left=check_ext_left - ext)
+                            score, _ = self.minimax(depth - 1+ ext, beta - 1, beta, True,check_ext_left=check_ext_left - ext, in_check=gives_check)
                         if score < beta and score > alpha:
-                            score, _ = self.minimax(depth - 1+ ext, alpha, beta, True,check_ext_left=check_ext_left - ext)
+                            score, _ = self.minimax(depth - 1+ ext, alpha, beta, True,check_ext_left=check_ext_left - ext, in_check=gives_check)
 
-            self.undo_move(start, end, captured)
+            self.undo_move(move, captured)
             
             if self.stop_search: return 0, None
 
@@ -1239,39 +2421,242 @@ class XiangqiCLI:
             if maximizing_player:
                 if score > best_score:
                     best_score = score
-                    best_move = (start, end)
+                    best_move = move
                     if best_score > alpha:
                         alpha = best_score
                         if alpha >= beta:
-                            if captured == '.':
-                                self.history_table[start[0]][start[1]][end[0]][end[1]] += depth * depth
-                                if self.killer_moves[depth][0] != (start, end):
+                            if captured == EMPTY:
+                                self.history_table[move] += depth * depth
+                                if self.killer_moves[depth][0] != move:
                                     self.killer_moves[depth][1] = self.killer_moves[depth][0]
-                                    self.killer_moves[depth][0] = (start, end)
+                                    self.killer_moves[depth][0] = move
                             break
             else:
                 if score < best_score:
                     best_score = score
-                    best_move = (start, end)
+                    best_move = move
                     if best_score < beta:
                         beta = best_score
                         if beta <= alpha:
-                            if captured == '.':
-                                self.history_table[start[0]][start[1]][end[0]][end[1]] += depth * depth
-                                if self.killer_moves[depth][0] != (start, end):
+                            if captured == EMPTY:
+                                self.history_table[move] += depth * depth
+                                if self.killer_moves[depth][0] != move:
                                     self.killer_moves[depth][1] = self.killer_moves[depth][0]
-                                    self.killer_moves[depth][0] = (start, end)
+                                    self.killer_moves[depth][0] = move
                             break
 
+        if moves_count == 0:
+            # 无棋可走：如果是被将军，就是输了；如果没被将军，是困毙(算和棋或输，这里简化为输)
+            return (-SCORE_INF if maximizing_player else SCORE_INF), None
+
         # 6. 存表
         flag = TT_EXACT
         if best_score <= original_alpha: flag = TT_ALPHA
         elif best_score >= beta: flag = TT_BETA
         
-        if tt_entry is None or depth >= tt_entry[1]:
-            self.tt[idx] = (self.current_hash, depth, flag, best_score, best_move)
+        self.tt.store(self.current_hash, depth, flag, best_score, best_move)
 
         return best_score, best_move
+    def search_root_move(self, move, depth, alpha, beta, maximizing_player, moves_count, is_killer, in_check, ext):
+        """
+        只搜根节点的一个走法，流程和 minimax 根节点对第 moves_count 个走法的完全一样
+        (第一个全窗口，后面的 LMR + 零窗口，失败高再重搜)，返回分数。根节点并行的子进程用。
+        """
+        gives_check = self.move_gives_check(move, maximizing_player)
+        captured = self.make_move(move)
+        do_lmr = (depth >= 3 and moves_count > 4 and
+                  captured == EMPTY and not in_check and
+                  not is_killer)
+        reduction = 1 if do_lmr else 0
+        if moves_count > 10 and do_lmr:
+            reduction = 2
+            if moves_count > 20:
+                reduction = 3
+        search_depth = max(0, depth - 1 - reduction)
+        if moves_count == 1:
+            score, _ = self.minimax(depth - 1 + ext, alpha, beta, not maximizing_player, check_ext_left=1 - ext, in_check=gives_check)
+        elif maximizing_player:
+            score, _ = self.minimax(search_depth + ext, alpha, alpha + 1, False, check_ext_left=1 - ext, in_check=gives_check)
+            if score > alpha:
+                if do_lmr:
+                    score, _ = self.minimax(depth - 1 + ext, alpha, alpha + 1, False, check_ext_left=1 - ext, in_check=gives_check)
+                if score > alpha and score < beta:
+                    score, _ = self.minimax(depth - 1 + ext, alpha, beta, False, check_ext_left=1 - ext, in_check=gives_check)
+        else:
+            score, _ = self.minimax(search_depth + ext, beta - 1, beta, True, check_ext_left=1 - ext, in_check=gives_check)
+            if score < beta:
+                if do_lmr:
+                    score, _ = self.minimax(depth - 1 + ext, beta - 1, beta, True, check_ext_left=1 - ext, in_check=gives_check)
+                if score < beta and score > alpha:
+                    score, _ = self.minimax(depth - 1 + ext, alpha, beta, True, check_ext_left=1 - ext, in_check=gives_check)
+        self.undo_move(move, captured)
+        return score
+
+    def search_root_move_isolated(self, history, killers, args):
+        """
+        根节点并行里搜一个根走法 (args 同 search_root_move)：历史表 / 杀手表从根节点时的快照 (history / killers，不会被改) 开始，
+        主置换表只读、新条目写进 root_scratch，所以同样的界搜出来的结果在哪个进程、什么时候搜都一样。
+        返回 (分数, 子树最上面 ROOT_SPLIT_MERGE_PLIES 层的置换表条目)，条目由 root_split 按走法顺序合并。
+        """
+        self.history_table = history[:]
+        self.killer_moves = [k[:] for k in killers]
+        if self.root_scratch is None: self.root_scratch = RootScratchTT(ROOT_SCRATCH_ENTRIES)
+        scratch, base = self.root_scratch, self.tt
+        scratch.reset(base, max(1, args[1] - ROOT_SPLIT_MERGE_PLIES))
+        self.tt = scratch
+        try:
+            score = self.search_root_move(*args)
+        finally:
+            self.tt = base
+        return score, scratch.export()
+
+    def root_split(self, depth, alpha, beta, maximizing_player):
+        """
+        根节点并行版的 minimax (接口一样)。每个根走法都用 search_root_move_isolated 搜，结果只取决于根节点时的
+        历史表 / 杀手表 / 置换表和派发时的界。第一个走法自己搜，其余分给 root_pool；结果按原来的走法顺序逐个确认：
+        派发后界收紧了的，在旧界下失败低的照样淘汰，只有旧界下失败高的才用新界重搜 (先零窗口、过了再全窗口)。
+        这一层搜完，再按走法顺序把各走法子树最上面几层的置换表条目合并回来。
+        所以 (分数, 走法) 和不开进程池时 (本进程里按顺序一个个搜) 一样，和进程数、完成的先后无关。
+        代价：子树里学到的历史分 / 杀手只在这个根走法里用，不带到下一层；更浅的置换表条目也不带回来。
+        历史表快照每层只放一次共享内存 (root_history)，任务里只带编号。
+        深度不到 ROOT_SPLIT_MIN_DEPTH 时任务太小，直接用 minimax。
+        """
+        if depth < ROOT_SPLIT_MIN_DEPTH: return self.minimax(depth, alpha, beta, maximizing_player)
+        self.nodes += 1
+        if self.hash_count.get(self.current_hash, 0) > 1: return 0, None
+        if self.is_time_up(): return 0, None
+        in_check = self.is_in_check(maximizing_player)
+        ext = 1 if in_check else 0
+        original_alpha = alpha
+        tt_entry = self.tt.probe(self.current_hash)
+        tt_move = None
+        if tt_entry is not None and tt_entry[0] == self.current_hash:
+            tt_hash, tt_depth, tt_flag, tt_score, tt_move = tt_entry
+            if tt_depth >= depth:
+                if tt_flag == TT_EXACT:
+                    return tt_score, tt_move
+                elif tt_flag == TT_ALPHA and tt_score <= alpha:
+                    return tt_score, tt_move
+                elif tt_flag == TT_BETA and tt_score >= beta:
+                    return tt_score, tt_move
+        if self.king_pos[0] is None: return -SCORE_INF + depth, None
+        if self.king_pos[1] is None: return SCORE_INF - depth, None
+
+        killers = self.killer_moves[depth] if depth < 64 else [None, None]
+        moves = list(self.move_picker(maximizing_player, tt_move, killers))
+        if not moves:
+            return (-SCORE_INF if maximizing_player else SCORE_INF), None
+        killer_set = (killers[0], killers[1])
+        fen, hash_count = self.to_fen(), dict(self.hash_count)
+        eval_opts = (self.use_tapered, self.nnue_file if self.use_nnue else None)
+        # 根节点时的历史表和杀手表，每个任务都从这份快照开始；历史表经共享内存给子进程，任务里只带编号
+        history = self.history_table
+        killer_snapshot = [k[:] for k in self.killer_moves]
+        pool = self.root_pool
+        if pool is not None:
+            self.root_history_id += 1
+            self.root_history.buf.cast('q')[:] = array('q', history)
+        results = {} # 下标 -> (分数, 置换表条目, 派发时的 alpha, beta)
+        running = {} # future -> (下标, 派发时的 alpha, beta)
+
+        def dispatch(i):
+            args = (moves[i], depth, alpha, beta, maximizing_player, i + 1, moves[i] in killer_set, in_check, ext)
+            if pool is None or i == 0: # 第一个走法 (通常是 TT 走法) 自己搜，定下初始界
+                results[i] = self.search_root_move_isolated(history, killer_snapshot, args) + (alpha, beta)
+            else:
+                job = (fen, hash_count, eval_opts, self.tt.age, self.start_time, self.time_limit,
+                       self.root_history_id, killer_snapshot, args)
+                running[pool.submit(_root_worker_search, job)] = (i, alpha, beta)
+
+        best_move = None
+        best_score = -float(SCORE_INF) if maximizing_player else float(SCORE_INF)
+        merged = [] # 确认了的走法的置换表条目，按走法顺序
+        cut_move = None
+        dispatch(0)
+        next_i = 1 # 下一个要派发的走法
+        commit_i = 0 # 下一个要确认的走法
+        while not self.stop_search:
+            # 按原来的顺序确认。派发后界收紧了的：旧界下失败低 (红方 score <= 旧 alpha)，新界下也一样被淘汰，直接确认；
+            # 旧界下失败高的才用现在的界重搜 (search_root_move 对后面的走法本来就是先零窗口、过了再全窗口)
+            while commit_i in results and not self.stop_search:
+                score, entries, used_alpha, used_beta = results.pop(commit_i)
+                stale = used_alpha != alpha or used_beta != beta
+                if stale and ((score > used_alpha) if maximizing_player else (score < used_beta)):
+                    dispatch(commit_i)
+                    continue
+                merged.append(entries)
+                move = moves[commit_i]
+                commit_i += 1
+                if (score > best_score) if maximizing_player else (score < best_score):
+                    best_score, best_move = score, move
+                    if maximizing_player and best_score > alpha: alpha = best_score
+                    elif not maximizing_player and best_score < beta: beta = best_score
+                    if alpha >= beta:
+                        cut_move = move
+                        break
+            if self.stop_search or cut_move is not None or commit_i == len(moves): break
+            if pool is None:
+                dispatch(commit_i)
+                continue
+            while next_i < len(moves) and len(running) < self.root_workers:
+                dispatch(next_i)
+                next_i += 1
+            done, _ = wait(running, timeout=0.05, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i, used_alpha, used_beta = running.pop(fut)
+                score, entries, nodes, stopped = fut.result()
+                self.nodes += nodes
+                if stopped: self.stop_search = True
+                results[i] = (score, entries, used_alpha, used_beta)
+            if time.time() - self.start_time > self.time_limit: self.stop_search = True
+        if running:
+            # 超时或剪枝：叫停池里还在搜的任务并等它们返回，免得占着进程拖到下一次搜索
+            self.root_abort.set()
+            wait(running)
+            self.root_abort.clear()
+
+        self.history_table = history
+        self.killer_moves = killer_snapshot
+        if self.stop_search: return 0, None
+        for entries in merged:
+            self.tt.merge(entries)
+
+        if cut_move is not None and self.board[cut_move >> MOVE_BITS] == EMPTY:
+            self.history_table[cut_move] += depth * depth
+            if self.killer_moves[depth][0] != cut_move:
+                self.killer_moves[depth][1] = self.killer_moves[depth][0]
+                self.killer_moves[depth][0] = cut_move
+        flag = TT_EXACT
+        if best_score <= original_alpha: flag = TT_ALPHA
+        elif best_score >= beta: flag = TT_BETA
+        self.tt.store(self.current_hash, depth, flag, best_score, best_move)
+        return best_score, best_move
+
+    def set_root_split(self, workers):
+        """
+        切换根节点并行的进程数，1 关闭 (和 Lazy SMP 二选一)。主进程和池里的进程共用一张 SharedTT，
+        分根走法搜的时候大家只读它 (见 root_split)，上一层迭代的条目对所有根走法都在；进程池起好后先各跑一个空任务热起来。
+        """
+        if workers > 1 and self.smp: self.set_threads(1)
+        if workers > 1: print("根节点并行是实验性功能，多核上的加速比请先用 bench root 实测", file=sys.stderr, flush=True)
+        if self.root_pool:
+            self.root_pool.shutdown(wait=True, cancel_futures=True)
+            self.root_pool = None
+            self.tt.close(unlink=True)
+            self.tt = TranspositionTable(self.tt_size)
+            self.root_history.close()
+            self.root_history.unlink()
+        self.root_workers = workers
+        if workers > 1:
+            ctx = multiprocessing.get_context("spawn")
+            self.root_abort = ctx.Event()
+            self.tt = SharedTT(self.tt_size)
+            self.root_history = shared_memory.SharedMemory(create=True, size=MOVE_SPACE * 8)
+            self.root_pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_root_worker_init,
+                                                 initargs=(self.root_abort, self.tt.shm.name, self.tt_size,
+                                                           self.root_history.name))
+            wait([self.root_pool.submit(_root_worker_ping) for _ in range(workers)])
+
     def search_main(self, max_time, is_ai_red):
         cloud_data = self.query_cloud_book()
         if cloud_data:
@@ -1285,17 +2670,51 @@ class XiangqiCLI:
             with open("log.txt", "a", encoding="utf-8") as f:
                 print(f"使用皮卡鱼走法: {pikafish_move}, 分数: {pikafish_score}", file=f)
             return pikafish_score, pikafish_move # 返回真实的分数和走法
+        self.tt.new_search() # 以前几步的条目变成旧代，优先被替换
+        if self.smp is not None:
+            self.reset_search_stats()
+            val, move, depth, wid = self.smp.search(self, max_time, is_ai_red)
+            with open("log.txt", "a", encoding="utf-8") as f:
+                print(f"Lazy SMP {len(self.smp.procs) + 1} 进程 | 完成深度 {depth} (进程 {wid}) "
+                      f"| 耗时 {time.time() - self.start_time:.2f}s | 评估 {val} | hashfull {self.tt.hashfull()}", file=f)
+            return val, move
         self.start_time = time.time()
         self.time_limit = max_time
         self.stop_search = False
+        self.reset_search_stats()
         
         # 这两个变量存储【上一次完整深度】的结果
         last_completed_move = None
         last_completed_val = 0
         
+        self.aspiration_researches = []
+        
         for depth in range(1, 64):
             # 尝试搜索当前深度
-            current_val, current_move = self.minimax(depth, -float(SCORE_INF), float(SCORE_INF), is_ai_red)
+            search = self.root_split if self.root_pool is not None else self.minimax
+            alpha, beta = -float(SCORE_INF), float(SCORE_INF)
+            delta = ASPIRATION_WINDOW
+            if ASPIRATION and depth >= ASPIRATION_MIN_DEPTH and abs(last_completed_val) < 20000:
+                alpha, beta = last_completed_val - delta, last_completed_val + delta
+            fail_low = fail_high = 0
+            while True:
+                current_val, current_move = search(depth, alpha, beta, is_ai_red)
+                # 超时：重搜到一半也一样作废，下面按超时处理
+                if self.stop_search: break
+                # 失败低 / 失败高 (窗口内没有真实分数，根节点空步裁剪失败高时走法还是 None)，放宽失败的一侧重搜
+                if current_val <= alpha and alpha > -SCORE_INF:
+                    fail_low += 1
+                    delta *= ASPIRATION_WIDEN
+                    alpha = max(current_val - delta, -float(SCORE_INF))
+                elif current_val >= beta and beta < SCORE_INF:
+                    fail_high += 1
+                    delta *= ASPIRATION_WIDEN
+                    beta = min(current_val + delta, float(SCORE_INF))
+                else:
+                    break
+                if delta > ASPIRATION_MAX_WINDOW:
+                    alpha, beta = -float(SCORE_INF), float(SCORE_INF)
+            self.aspiration_researches.append((depth, fail_low, fail_high))
             
             # 检查是否是因为超时导致的返回
             if self.stop_search or current_move is None:
@@ -1309,13 +2728,342 @@ class XiangqiCLI:
             # 打印日志
             elapsed = time.time() - self.start_time
             with open("log.txt", "a", encoding="utf-8") as f:
-                print(f"完成深度 {depth} | 耗时 {elapsed:.2f}s | 评估 {last_completed_val}", file=f)
+                print(f"完成深度 {depth} | 耗时 {elapsed:.2f}s | 评估 {last_completed_val} "
+                      f"| 评估缓存命中 {self.eval_cache_hits}/{self.eval_cache_probes} ({self.eval_cache_hit_rate():.1%}) "
+                      f"| 懒惰评估 {self.lazy_eval_hits} 次 (判错 {self.lazy_eval_wrong}) "
+                      f"| 渴望窗口重搜 {fail_low + fail_high} 次 (失败低 {fail_low} / 失败高 {fail_high}) "
+                      f"| hashfull {self.tt.hashfull()}", file=f)
 
             if abs(last_completed_val) > 20000: break # 发现绝杀
             if elapsed > max_time * 0.16: break # 剩余时间预警
 
         # 哪怕深度 6 失败了，我们返回的也是深度 5 的最佳走法
         return last_completed_val, last_completed_move
+
+    def smp_iterate(self, max_time, is_ai_red, max_depth=63, start_depth=1, search=None):
+        """
+        Lazy SMP 里每个进程各自跑的迭代加深 (停止条件和 search_main 一样)，
+        返回最后一个完整深度的 (depth, val, move)，一层都没搜完时 move 为 None。
+        search 默认 minimax，基准测试也用它跑 root_split。
+        """
+        search = search or self.minimax
+        self.start_time = time.time()
+        self.time_limit = max_time
+        self.stop_search = False
+        done = (0, 0, None)
+        for depth in range(start_depth, max_depth + 1):
+            val, move = search(depth, -float(SCORE_INF), float(SCORE_INF), is_ai_red)
+            if self.stop_search or move is None:
+                break
+            done = (depth, val, move)
+            if abs(val) > 20000: break # 发现绝杀
+            if time.time() - self.start_time > max_time * 0.16: break # 剩余时间预警
+        return done
+
+    def set_hash(self, mb):
+        """按 MB 重新分配置换表 (内容清空)"""
+        self.resize_tt(tt_entries_for_mb(mb))
+
+    def resize_tt(self, entries):
+        """换成 entries 个条目的空置换表；并行搜索开着时连同进程一起重建，好让子进程用上新表"""
+        self.tt_size = entries
+        if self.smp:
+            self.set_threads(len(self.smp.procs) + 1)
+        elif self.root_pool:
+            self.set_root_split(self.root_workers)
+        else:
+            self.tt = TranspositionTable(self.tt_size)
+
+    def save_tt(self, path):
+        """存盘；状态信息走 stderr，stdout 只留给引擎协议 (arena.py / gui.py 按行读)"""
+        self.tt.save(path)
+        print(f"置换表已保存: {path} ({self.tt_size} 条, hashfull {self.tt.hashfull()})", file=sys.stderr, flush=True)
+
+    def load_tt(self, path):
+        """
+        从 save_tt 存的文件恢复置换表 (用 mmap 拷入，大小不同时先换成文件里的大小)。
+        Zobrist 键对不上的文件直接拒绝，返回 False。恢复后再分析同一局面，迭代加深前面几层在根节点直接命中。
+        """
+        try:
+            mapped, entries = read_tt_file(path)
+        except (OSError, ValueError) as e:
+            print(f"无法加载置换表 {path}: {e}", file=sys.stderr, flush=True)
+            return False
+        try:
+            if entries != self.tt_size: self.resize_tt(entries)
+            self.tt.load(mapped)
+        finally:
+            mapped.close()
+        print(f"置换表已加载: {path} ({entries} 条)", file=sys.stderr, flush=True)
+        return True
+
+    def run_tt_command(self, cmd):
+        """解析并执行置换表存取命令 (引擎协议和 cli 共用)：tt save <文件> / tt load <文件>"""
+        parts = cmd.split(maxsplit=2)
+        if len(parts) == 3 and parts[1] == "save":
+            self.save_tt(parts[2])
+        elif len(parts) == 3 and parts[1] == "load":
+            self.load_tt(parts[2])
+        else:
+            print("用法: tt save <文件> / tt load <文件>", file=sys.stderr, flush=True)
+
+    def clear_tt(self):
+        """清空置换表 (原地清零，共享内存的表其它进程也看得到)"""
+        self.tt.clear()
+
+    def set_threads(self, workers):
+        """切换搜索进程数：1 回到单进程 (换回进程内的置换表)，> 1 开 Lazy SMP (和根节点并行二选一)"""
+        if workers > 1 and self.root_pool: self.set_root_split(1)
+        if self.smp:
+            self.smp.close()
+            self.smp = None
+            self.smp_stop = None
+            self.tt = TranspositionTable(self.tt_size)
+        if workers > 1:
+            self.smp = LazySMP(self, workers)
+            self.tt = self.smp.tt
+            self.smp_stop = self.smp.stop_event
+
+    def smp_benchmark(self, depth=5, worker_counts=SMP_BENCH_WORKERS):
+        """
+        Lazy SMP 到达固定深度的时间：对 PERFT_SUITE 每个局面搜到 depth 层 (最先搜完的进程为准)，
+        每个局面前清空共享置换表和各进程的历史表。先给出单进程 (进程内置换表) 的时间作参照。
+        """
+        saved_fen, saved_workers = self.to_fen(), (len(self.smp.procs) + 1 if self.smp else 1)
+        saved_root = self.root_workers
+        self.set_threads(1)
+        self.set_root_split(1)
+        base = 0.0
+        for fen, _ in PERFT_SUITE:
+            self.load_fen(fen)
+            self.clear_tt()
+            self.history_table = [0] * MOVE_SPACE
+            self.killer_moves = [[None, None] for _ in range(64)]
+            t0 = time.time()
+            self.smp_iterate(float('inf'), self.turn == 'red', depth)
+            base += time.time() - t0
+        print(f"serial (local TT): depth {depth} time {base:.2f}s", flush=True)
+        times = []
+        for workers in worker_counts:
+            pool = LazySMP(self, workers) # 进程启动不计时
+            self.tt, self.smp_stop = pool.tt, pool.stop_event
+            elapsed = 0.0
+            depths = []
+            for fen, _ in PERFT_SUITE:
+                self.load_fen(fen)
+                self.history_table = [0] * MOVE_SPACE
+                self.killer_moves = [[None, None] for _ in range(64)]
+                t0 = time.time()
+                _, _, reached, _ = pool.search(self, float('inf'), self.turn == 'red', depth, clear=True)
+                elapsed += time.time() - t0
+                depths.append(reached)
+            pool.close()
+            times.append(elapsed)
+            print(f"smp {workers}: depth {depth} time {elapsed:.2f}s speedup {times[0] / max(elapsed, 1e-9):.2f} "
+                  f"reached {depths} cpus {os.cpu_count()}", flush=True)
+        self.smp_stop = None
+        self.tt = TranspositionTable(self.tt_size)
+        self.set_threads(saved_workers)
+        self.set_root_split(saved_root)
+        self.load_fen(saved_fen)
+        return base, times
+
+    def root_benchmark(self, depth=5, worker_counts=ROOT_BENCH_WORKERS):
+        """
+        根节点并行和串行比较：PERFT_SUITE 每个局面迭代加深到 depth 层，给出相对串行 minimax 总时间的加速比，
+        并检查 (分数, 走法) 是否和不开进程池的 root_split 完全一样 (每个局面前清空置换表、历史表和杀手表，进程池启动不计时)。
+        """
+        saved_fen, saved_workers = self.to_fen(), self.root_workers
+        saved_threads = len(self.smp.procs) + 1 if self.smp else 1
+        self.set_threads(1)
+        def run(search):
+            out, elapsed = [], 0.0
+            for fen, _ in PERFT_SUITE:
+                self.load_fen(fen)
+                self.clear_tt()
+                self.history_table = [0] * MOVE_SPACE
+                self.killer_moves = [[None, None] for _ in range(64)]
+                t0 = time.time()
+                _, val, move = self.smp_iterate(float('inf'), self.turn == 'red', depth, search=search)
+                elapsed += time.time() - t0
+                out.append((val, move))
+            return out, elapsed
+        self.set_root_split(1)
+        _, base = run(self.minimax)
+        serial, _ = run(self.root_split)
+        print(f"serial: depth {depth} time {base:.2f}s", flush=True)
+        times = []
+        for workers in worker_counts:
+            self.set_root_split(workers)
+            result, elapsed = run(self.root_split)
+            times.append(elapsed)
+            same = sum(a == b for a, b in zip(serial, result))
+            print(f"root {workers}: depth {depth} time {elapsed:.2f}s speedup {base / max(elapsed, 1e-9):.2f} "
+                  f"identical {same}/{len(serial)} cpus {os.cpu_count()}", flush=True)
+        self.set_root_split(saved_workers)
+        self.set_threads(saved_threads)
+        self.load_fen(saved_fen)
+        return base, times
+
+    # --- perft / divide：单独测试走法生成的正确性和速度 ---
+    def perft(self, depth, use_tt=False):
+        """当前局面往下 depth 层的合法走法叶子数。use_tt 时用一张专用的小置换表合并相同局面"""
+        if use_tt and self.perft_tt is None:
+            self.perft_tt = [None] * PERFT_TT_SIZE
+        return self._perft(depth, self.turn == 'red', use_tt)
+
+    def _perft(self, depth, is_red_turn, use_tt):
+        if depth <= 0: return 1
+        if use_tt:
+            idx = (self.current_hash ^ depth) & (PERFT_TT_SIZE - 1)
+            entry = self.perft_tt[idx]
+            if entry is not None and entry[0] == self.current_hash and entry[1] == depth:
+                return entry[2]
+        moves = self.get_legal_moves(is_red_turn)
+        if depth == 1:
+            nodes = len(moves) # 最后一层只数不走
+        else:
+            nodes = 0
+            for move in moves:
+                captured = self.make_move(move)
+                nodes += self._perft(depth - 1, not is_red_turn, use_tt)
+                self.undo_move(move, captured)
+        if use_tt:
+            self.perft_tt[idx] = (self.current_hash, depth, nodes)
+        return nodes
+
+    def divide(self, depth):
+        """按根节点走法拆开的 perft，返回 [(走法, 叶子数), ...]，和别的引擎对数时定位差异用"""
+        is_red_turn = self.turn == 'red'
+        result = []
+        for move in self.get_legal_moves(is_red_turn):
+            captured = self.make_move(move)
+            result.append((move, self._perft(depth - 1, not is_red_turn, False)))
+            self.undo_move(move, captured)
+        result.sort(key=lambda item: move_to_rc(item[0]))
+        return result
+
+    def perft_suite(self, max_depth=3):
+        """把 PERFT_SUITE 里的局面逐个跑到 max_depth 层，核对叶子数，返回是否全部通过"""
+        saved_fen = self.to_fen()
+        all_ok = True
+        total_nodes, total_time = 0, 0.0
+        for fen, expected in PERFT_SUITE:
+            self.load_fen(fen)
+            for depth in range(1, min(max_depth, len(expected)) + 1):
+                t0 = time.time()
+                nodes = self.perft(depth)
+                elapsed = time.time() - t0
+                total_nodes += nodes
+                total_time += elapsed
+                ok = nodes == expected[depth - 1]
+                all_ok = all_ok and ok
+                print(f"{'ok  ' if ok else 'FAIL'} depth {depth} nodes {nodes} expected {expected[depth - 1]} "
+                      f"time {elapsed:.2f}s | {fen}", flush=True)
+        self.load_fen(saved_fen)
+        print(f"perft suite {'passed' if all_ok else 'FAILED'}: nodes {total_nodes} "
+              f"time {total_time:.2f}s nps {int(total_nodes / max(total_time, 1e-9))}", flush=True)
+        return all_ok
+
+    def run_perft_command(self, cmd):
+        """解析并执行 perft / divide 命令 (引擎协议和 cli 共用)：
+        perft <depth> [tt] | perft suite [max_depth] | divide <depth>"""
+        parts = cmd.split()
+        try:
+            if parts[0] == "perft" and len(parts) > 1 and parts[1] == "suite":
+                max_depth = int(parts[2]) if len(parts) > 2 else 3
+                if max_depth < 1: raise ValueError(max_depth)
+                self.perft_suite(max_depth)
+                return
+            depth = int(parts[1])
+            if depth < 1: raise ValueError(depth) # 深度至少 1 层
+        except (IndexError, ValueError):
+            print("用法: perft <depth> [tt] | perft suite [max_depth] | divide <depth>", flush=True)
+            return
+        t0 = time.time()
+        if parts[0] == "divide":
+            result = self.divide(depth)
+            for move, nodes in result:
+                r1, c1, r2, c2 = move_to_rc(move)
+                print(f"{r1} {c1} {r2} {c2}: {nodes}")
+            nodes = sum(n for _, n in result)
+            print(f"moves {len(result)}")
+        else:
+            nodes = self.perft(depth, use_tt=len(parts) > 2 and parts[2] == "tt")
+        elapsed = time.time() - t0
+        print(f"perft depth {depth} nodes {nodes} time {elapsed:.2f}s nps {int(nodes / max(elapsed, 1e-9))}", flush=True)
+    # --- 基准测试 ---
+    def eval_benchmark(self, depth=3):
+        """
+        对 PERFT_SUITE 的每个局面做固定深度搜索，分别用 子力+PST (原 evaluate)、渐进式评估、
+        以及已加载的 NNUE，比较 节点数 / 秒 (每种模式开始前清空置换表、评估缓存和历史表)。
+        开着懒惰评估时再用 子力+PST 核对着搜一遍，报告懒惰评估走了多少次、判错多少次。
+        """
+        saved_fen, saved_tapered, saved_nnue = self.to_fen(), self.use_tapered, self.use_nnue
+        def run():
+            nodes, elapsed, hits, wrong = 0, 0.0, 0, 0
+            for fen, _ in PERFT_SUITE:
+                self.load_fen(fen) # 会重新累加 taper 分项 / NNUE 累加器
+                self.clear_tt()
+                self.eval_cache_keys = [-1] * EVAL_CACHE_SIZE
+                self.history_table = [0] * MOVE_SPACE
+                self.killer_moves = [[None, None] for _ in range(64)]
+                self.reset_search_stats()
+                self.stop_search = False
+                self.time_limit = float('inf')
+                start_nodes = self.nodes
+                t0 = time.time()
+                self.minimax(depth, -SCORE_INF, SCORE_INF, self.turn == 'red')
+                elapsed += time.time() - t0
+                nodes += self.nodes - start_nodes
+                hits += self.lazy_eval_hits
+                wrong += self.lazy_eval_wrong
+            return nodes, elapsed, hits, wrong
+        modes = [("material+pst", False, False), ("tapered", True, False)]
+        if self.nnue is not None: modes.append(("nnue", False, True))
+        results = []
+        for name, tapered, nnue in modes:
+            self.use_tapered, self.use_nnue = tapered, nnue
+            nodes, elapsed, _, _ = run()
+            nps = int(nodes / max(elapsed, 1e-9))
+            results.append(nps)
+            print(f"{name}: depth {depth} nodes {nodes} time {elapsed:.2f}s nps {nps}", flush=True)
+        for (name, _, _), nps in zip(modes[1:], results[1:]):
+            print(f"{name} / material+pst nps: {nps / max(results[0], 1):.2f}", flush=True)
+        if LAZY_EVAL and USE_RELATION:
+            self.use_tapered, self.use_nnue, self.lazy_eval_verify = False, False, True
+            _, _, hits, wrong = run()
+            print(f"lazy eval: depth {depth} margin {LAZY_EVAL_MARGIN} shortcuts {hits} wrong {wrong}", flush=True)
+        else:
+            print("lazy eval: off (需要 LAZY_EVAL=1 且 USE_RELATION=1)", flush=True)
+        self.use_tapered, self.use_nnue = saved_tapered, saved_nnue
+        self.lazy_eval_verify = LAZY_EVAL_VERIFY
+        self.eval_cache_keys = [-1] * EVAL_CACHE_SIZE
+        self.load_fen(saved_fen)
+        return results
+
+    def run_bench_command(self, cmd):
+        """
+        解析并执行基准测试命令 (引擎协议和 cli 共用)：
+        bench eval [depth] / bench smp [depth] [进程数...] / bench root [depth] [进程数...]
+        """
+        parts = cmd.split()
+        try:
+            if parts[1] == "eval":
+                self.eval_benchmark(int(parts[2]) if len(parts) > 2 else 3)
+                return
+            if parts[1] == "smp":
+                counts = tuple(int(x) for x in parts[3:]) or SMP_BENCH_WORKERS
+                self.smp_benchmark(int(parts[2]) if len(parts) > 2 else 5, counts)
+                return
+            if parts[1] == "root":
+                counts = tuple(int(x) for x in parts[3:]) or ROOT_BENCH_WORKERS
+                self.root_benchmark(int(parts[2]) if len(parts) > 2 else 5, counts)
+                return
+        except (IndexError, ValueError):
+            pass
+        print("用法: bench eval [depth] / bench smp [depth] [进程数...] / bench root [depth] [进程数...]", flush=True)
+
     def print_board(self):
         os.system('cls' if os.name == 'nt' else 'clear')
         print(f"\n      {BOLD}Python 中国象棋 AI (Zobrist + TT 加速版){RESET}\n")
@@ -1324,16 +3072,16 @@ class XiangqiCLI:
         for r in range(ROWS):
             line_str = f" {r} | "
             for c in range(COLS):
-                piece = self.board[r][c]
-                char = PIECE_CHARS.get(piece, piece)
-                if piece == '.': color = "\033[90m"
+                piece = self.board[RC_TO_SQ[r][c]]
+                char = PIECE_CHARS[CODE_TO_CHAR[piece]]
+                if piece == EMPTY: color = "\033[90m"
                 elif self.is_red(piece): color = RED_TXT
                 else: color = BLACK_TXT
                 line_str += f"{color}{char}{RESET} "
             print(line_str)
             if r == 4: print("   | " + "=" * 25 + " |")
         print(f"\n   当前回合: {RED_TXT + '红方' if self.turn == 'red' else BLACK_TXT + '黑方'}{RESET}")
-        print(f"   TT 缓存条目数: {len(self.tt)}")
+        print(f"   TT 缓存条目数: {len(self.tt)} (hashfull {self.tt.hashfull()})")
     
     def start_game(self):
         print("欢迎来到中国象棋！AI 采用经典位置价值算法。")
@@ -1350,17 +3098,31 @@ class XiangqiCLI:
                 # --- 玩家回合 ---
                 move_ok = False
                 while not move_ok:
-                    cmd = input(">>> 请输入移动 (例如 9 1 7 2) 或 q 退出: ").strip()
+                    cmd = input(">>> 请输入移动 (例如 9 1 7 2)、perft/divide <深度>、bench eval、nnue <文件>/off、tt save/load <文件> 或 q 退出: ").strip()
                     if cmd == 'q': return
+                    if cmd.startswith("tt "):
+                        self.run_tt_command(cmd)
+                        continue
+                    if cmd.startswith("nnue"):
+                        parts = cmd.split(maxsplit=1)
+                        if len(parts) == 2: self.set_nnue(parts[1].strip())
+                        continue
+                    if cmd.startswith("perft") or cmd.startswith("divide"):
+                        self.run_perft_command(cmd)
+                        continue
+                    if cmd.startswith("bench"):
+                        self.run_bench_command(cmd)
+                        continue
                     try:
                         coords = list(map(int, cmd.split()))
                         if len(coords)==4:
                             r1,c1,r2,c2 = coords
                             if self.in_board(r1,c1) and self.in_board(r2,c2):
-                                if self.is_red(self.board[r1][c1]) == (self.player_side=='red'):
-                                    valid_moves = self.get_valid_moves(r1,c1)
-                                    if (r2,c2) in valid_moves:
-                                        captured_piece = self.make_move((r1,c1),(r2,c2))
+                                start, end = RC_TO_SQ[r1][c1], RC_TO_SQ[r2][c2]
+                                if self.board[start] != EMPTY and self.is_red(self.board[start]) == (self.player_side=='red'):
+                                    valid_moves = self.get_valid_moves(start)
+                                    if end in valid_moves:
+                                        captured_piece = self.make_move(pack_move(start, end))
                                         move_ok = True
                                     else: print("违规移动：不符合走法规则")
                                 else: print("违规：这不是你的棋子")
@@ -1378,6 +3140,8 @@ class XiangqiCLI:
                     else:
                         DEPTH = LONG_MAX_DEPTH # 中后期加深到6层
                     print(f">>> AI 正在思考 (深度 {DEPTH})...")
+                    self.reset_search_stats()
+                    self.tt.new_search()
                     val, best = self.minimax(DEPTH, -float(SCORE_INF ), float(SCORE_INF ), is_ai_red)
                 else:
                     MAX_TIME = 10.0 if  cnt<=3 else LONG_MAX_TIME  # 每步最多思考 10 秒(仅在非固定深度时生效) 
@@ -1385,23 +3149,22 @@ class XiangqiCLI:
                     val, best = self.search_main(MAX_TIME, is_ai_red)
                 
                 
-                print(f"思考耗时: {time.time()-t0:.2f}s, 评估分: {val}")
+                print(f"思考耗时: {time.time()-t0:.2f}s, 评估分: {val}, 评估缓存命中率: {self.eval_cache_hit_rate():.1%}")
                 
                 if best:
-                    captured_piece = self.make_move(best[0], best[1])
+                    captured_piece = self.make_move(best)
                     # AI 走完稍微暂停一下让人看清
                     time.sleep(1)
                 else:
                     print("AI 认输 (被绝杀或无棋可走)")
                     self.game_over = True
-            if captured_piece != '.':
+            if captured_piece != EMPTY:
                 self.hash_count = {self.current_hash: 1}
             # 简单的胜负检查
             ks = [0,0]
-            for r in range(ROWS):
-                for c in range(COLS):
-                    if self.board[r][c]=='K': ks[0]=1
-                    elif self.board[r][c]=='k': ks[1]=1
+            for sq in BOARD_SQUARES:
+                if self.board[sq]==RED | KING: ks[0]=1
+                elif self.board[sq]==BLACK | KING: ks[1]=1
             if sum(ks)<2:
                 self.print_board()
                 winner = "红方" if ks[0] else "黑方"
@@ -1416,14 +3179,14 @@ class XiangqiCLI:
             empty = 0
             row_str = ""
             for c in range(COLS):
-                p = self.board[r][c]
-                if p == '.':
+                p = self.board[RC_TO_SQ[r][c]]
+                if p == EMPTY:
                     empty += 1
                 else:
                     if empty > 0:
                         row_str += str(empty)
                         empty = 0
-                    row_str += p
+                    row_str += CODE_TO_CHAR[p]
             if empty > 0:
                 row_str += str(empty)
             fen_rows.append(row_str)
@@ -1432,8 +3195,27 @@ class XiangqiCLI:
         # 简化版 FEN，对于云库查询足够了
         return "/".join(fen_rows) + f" {side} - - 0 1"
 
+    def load_fen(self, fen):
+        """从 FEN 设置局面 (只看棋盘和行棋方两段)，分数、Hash、子列表、掩码全部重算"""
+        parts = fen.split()
+        board = [OFFBOARD] * BOARD_SIZE
+        for r, row_str in enumerate(parts[0].split('/')):
+            c = 0
+            for ch in row_str:
+                if ch.isdigit():
+                    for _ in range(int(ch)):
+                        board[RC_TO_SQ[r][c]] = EMPTY
+                        c += 1
+                else:
+                    board[RC_TO_SQ[r][c]] = CHAR_TO_CODE[ch]
+                    c += 1
+        self.board = board
+        self.turn = 'black' if len(parts) > 1 and parts[1] == 'b' else 'red'
+        self.king_pos = [None, None]
+        self.init_score_and_hash()
+
     def uci_to_move(self, uci):
-        """将 UCI (如 'h2e2') 转换为坐标 ((r1,c1), (r2,c2))"""
+        """将 UCI (如 'h2e2') 转换为整数走法"""
         # UCI 列: a-i (0-8), 行: 0-9 (红方底线是0)
         # 注意：engine 内部数组 row 0 是黑方底线，需映射
         try:
@@ -1441,7 +3223,7 @@ class XiangqiCLI:
             r1 = 9 - int(uci[1])
             c2 = ord(uci[2]) - ord('a')
             r2 = 9 - int(uci[3])
-            return (r1, c1), (r2, c2)
+            return rc_to_move(r1, c1, r2, c2)
         except:
             return None
     def query_pikafish_book(self):
@@ -1531,8 +3313,245 @@ class XiangqiCLI:
             with open("log.txt", "a") as f:
                 print(f"云库查询失败: {e}", file=f)
             return None
+# --- 批量静态评估 (离线工具：数据集质检、调参、和皮卡鱼标注对比；需要 numpy) ---
+# 不建 XiangqiCLI，直接把 FEN 编码成 (N, 90) 的 int8 棋子编码数组，用同一套 PIECE_SQUARE_SCORE
+# (即 PST_MAP + PIECE_VALUES) 和 EV_* 权重向量化计算，结果与 evaluate() 的 子力+PST (+ 关系分) 逐个相同。
+_FEN_DIGITS = str.maketrans({str(_n): '.' * _n for _n in range(1, 10)} | {'/': ''})
+_FEN_CODES = bytes(CHAR_TO_CODE.get(chr(_i), 255) for _i in range(256))
+_batch_tables = None
+EVAL_BATCH_CHUNK = 1 << 13 # 每块局面数
+
+def encode_fens(fens):
+    """FEN 列表 -> (N, 90) int8 棋子编码 (行优先，row 0 是黑方底线，与 RC_TO_SQ 一致)"""
+    if np is None: raise ImportError("encode_fens / evaluate_batch 需要 numpy")
+    rows = [fen.split()[0].translate(_FEN_DIGITS) for fen in fens]
+    for fen, row in zip(fens, rows):
+        if len(row) != ROWS * COLS: raise ValueError(f"FEN 棋盘部分不是 90 格: {fen}")
+    codes = np.frombuffer(''.join(rows).encode('ascii').translate(_FEN_CODES), dtype=np.uint8)
+    if codes.size and codes.max() == 255: raise ValueError("FEN 里有无法识别的棋子字符")
+    return codes.astype(np.int8).reshape(len(fens), ROWS * COLS)
+
+def _get_batch_tables():
+    """PIECE_SQUARE_SCORE 换成 (棋子编码, 90) 的数组，第一次用时才建"""
+    global _batch_tables
+    if _batch_tables is None:
+        _batch_tables = np.array([[PIECE_SQUARE_SCORE[p][sq] for sq in BOARD_SQUARES] for p in range(COLOR_MASK)],
+                                 dtype=np.int64)
+    return _batch_tables
+
+def _batch_empty_runs(empty):
+    """每格沿 左/右/上/下 连续空格数 (不含本格)，empty 为 (N, 10, 9) bool；返回 4 个 (N, 10, 9) 数组"""
+    e = empty.astype(np.int64)
+    left, right, up, down = (np.zeros_like(e) for _ in range(4))
+    for c in range(1, COLS):
+        left[:, :, c] = e[:, :, c - 1] * (1 + left[:, :, c - 1])
+    for c in range(COLS - 2, -1, -1):
+        right[:, :, c] = e[:, :, c + 1] * (1 + right[:, :, c + 1])
+    for r in range(1, ROWS):
+        up[:, r] = e[:, r - 1] * (1 + up[:, r - 1])
+    for r in range(ROWS - 2, -1, -1):
+        down[:, r] = e[:, r + 1] * (1 + down[:, r + 1])
+    return left, right, up, down
+
+def _batch_relation_scores(board):
+    """与 get_relation_score 相同的关系分，board 为 (N, 10, 9) 棋子编码"""
+    n = board.shape[0]
+    score = np.zeros(n, dtype=np.int64)
+    rows = np.arange(ROWS).reshape(1, ROWS, 1)
+    cols = np.arange(COLS).reshape(1, 1, COLS)
+
+    # A. 连兵 (过河兵，和左边的友军相连)
+    red_pawn, black_pawn = board == (RED | PAWN), board == (BLACK | PAWN)
+    score += EV_LINKED_PAWNS * (red_pawn[:, :5, 1:] & red_pawn[:, :5, :-1]).sum(axis=(1, 2))
+    score -= EV_LINKED_PAWNS * (black_pawn[:, 5:, 1:] & black_pawn[:, 5:, :-1]).sum(axis=(1, 2))
+
+    # B/C. 空头炮与中炮：中路最靠上的己方炮和中路上的敌方老将之间的子数
+    mid = board[:, :, 4]
+    mid_occ = mid != EMPTY
+    col_rows = np.arange(ROWS).reshape(1, ROWS)
+    for own, enemy, sign in ((RED, BLACK, 1), (BLACK, RED, -1)):
+        cannon = mid == (own | CANNON)
+        king = mid == (enemy | KING)
+        active = cannon.any(axis=1) & king.any(axis=1)
+        c_row, k_row = cannon.argmax(axis=1), king.argmax(axis=1)
+        lo, hi = np.minimum(c_row, k_row)[:, None], np.maximum(c_row, k_row)[:, None]
+        blockers = (mid_occ & (col_rows > lo) & (col_rows < hi)).sum(axis=1)
+        score += sign * active * np.where(blockers == 0, EV_HOLLOW_CANNON, np.where(blockers <= 2, EV_CENTRAL_CANNON, 0))
+
+    # D. 士象全
+    for own, sign in ((RED, 1), (BLACK, -1)):
+        full = (((board == (own | ADVISOR)).sum(axis=(1, 2)) == 2) &
+                ((board == (own | BISHOP)).sum(axis=(1, 2)) == 2))
+        score += sign * EV_FULL_GUARDS * full
+
+    # 4. 机动性 + 将帅安全 (车马炮)
+    left, right, up, down = _batch_empty_runs(board == EMPTY)
+    cannon_cnt = left + right + up + down
+    # 车：空格 + 各方向第一个碰到的子 (没走到边就一定碰到了子)
+    rook_cnt = cannon_cnt + (left < cols) + (right < COLS - 1 - cols) + (up < rows) + (down < ROWS - 1 - rows)
+    padded = np.full((n, ROWS + 4, COLS + 4), OFFBOARD, dtype=np.int8)
+    padded[:, 2:-2, 2:-2] = board
+    for own, enemy, sign in ((RED, BLACK, 1), (BLACK, RED, -1)):
+        rook, knight, cannon = board == (own | ROOK), board == (own | KNIGHT), board == (own | CANNON)
+        side_score = ((rook_cnt * EV_MOBILITY['r'] + (rook_cnt < 2) * EV_ROOK_TRAPPED) * rook).sum(axis=(1, 2))
+        side_score += (cannon_cnt * EV_MOBILITY['c'] * cannon).sum(axis=(1, 2))
+        knight_cnt = np.zeros(board.shape, dtype=np.int64)
+        for d, leg in KNIGHT_DELTAS:
+            dr, dc = (d + 2 * BOARD_W + 2) // BOARD_W - 2, (d + 2 * BOARD_W + 2) % BOARD_W - 2
+            lr, lc = (leg + BOARD_W + 1) // BOARD_W - 1, (leg + BOARD_W + 1) % BOARD_W - 1
+            to = padded[:, 2 + dr:2 + dr + ROWS, 2 + dc:2 + dc + COLS]
+            leg_sq = padded[:, 2 + lr:2 + lr + ROWS, 2 + lc:2 + lc + COLS]
+            knight_cnt += (leg_sq == EMPTY) & ((to & own) == 0)
+        side_score += (knight_cnt * EV_MOBILITY['n'] * knight).sum(axis=(1, 2))
+        # 敌方老将曼哈顿距离 3 以内的车马炮
+        king = (board == (enemy | KING)).reshape(n, -1)
+        has_king = king.any(axis=1)
+        k_idx = king.argmax(axis=1)
+        k_row, k_col = (k_idx // COLS).reshape(n, 1, 1), (k_idx % COLS).reshape(n, 1, 1)
+        near = np.abs(rows - k_row) + np.abs(cols - k_col) <= 3
+        side_score += EV_ATTACK_KING * has_king * ((rook | knight | cannon) & near).sum(axis=(1, 2))
+        score += sign * side_score
+    return score
+
+def evaluate_batch(fens, use_relation=None):
+    """
+    一次评估很多局面，返回 int64 数组 (红正黑负)，与 USE_PIKAFISH=0、USE_TAPERED=0 时的 evaluate() 逐个相同。
+    use_relation 默认跟随 USE_RELATION。fens 也可以直接传 encode_fens 的结果。
+    """
+    board = fens if np is not None and isinstance(fens, np.ndarray) else encode_fens(fens)
+    relation = USE_RELATION if use_relation is None else use_relation
+    table = _get_batch_tables()
+    scores = np.empty(board.shape[0], dtype=np.int64)
+    # 分块算，几十万个局面时中间数组也不会占太多内存
+    for lo in range(0, board.shape[0], EVAL_BATCH_CHUNK):
+        chunk = board[lo:lo + EVAL_BATCH_CHUNK]
+        part = table[chunk.astype(np.intp), np.arange(ROWS * COLS)].sum(axis=1)
+        if relation:
+            part += _batch_relation_scores(chunk.reshape(-1, ROWS, COLS))
+        scores[lo:lo + len(chunk)] = part
+    return scores
+
+class LazySMP:
+    """
+    Lazy SMP：主进程和 workers - 1 个常驻辅助进程对同一局面各自迭代加深，只通过 SharedTT 互相借结果。
+    奇数号辅助进程从深度 2 开始，并给根节点走法的历史分加一点随机扰动，让各进程的搜索树错开。
+    谁先结束 (超时、绝杀、搜到指定深度) 就置 stop_event，其余进程随之停下；取完成深度最深的结果。
+    """
+    def __init__(self, engine, workers):
+        ctx = multiprocessing.get_context("spawn") # 和 Windows 一样，子进程重新 import 本文件
+        self.tt = SharedTT(engine.tt_size)
+        self.stop_event = ctx.Event()
+        self.results = ctx.Queue()
+        self.commands = []
+        self.procs = []
+        for wid in range(1, workers):
+            commands = ctx.Queue()
+            proc = ctx.Process(target=_smp_worker, daemon=True,
+                               args=(wid, self.tt.shm.name, engine.tt_size, commands, self.results, self.stop_event))
+            proc.start()
+            self.commands.append(commands)
+            self.procs.append(proc)
+
+    def search(self, engine, max_time, is_ai_red, max_depth=63, clear=False):
+        """主进程也参与搜索；返回 (val, move, 完成深度, 进程号)。clear 时先清空置换表和辅助进程的历史表"""
+        if clear: self.tt.clear()
+        self.stop_event.clear()
+        job = (engine.to_fen(), dict(engine.hash_count), max_time, max_depth, is_ai_red, clear,
+               engine.use_tapered, engine.nnue_file if engine.use_nnue else None, engine.tt.age)
+        for commands in self.commands:
+            commands.put(job)
+        depth, val, move = engine.smp_iterate(max_time, is_ai_red, max_depth)
+        self.stop_event.set()
+        results = [(depth, 0, val, move)] if move is not None else []
+        pending = len(self.procs)
+        while pending:
+            try:
+                wid, depth, val, move = self.results.get(timeout=1.0)
+            except Empty:
+                if not all(proc.is_alive() for proc in self.procs):
+                    print("Lazy SMP 辅助进程意外退出", file=sys.stderr, flush=True)
+                    break
+                continue
+            pending -= 1
+            if move is not None: results.append((depth, wid, val, move))
+        if not results: return 0, None, 0, 0
+        depth, wid, val, move = max(results, key=lambda r: (r[0], -r[1])) # 同样深度优先用主进程的
+        return val, move, depth, wid
+
+    def close(self):
+        self.stop_event.set() # 还在搜的辅助进程先停下，才能正常退出、关掉自己的皮卡鱼
+        for commands in self.commands:
+            commands.put(None)
+        for proc in self.procs:
+            proc.join(timeout=SMP_JOIN_TIMEOUT)
+            if proc.is_alive(): proc.terminate()
+        self.tt.close(unlink=True)
+
+def _smp_worker(wid, shm_name, tt_size, commands, results, stop_event):
+    """Lazy SMP 辅助进程：常驻，收到局面就在共享置换表上迭代加深，把最后完整深度的结果发回主进程"""
+    engine = XiangqiCLI(tt=SharedTT(tt_size, shm_name), start_pikafish=bool(USE_PIKAFISH))
+    engine.smp_stop = stop_event
+    rng = random.Random(wid)
+    while True:
+        job = commands.get()
+        if job is None: break
+        fen, hash_count, max_time, max_depth, is_ai_red, clear, use_tapered, nnue_file, engine.tt.age = job
+        engine.sync_eval_options(use_tapered, nnue_file)
+        engine.load_fen(fen)
+        engine.hash_count = hash_count
+        if clear:
+            engine.history_table = [0] * MOVE_SPACE
+            engine.killer_moves = [[None, None] for _ in range(64)]
+        start_depth = 1
+        if wid % 2 == 1:
+            start_depth = 2
+            for move in engine.get_legal_moves(is_ai_red):
+                engine.history_table[move] += rng.randint(0, 64)
+        depth, val, move = engine.smp_iterate(max_time, is_ai_red, max_depth, start_depth)
+        if not engine.stop_search: stop_event.set() # 自己正常结束了，其它进程也不用再搜
+        results.put((wid, depth, val, move))
+    engine.tt.close()
+    engine.close()
+
+# 根节点并行的进程池子进程：每个进程常驻一个引擎，任务只带局面和要搜的那一步
+_root_engine = None
+_root_history_shm = None # 主进程放历史表快照的共享内存
+_root_history = (0, None) # (快照编号, 读出来的历史表)
+
+def _root_worker_init(abort_event, shm_name, tt_size, history_name):
+    global _root_engine, _root_history_shm
+    _root_engine = XiangqiCLI(tt=SharedTT(tt_size, shm_name), start_pikafish=bool(USE_PIKAFISH))
+    _root_history_shm = shared_memory.SharedMemory(name=history_name)
+    _root_engine.smp_stop = abort_event # is_time_up 顺带检查，主进程剪枝 / 超时后叫停
+    atexit.register(_root_worker_exit) # 进程池 shutdown 时子进程正常退出，顺便关掉皮卡鱼
+
+def _root_worker_exit():
+    _root_engine.tt.close()
+    _root_engine.close()
+    _root_history_shm.close()
+
+def _root_worker_ping():
+    return os.getpid()
+
+def _root_worker_search(job):
+    """在子进程里按主进程给的界和快照搜根节点的一个走法，返回 (分数, 置换表条目, 节点数, 是否被叫停)"""
+    global _root_history
+    fen, hash_count, (use_tapered, nnue_file), tt_age, start_time, time_limit, history_id, killers, args = job
+    if _root_history[0] != history_id: # 新的一层：从共享内存读一次历史表快照
+        _root_history = (history_id, _root_history_shm.buf.cast('q').tolist())
+    engine = _root_engine
+    engine.tt.age = tt_age
+    engine.sync_eval_options(use_tapered, nnue_file)
+    engine.load_fen(fen)
+    engine.hash_count = hash_count
+    engine.start_time, engine.time_limit, engine.stop_search = start_time, time_limit, False
+    start_nodes = engine.nodes
+    score, entries = engine.search_root_move_isolated(_root_history[1], killers, args)
+    return score, entries, engine.nodes - start_nodes, engine.stop_search
+
 def start_engine(long_max_depth=LONG_MAX_DEPTH):
     engine = XiangqiCLI()
+    if TT_FILE and os.path.exists(TT_FILE): engine.load_tt(TT_FILE)
 
     print("ready", flush=True)
     cnt=0
@@ -1553,10 +3572,43 @@ def start_engine(long_max_depth=LONG_MAX_DEPTH):
         elif cmd.startswith("move"):
             # move r1 c1 r2 c2
             _, r1, c1, r2, c2 = cmd.split()
-            captured_piece = engine.make_move((int(r1),int(c1)), (int(r2),int(c2)))
-            if captured_piece != '.':
+            captured_piece = engine.make_move(rc_to_move(int(r1), int(c1), int(r2), int(c2)))
+            if captured_piece != EMPTY:
                 engine.history = [engine.current_hash]
 
+        elif cmd.startswith("perft") or cmd.startswith("divide"):
+            # perft <depth> [tt] / perft suite [max_depth] / divide <depth>
+            engine.run_perft_command(cmd)
+
+        elif cmd.startswith("bench"):
+            # bench eval [depth]
+            engine.run_bench_command(cmd)
+
+        elif cmd.startswith("setoption"):
+            # setoption Hash <MB> / setoption Threads <N> / setoption RootSplit <N>
+            parts = cmd.split()
+            if len(parts) == 3 and parts[2].isdigit():
+                workers = max(1, int(parts[2]))
+                if parts[1] == "Hash":
+                    engine.set_hash(workers)
+                    print(f"Hash {workers} ({engine.tt_size} entries)", flush=True)
+                elif parts[1] == "Threads":
+                    engine.set_threads(workers)
+                    print(f"Threads {workers}", flush=True)
+                elif parts[1] == "RootSplit":
+                    engine.set_root_split(workers)
+                    print(f"RootSplit {workers}", flush=True)
+
+        elif cmd.startswith("tt "):
+            # tt save <文件> / tt load <文件>
+            engine.run_tt_command(cmd)
+
+        elif cmd.startswith("nnue"):
+            # nnue <权重文件> / nnue off
+            parts = cmd.split(maxsplit=1)
+            if len(parts) == 2 and engine.set_nnue(parts[1].strip()):
+                print(f"nnue {'off' if not engine.use_nnue else parts[1].strip()}", flush=True)
+
         elif cmd.startswith("search"):
             t0 = time.time()
             cnt+=1
@@ -1566,22 +3618,27 @@ def start_engine(long_max_depth=LONG_MAX_DEPTH):
                     DEPTH = long_max_depth
                 else:
                     DEPTH = long_max_depth # 中后期加深到6层
-                val, best = engine.minimax(DEPTH, -float(SCORE_INF ), float(SCORE_INF ), is_ai_red)
+                engine.reset_search_stats()
+                engine.tt.new_search()
+                search = engine.root_split if engine.root_pool is not None else engine.minimax
+                val, best = search(DEPTH, -float(SCORE_INF ), float(SCORE_INF ), is_ai_red)
             else:
                 MAX_TIME = 10.0 if  cnt<=3 else LONG_MAX_TIME # 每步最多思考 10 秒(仅在非固定深度时生效) 
                 print(f">>> AI 正在思考 (限时 {MAX_TIME} 秒)...")
                 val, best = engine.search_main(MAX_TIME, is_ai_red)
 
             if best:
-                (r1,c1),(r2,c2) = best
-                captured_piece=engine.make_move(best[0], best[1])
-                if captured_piece != '.':
+                r1, c1, r2, c2 = move_to_rc(best)
+                captured_piece=engine.make_move(best)
+                if captured_piece != EMPTY:
                     engine.history = [engine.current_hash]
                 print(f"move {r1} {c1} {r2} {c2}", flush=True)
             else:
                 print("resign", flush=True)
             with open("log.txt", "a", encoding="utf-8") as f:
-                print(f"思考耗时: {time.time()-t0:.2f}s, 评估分: {val} ", file=f)
+                print(f"思考耗时: {time.time()-t0:.2f}s, 评估分: {val}, 评估缓存命中率: {engine.eval_cache_hit_rate():.1%}, hashfull {engine.tt.hashfull()} ", file=f)
+    if TT_FILE: engine.save_tt(TT_FILE)
+    engine.close()
 
 
 
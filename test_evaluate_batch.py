@@ -0,0 +1,43 @@
+"""evaluate_batch 和逐个 evaluate() 的一致性测试：python -m pytest test_evaluate_batch.py"""
+import random
+
+import pytest
+
+import ai
+
+pytest.importorskip("numpy")
+
+WALKS = 40 # 从开局随机走出来的局面条数
+WALK_PLIES = 30
+
+def walk_fens():
+    """PERFT_SUITE 的局面 + 从开局按固定种子随机走出来的局面 (走子方红黑都有)"""
+    fens = [fen for fen, _ in ai.PERFT_SUITE]
+    engine = ai.XiangqiCLI(start_pikafish=False)
+    rng = random.Random(2024)
+    for _ in range(WALKS):
+        engine.load_fen(ai.PERFT_SUITE[0][0])
+        red = True
+        for _ in range(rng.randint(1, WALK_PLIES)):
+            moves = engine.get_legal_moves(red)
+            if not moves: break
+            engine.make_move(rng.choice(moves))
+            red = not red
+        fens.append(engine.to_fen())
+    engine.close()
+    return fens
+
+FENS = walk_fens()
+
+@pytest.mark.parametrize("use_relation", [False, True])
+def test_batch_matches_evaluate(monkeypatch, use_relation):
+    monkeypatch.setattr(ai, "USE_RELATION", use_relation)
+    monkeypatch.setattr(ai, "USE_TAPERED", 0) # evaluate_batch 只对应不分阶段的评估
+    engine = ai.XiangqiCLI(start_pikafish=False) # 新引擎：评估缓存里没有另一种模式的分数
+    expected = []
+    for fen in FENS:
+        engine.load_fen(fen)
+        expected.append(engine.evaluate(use_pikafish=False))
+    engine.close()
+    assert ai.evaluate_batch(ai.encode_fens(FENS)).tolist() == expected
+    assert ai.evaluate_batch(FENS, use_relation=use_relation).tolist() == expected
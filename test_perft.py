@@ -0,0 +1,30 @@
+"""走法生成的回归测试：PERFT_SUITE 各局面 1~3 层的叶子数：python -m pytest test_perft.py"""
+import pytest
+
+import ai
+
+MAX_DEPTH = 3
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = ai.XiangqiCLI(start_pikafish=False)
+    yield engine
+    engine.close()
+
+@pytest.mark.parametrize("fen, counts", ai.PERFT_SUITE)
+def test_perft_counts(engine, fen, counts):
+    engine.load_fen(fen)
+    for depth, expected in enumerate(counts[:MAX_DEPTH], 1):
+        assert engine.perft(depth) == expected, f"depth {depth}"
+
+@pytest.mark.parametrize("fen, counts", ai.PERFT_SUITE)
+def test_perft_tt_counts(engine, fen, counts):
+    engine.load_fen(fen)
+    assert engine.perft(MAX_DEPTH, use_tt=True) == counts[MAX_DEPTH - 1]
+
+@pytest.mark.parametrize("fen, counts", ai.PERFT_SUITE)
+def test_perft_restores_position(engine, fen, counts):
+    engine.load_fen(fen)
+    before = (engine.to_fen(), engine.current_hash, engine.current_score)
+    engine.perft(2)
+    assert (engine.to_fen(), engine.current_hash, engine.current_score) == before
@@ -0,0 +1,73 @@
+"""关系评估 (get_relation_score) 的回归测试：python -m pytest test_relation.py"""
+import random
+
+import pytest
+
+import ai
+
+# (局面, 分数)：分数和改写成棋子列表之前的整盘扫描版本逐个相同
+EXPECTED = [
+    ('rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w', 0),
+    ('r1ba1a3/4kn3/2n1b4/pNp1p1p1p/4c4/6P2/P1P2R2P/1CcC5/9/2BAKAB2 w', -116),
+    ('1cbak4/9/n2a5/2p1p3p/5cp2/2n2N3/6PCP/3AB4/2C6/3A1K1N1 w', -36),
+    ('5a3/3k5/3aR4/9/5r3/5n3/9/3A1A3/5K3/2BC2B2 w', -8),
+    ('CRN1k1b2/3ca4/4ba3/9/2nr5/9/9/4B4/4A4/4KA3 w', -36),
+    ('R1N1k1b2/9/3aba3/9/2nr5/2B6/9/4B4/4A4/4KA3 w', 20),
+    ('r1ba2b1r/4ak3/2n4cn/p1p1p1p1p/9/1c5C1/PCP1P1P1P/N3B4/4K3N/R1BA1A2R w', -6),
+    ('r1baC1b1r/2nka4/2c5n/p1p3p1p/9/PcP6/4P1P1P/R3B4/1C3N2R/1NBAKA3 b', 8),
+    ('rn1akab1r/9/b1nC5/2p1p1p1p/p8/1c7/P1P1P1P1P/1C5c1/4A3R/RNBA1KBN1 b', 8),
+    ('r1bakabnr/9/2n6/2p3pcp/p3p4/5CP1P/P1P1P4/2c6/4N4/RNBAKAB1R b', -42),
+    ('rn1a1kbnr/4a4/CR4c2/p1p1p1p1p/9/6P1P/P1P1P4/2N3c2/7C1/2BAKABNR w', 118),
+    ('rnb1ka1nr/9/b2aC2C1/p1p1p3p/9/5c3/P1P1P1P1P/R1N1BA3/9/4KAB1R b', 244),
+    ('r2kc1bnc/2C6/2na2r2/p1p3p2/4p3p/6P2/P1P1P3P/C8/8R/1NBAKABNR b', 88),
+    ('rnbakab2/9/6ncr/2p1p1p1p/pC5C1/2P6/P5P1P/1R7/R8/1cBAKABN1 b', 142),
+    ('rnbakabnr/8c/1c7/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/4K4/RNBA1ABNR b', 24),
+    ('rnbakabnr/9/4c3c/p3p1pCp/2p6/1C4B2/P1P1P1P1P/9/9/RNBAKA1NR b', 22),
+    ('4k4/9/9/9/9/9/9/4C4/9/3K5 w', 296), # 空头炮
+    ('4k4/9/4p4/9/9/9/4P4/4C4/9/3K5 w', 110), # 中炮
+    ('3k5/9/9/9/3PP4/9/9/9/9/4K4 w', 30), # 连兵
+    ('2bakab2/9/9/9/9/9/9/9/9/3K5 b', -40), # 士象全
+]
+WALKS = 20 # 每个 PERFT_SUITE 局面随机走几条
+WALK_PLIES = 24
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = ai.XiangqiCLI(start_pikafish=False)
+    yield engine
+    engine.close()
+
+@pytest.fixture(scope="module")
+def reference():
+    engine = ai.XiangqiCLI(start_pikafish=False)
+    yield engine
+    engine.close()
+
+def snapshot(engine):
+    return engine.get_relation_score(), engine.current_score, engine.current_hash
+
+@pytest.mark.parametrize("fen, expected", EXPECTED)
+def test_relation_score(engine, fen, expected):
+    engine.load_fen(fen)
+    assert engine.get_relation_score() == expected
+
+@pytest.mark.parametrize("fen", [fen for fen, _ in ai.PERFT_SUITE])
+def test_make_undo_matches_load_fen(engine, reference, fen):
+    """随机走子 / 悔棋后，棋子列表、占位掩码和增量分数都要和重新 load_fen 的一样"""
+    rng = random.Random(fen)
+    engine.load_fen(fen)
+    start = snapshot(engine)
+    for _ in range(WALKS):
+        red = engine.turn == 'red'
+        played = []
+        for _ in range(rng.randint(1, WALK_PLIES)):
+            moves = engine.get_legal_moves(red)
+            if not moves: break
+            move = rng.choice(moves)
+            played.append((move, engine.make_move(move)))
+            red = not red
+            reference.load_fen(engine.to_fen())
+            assert snapshot(engine) == snapshot(reference), engine.to_fen()
+        for move, captured in reversed(played):
+            engine.undo_move(move, captured)
+        assert snapshot(engine) == start
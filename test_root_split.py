@@ -0,0 +1,61 @@
+"""根节点并行 (root_split) 和串行搜索的一致性测试：python -m pytest test_root_split.py"""
+import pytest
+
+import ai
+
+DEPTH = 5 # 比较的固定深度 (ROOT_SPLIT_MIN_DEPTH 起才真正分任务)
+WORKERS = (2, 3)
+FENS = [fen for fen, _ in ai.PERFT_SUITE]
+
+def fresh(engine, fen):
+    """每个局面从同样的状态开始：空置换表、空历史表和杀手表"""
+    engine.load_fen(fen)
+    engine.clear_tt()
+    engine.history_table = [0] * ai.MOVE_SPACE
+    engine.killer_moves = [[None, None] for _ in range(64)]
+
+def warm(engine, fen):
+    """串行 minimax 迭代加深到 DEPTH - 1，两边的置换表 / 历史表 / 杀手表都是同一个状态"""
+    fresh(engine, fen)
+    engine.smp_iterate(float('inf'), engine.turn == 'red', DEPTH - 1)
+
+def fixed_depth(engine, fen):
+    """预热后在深度 DEPTH 用 root_split 搜一次，返回 (分数, 走法)"""
+    warm(engine, fen)
+    return engine.root_split(DEPTH, -ai.SCORE_INF, ai.SCORE_INF, engine.turn == 'red')
+
+def window(engine, fen, alpha, beta):
+    """预热后固定深度、指定窗口搜一次 (渴望窗口那样的窄窗口会在根节点剪枝)"""
+    warm(engine, fen)
+    return engine.root_split(DEPTH, alpha, beta, engine.turn == 'red')
+
+@pytest.fixture(scope="module")
+def serial():
+    engine = ai.XiangqiCLI(start_pikafish=False)
+    yield engine
+    engine.close()
+
+@pytest.fixture(scope="module", params=WORKERS)
+def pooled(request):
+    engine = ai.XiangqiCLI(start_pikafish=False)
+    engine.set_root_split(request.param)
+    yield engine
+    engine.close()
+
+@pytest.mark.parametrize("fen", FENS)
+def test_fixed_depth_matches_serial(serial, pooled, fen):
+    assert fixed_depth(pooled, fen) == fixed_depth(serial, fen)
+
+@pytest.mark.parametrize("fen", FENS)
+def test_shallow_depth_is_plain_minimax(serial, pooled, fen):
+    depth = ai.ROOT_SPLIT_MIN_DEPTH - 1
+    fresh(serial, fen)
+    expected = serial.minimax(depth, -ai.SCORE_INF, ai.SCORE_INF, serial.turn == 'red')
+    fresh(pooled, fen)
+    assert pooled.root_split(depth, -ai.SCORE_INF, ai.SCORE_INF, pooled.turn == 'red') == expected
+
+@pytest.mark.parametrize("fen", FENS)
+def test_narrow_window_matches_serial(serial, pooled, fen):
+    val, _ = fixed_depth(serial, fen)
+    for alpha, beta in ((val - 20, val + 20), (val + 1, val + 60), (val - 60, val - 1)):
+        assert window(pooled, fen, alpha, beta) == window(serial, fen, alpha, beta)
@@ -0,0 +1,177 @@
+import json
+import os
+import numpy as np
+
+from ai import encode_fens, NNUE_FEATURES, NNUE_FILE, TYPE_MASK, BLACK, COLOR_MASK, ROWS, COLS
+
+# --- 配置 ---
+DATA_FILE = "dataset_tree_score.txt" # genefen.py 生成：红方视角分数 \t 棋盘 走子方
+OUTPUT_FILE = NNUE_FILE              # ai.py 里 USE_NNUE=1 或 nnue <文件> 命令加载
+
+# 网络结构：1260 (14 种棋子 * 90 格) -> 32 -> 8 -> 1，中间用截断 ReLU (clamp 到 [0, 1])
+HIDDEN1 = 32
+HIDDEN2 = 8
+SCALE = 400      # 网络输出 * SCALE = 分数；训练时比较 sigmoid(输出) 和 sigmoid(分数 / SCALE)
+QA = 127         # 第一层 / 激活值的量化倍数
+QB = 64          # 后两层权重的量化倍数
+MAX_PIECES = 32  # 每个局面最多 32 个棋子 (特征下标不足的补 NNUE_FEATURES 这个空特征)
+
+EPOCHS = 30
+BATCH_SIZE = 256
+LEARNING_RATE = 1e-3
+VALID_RATIO = 0.1
+MIRROR = True    # 左右镜像增广 (分数不变)
+
+# 棋子编码 -> 特征里的棋子序号 (红 0~6，黑 7~13)，空格 -1
+PIECE_FEATURE = np.full(COLOR_MASK, -1, dtype=np.int64)
+for _p in range(COLOR_MASK):
+    if _p & TYPE_MASK and _p & COLOR_MASK:
+        PIECE_FEATURE[_p] = (_p & TYPE_MASK) - 1 + (7 if _p & BLACK else 0)
+
+def load_data():
+    """读 DATA_FILE，过滤杀棋分数并去重，返回 (FEN 列表, 分数数组)"""
+    fens, scores = [], []
+    seen = set()
+    with open(DATA_FILE, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split('\t')
+            if len(parts) < 2: continue
+            try:
+                score = float(parts[0])
+            except ValueError:
+                continue
+            if abs(score) > 2000: # 过滤极端分数，和 train.py 一样
+                continue
+            board_str = parts[1].split()[0]
+            if board_str in seen: continue
+            seen.add(board_str)
+            fens.append(board_str)
+            scores.append(score)
+            if MIRROR:
+                mirror = "/".join(row[::-1] for row in board_str.split("/"))
+                if mirror not in seen:
+                    seen.add(mirror)
+                    fens.append(mirror)
+                    scores.append(score)
+    return fens, np.array(scores, dtype=np.float64)
+
+def fens_to_features(fens):
+    """FEN -> (N, MAX_PIECES) 特征下标，与 ai.NNUE_FEATURE 的编号一致"""
+    codes = encode_fens(fens).astype(np.int64)
+    pidx = PIECE_FEATURE[codes]
+    feat = np.where(pidx >= 0, pidx * (ROWS * COLS) + np.arange(ROWS * COLS), NNUE_FEATURES)
+    feat.sort(axis=1) # 空特征下标最大，排到最后再截掉
+    return feat[:, :MAX_PIECES]
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def init_params(rng):
+    return {
+        "w1": rng.normal(0, 0.1, (NNUE_FEATURES + 1, HIDDEN1)), # 最后一行是空特征，始终为 0
+        "b1": np.full(HIDDEN1, 0.5),
+        "w2": rng.normal(0, 1.0 / np.sqrt(HIDDEN1), (HIDDEN1, HIDDEN2)),
+        "b2": np.zeros(HIDDEN2),
+        "w3": rng.normal(0, 1.0 / np.sqrt(HIDDEN2), HIDDEN2),
+        "b3": np.zeros(1),
+    }
+
+def forward(params, feat):
+    acc = params["w1"][feat].sum(axis=1) + params["b1"]
+    h1 = np.clip(acc, 0.0, 1.0)
+    z2 = h1 @ params["w2"] + params["b2"]
+    h2 = np.clip(z2, 0.0, 1.0)
+    out = h2 @ params["w3"] + params["b3"][0]
+    return out, (acc, h1, z2, h2)
+
+def loss_and_grads(params, feat, target):
+    """MSE(sigmoid(out), sigmoid(score / SCALE)) 及手写反向传播"""
+    n = len(target)
+    out, (acc, h1, z2, h2) = forward(params, feat)
+    p = sigmoid(out)
+    diff = p - target
+    loss = float(np.mean(diff * diff))
+    d_out = 2.0 * diff * p * (1.0 - p) / n
+    grads = {"w3": h2.T @ d_out, "b3": np.array([d_out.sum()])}
+    d_z2 = np.outer(d_out, params["w3"]) * ((z2 > 0) & (z2 < 1))
+    grads["w2"] = h1.T @ d_z2
+    grads["b2"] = d_z2.sum(axis=0)
+    d_acc = (d_z2 @ params["w2"].T) * ((acc > 0) & (acc < 1))
+    grads["b1"] = d_acc.sum(axis=0)
+    g1 = np.zeros_like(params["w1"])
+    np.add.at(g1, feat, d_acc[:, None, :])
+    g1[NNUE_FEATURES] = 0
+    grads["w1"] = g1
+    return loss, grads
+
+def eval_loss(params, feat, target):
+    out, _ = forward(params, feat)
+    diff = sigmoid(out) - target
+    return float(np.mean(diff * diff))
+
+def quantize(params):
+    """量化成整数，格式见 ai.NNUEEvaluator"""
+    r = lambda a: np.round(a).astype(np.int64).tolist()
+    return {
+        "qa": QA, "qb": QB, "scale": SCALE,
+        "w1": r(params["w1"][:NNUE_FEATURES] * QA),
+        "b1": r(params["b1"] * QA),
+        "w2": r(params["w2"].T * QB), # 按 hidden2 行存，推理时每行和 h1 点乘
+        "b2": r(params["b2"] * QA * QB),
+        "w3": r(params["w3"] * QB),
+        "b3": int(round(params["b3"][0] * QA * QB)),
+    }
+
+def main():
+    if not os.path.exists(DATA_FILE):
+        print(f"找不到数据文件: {DATA_FILE}")
+        return
+    fens, scores = load_data()
+    print(f"加载完成，有效样本数 (含镜像): {len(fens)}")
+    if len(fens) < 10:
+        print("样本太少，先用 genefen.py 多生成一些数据")
+        return
+
+    feat = fens_to_features(fens)
+    target = sigmoid(scores / SCALE)
+    rng = np.random.default_rng(12345)
+    order = rng.permutation(len(fens))
+    n_valid = max(1, int(len(fens) * VALID_RATIO))
+    valid_idx, train_idx = order[:n_valid], order[n_valid:]
+
+    params = init_params(rng)
+    params["w1"][NNUE_FEATURES] = 0
+    m = {k: np.zeros_like(v) for k, v in params.items()}
+    v = {k: np.zeros_like(val) for k, val in params.items()}
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    step = 0
+    print(f"开始训练: {len(train_idx)} 训练 / {n_valid} 验证, {EPOCHS} 轮")
+    for epoch in range(EPOCHS):
+        rng.shuffle(train_idx)
+        total = 0.0
+        for i in range(0, len(train_idx), BATCH_SIZE):
+            batch = train_idx[i:i + BATCH_SIZE]
+            loss, grads = loss_and_grads(params, feat[batch], target[batch])
+            total += loss * len(batch)
+            step += 1
+            # Adam
+            for k in params:
+                m[k] = beta1 * m[k] + (1 - beta1) * grads[k]
+                v[k] = beta2 * v[k] + (1 - beta2) * grads[k] ** 2
+                m_hat = m[k] / (1 - beta1 ** step)
+                v_hat = v[k] / (1 - beta2 ** step)
+                params[k] -= LEARNING_RATE * m_hat / (np.sqrt(v_hat) + eps)
+        valid = eval_loss(params, feat[valid_idx], target[valid_idx])
+        print(f"第 {epoch + 1} 轮: 训练损失 {total / len(train_idx):.6f}, 验证损失 {valid:.6f}")
+
+    out, _ = forward(params, feat[valid_idx])
+    mae = float(np.mean(np.abs(out * SCALE - scores[valid_idx])))
+    print(f"验证集平均误差: {mae:.1f} 分")
+
+    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+        json.dump(quantize(params), f)
+    print(f"文件已生成: {OUTPUT_FILE}")
+    print("提示：ai.py 里设 USE_NNUE=1，或者运行时输入 nnue " + OUTPUT_FILE)
+
+if __name__ == "__main__":
+    main()